@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+This script compares the stdlib `json` module with the JSON codec used by Oshepherd (orjson, when installed)
+on the payloads of its hot paths: stream chunks published per token, task requests, registry data and
+embeddings results.
+"""
+
+import json
+import random
+import timeit
+from oshepherd.common import json_codec
+
+ROUNDS = 5
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=str).encode("utf-8")
+
+
+def stdlib_loads(data):
+    return json.loads(data)
+
+
+def build_payloads():
+    chunk = {
+        "model": "mistral:latest",
+        "created_at": "2024-06-04T14:38:31.837530Z",
+        "response": " token",
+        "done": False,
+        "done_reason": None,
+        "context": None,
+    }
+    request = {
+        "type": "chat",
+        "payload": {
+            "model": "mistral:latest",
+            "messages": [{"role": "user", "content": "Why is the sky blue? " * 20}],
+            "stream": True,
+            "options": {"temperature": 0.7, "num_ctx": 4096},
+        },
+        "stream_transport": "pubsub",
+    }
+    tags = {
+        "models": [
+            {
+                "name": f"model-{i}:latest",
+                "model": f"model-{i}:latest",
+                "modified_at": "2024-06-04T14:38:31.837530-07:00",
+                "size": 4109865159,
+                "digest": f"{i:064x}",
+                "details": {
+                    "format": "gguf",
+                    "family": "llama",
+                    "families": ["llama"],
+                    "parameter_size": "7B",
+                    "quantization_level": "Q4_0",
+                },
+            }
+            for i in range(50)
+        ]
+    }
+    embeddings = {
+        "model": "nomic-embed-text",
+        "embeddings": [[random.uniform(-1, 1) for _ in range(768)] for _ in range(32)],
+    }
+    return {
+        "stream chunk": (chunk, 20000),
+        "task request": (request, 5000),
+        "tags registry": (tags, 500),
+        "embed result": (embeddings, 20),
+    }
+
+
+def bench(fn, arg, number):
+    return min(timeit.repeat(lambda: fn(arg), number=number, repeat=ROUNDS)) / number
+
+
+def main():
+    print(f"codec backend: {json_codec.OSHEPHERD_JSON_BACKEND}\n")
+    print(
+        f"{'payload':<16}{'op':<8}{'stdlib (us)':>14}{'codec (us)':>14}{'speedup':>10}"
+    )
+    for name, (payload, number) in build_payloads().items():
+        encoded = stdlib_dumps(payload)
+        for op, stdlib_fn, codec_fn, arg in (
+            ("dumps", stdlib_dumps, json_codec.dumps, payload),
+            ("loads", stdlib_loads, json_codec.loads, encoded),
+        ):
+            stdlib_time = bench(stdlib_fn, arg, number) * 1e6
+            codec_time = bench(codec_fn, arg, number) * 1e6
+            print(
+                f"{name:<16}{op:<8}{stdlib_time:>14.2f}{codec_time:>14.2f}"
+                f"{stdlib_time / codec_time:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
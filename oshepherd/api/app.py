@@ -1,38 +1,101 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from oshepherd.api.config import ApiConfig
 from oshepherd.worker.app import create_celery_app_for_fastapi
 from oshepherd.api.network_data import NetworkData
+from oshepherd.api.scheduler import Scheduler
+from oshepherd.api.task_waiter import TaskWaiter
+from oshepherd.api.embedding_cache import EmbeddingCache
+from oshepherd.api.embed_batcher import EmbedBatcher
+from oshepherd.api.response_cache import ResponseCache
+from oshepherd.api.stream_dispatcher import StreamDispatcher
+from oshepherd.api.single_flight import SingleFlight
+from oshepherd.api.blob_store import BlobStore
 from oshepherd.api.health import load_health_routes
+from oshepherd.api.metrics import load_metrics_routes
 from oshepherd.api.version.routes import load_version_routes
 from oshepherd.api.generate.routes import load_generate_routes
 from oshepherd.api.embeddings.routes import load_embeddings_routes
+from oshepherd.api.embed.routes import load_embed_routes
 from oshepherd.api.chat.routes import load_chat_routes
 from oshepherd.api.tags.routes import load_tags_routes
 from oshepherd.api.show.routes import load_show_routes
 from oshepherd.api.ps.routes import load_ps_routes
+from oshepherd.api.stream.routes import load_stream_routes
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await app.task_waiter.start()
+    await app.stream_dispatcher.start()
+    await app.scheduler.start()
+    yield
+    await app.scheduler.stop()
+    await app.task_waiter.stop()
+    await app.stream_dispatcher.stop()
+    await app.embedding_cache.close()
+    await app.response_cache.close()
+    await app.blob_store.close()
+
+
 def setup_api_app(config: ApiConfig) -> FastAPI:
-    app = FastAPI()
+    app = FastAPI(lifespan=lifespan)
+    app.config = config
 
     celery_app = create_celery_app_for_fastapi(config)
     logger.info("celery app ready")
     app.celery_app = celery_app
 
     network_data = NetworkData(config)
+    network_data.start_refresh()
     logger.info("network data ready")
     app.network_data = network_data
 
+    scheduler = Scheduler(config, network_data)
+    logger.info("scheduler ready")
+    app.scheduler = scheduler
+
+    task_waiter = TaskWaiter(config)
+    logger.info("task waiter ready")
+    app.task_waiter = task_waiter
+
+    embedding_cache = EmbeddingCache(config, network_data)
+    logger.info("embedding cache ready enabled=%s", embedding_cache.enabled)
+    app.embedding_cache = embedding_cache
+
+    response_cache = ResponseCache(config, network_data)
+    logger.info("response cache ready enabled=%s", response_cache.enabled)
+    app.response_cache = response_cache
+
+    blob_store = BlobStore(config)
+    logger.info("blob store ready enabled=%s", blob_store.enabled)
+    app.blob_store = blob_store
+
+    embed_batcher = EmbedBatcher(config, task_waiter, scheduler, embedding_cache)
+    logger.info("embed batcher ready")
+    app.embed_batcher = embed_batcher
+
+    stream_dispatcher = StreamDispatcher(config)
+    logger.info("stream dispatcher ready")
+    app.stream_dispatcher = stream_dispatcher
+
+    single_flight = SingleFlight(config, scheduler, stream_dispatcher)
+    logger.info("single flight ready enabled=%s", single_flight.enabled)
+    app.single_flight = single_flight
+
     load_health_routes(app)
+    load_metrics_routes(app)
     load_version_routes(app)
     load_generate_routes(app)
     load_embeddings_routes(app)
+    load_embed_routes(app)
     load_chat_routes(app)
     load_tags_routes(app)
     load_show_routes(app)
     load_ps_routes(app)
+    load_stream_routes(app)
 
     return app
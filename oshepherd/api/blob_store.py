@@ -0,0 +1,98 @@
+"""
+Blob Store
+Opt-in offloading of large request fields to Redis before queueing generate and chat tasks, see
+`oshepherd.common.blobs`. Blobs expire `BLOB_TTL` seconds after the last request carrying them.
+Requests whose blobs can't be stored, i.e.: Redis being down or busy, are sent with their fields inline.
+Blobs this process stored recently aren't uploaded again, so a repeated image costs no Redis write at all.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List
+from pydantic import BaseModel
+from oshepherd.api.config import ApiConfig
+from oshepherd.common import blobs, json_codec
+from oshepherd.common.metrics import metrics
+from oshepherd.common.redis_service import AsyncRedisService
+
+# Digests of blobs recently stored by this process, remembered for a fraction of their ttl
+OSHEPHERD_BLOB_STORED_MAX = 4096
+OSHEPHERD_BLOB_STORED_TTL_RATIO = 0.5
+OSHEPHERD_BLOB_MAX_CONNECTIONS = 10
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+
+    def __init__(self, config: ApiConfig):
+        self.enabled = config.BLOB_STORE
+        self.threshold = config.BLOB_THRESHOLD
+        self.ttl = config.BLOB_TTL
+        self.redis_service = AsyncRedisService(
+            config.CELERY_BACKEND_URL, max_connections=OSHEPHERD_BLOB_MAX_CONNECTIONS
+        )
+        # Blob digests stored by this process, along with when they must be refreshed
+        self._stored: OrderedDict[str, float] = OrderedDict()
+
+    async def close(self):
+        await self.redis_service.close()
+
+    async def offload(self, request: BaseModel) -> str:
+        """Serialize a task request, its large payload fields stored as blobs and replaced by references."""
+        if not self.enabled:
+            return request.model_dump_json()
+
+        request_data = request.model_dump(mode="json")
+        offloaded: Dict[str, bytes] = {}
+        refs: List[blobs.BlobRef] = []
+        request_data["payload"] = blobs.offload(
+            request_data["payload"], self.threshold, offloaded, refs
+        )
+        if refs:
+            try:
+                await self._store(offloaded)
+            except Exception as e:
+                # Requests still go through, carrying their large fields
+                logger.warning("failed to store request blobs, sent inline error=%s", e)
+                metrics.incr("blob_store_failures")
+                return request.model_dump_json()
+            request_data["blobs"] = refs
+            metrics.incr("blob_offloaded", len(offloaded))
+            metrics.incr(
+                "blob_offloaded_bytes", sum(len(data) for data in offloaded.values())
+            )
+            logger.debug("request fields offloaded blobs=%s", len(offloaded))
+
+        return json_codec.dumps_str(request_data)
+
+    async def _store(self, offloaded: Dict[str, bytes]):
+        now = time.monotonic()
+        digests = [digest for digest in offloaded if self._stored.get(digest, 0) <= now]
+        if not digests:
+            metrics.incr("blob_upload_skipped", len(offloaded))
+            return
+
+        # Blobs stored by any API process only get their ttl refreshed
+        keys = [f"{blobs.OSHEPHERD_BLOB_PREFIX_KEY}{digest}" for digest in digests]
+        async with self.redis_service.pipeline() as batch:
+            for key in keys:
+                batch.expire(key, self.ttl)
+        missing = [
+            (digest, key)
+            for digest, key, refreshed in zip(digests, keys, batch.results)
+            if not refreshed
+        ]
+        if missing:
+            async with self.redis_service.pipeline() as batch:
+                for digest, key in missing:
+                    batch.set(key, offloaded[digest], ex=self.ttl)
+            metrics.incr("blob_uploads", len(missing))
+        metrics.incr("blob_upload_skipped", len(offloaded) - len(missing))
+
+        refresh_at = now + self.ttl * OSHEPHERD_BLOB_STORED_TTL_RATIO
+        for digest in digests:
+            self._stored[digest] = refresh_at
+            self._stored.move_to_end(digest)
+        while len(self._stored) > OSHEPHERD_BLOB_STORED_MAX:
+            self._stored.popitem(last=False)
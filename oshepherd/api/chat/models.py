@@ -22,6 +22,7 @@ class ChatRequestPayload(BaseModel):
 class ChatRequest(BaseModel):
     type: str = "chat"
     payload: ChatRequestPayload
+    stream_transport: Optional[Literal["pubsub", "streams"]] = "pubsub"
 
 
 class ChatResponse(BaseModel):
@@ -4,14 +4,11 @@ API implementation of `POST /api/chat` endpoint, handling completion orchestrati
 Ollama endpoint reference: https://github.com/ollama/ollama/blob/main/docs/api.md#generate-a-chat-completion
 """
 
-import time
-import json
 import logging
 from fastapi import Request
-from fastapi.responses import StreamingResponse
-from oshepherd.api.utils import streamify_json
+from oshepherd.common.queues import OSHEPHERD_GENERATION_KIND
+from oshepherd.api.utils import streamify_chunks, streamify_json, streamify_task
 from oshepherd.api.chat.models import ChatRequest
-from oshepherd.common.redis_service import RedisService
 
 logger = logging.getLogger(__name__)
 
@@ -24,67 +21,81 @@ def load_chat_routes(app):
 
         request_json = await request.json()
         logger.debug("chat request payload=%s", request_json)
-        chat_request = ChatRequest(**{"payload": request_json})
-
-        # req as json string ready to be sent through broker
-        chat_request_json_str = chat_request.model_dump_json()
-        logger.debug("chat task payload=%s", chat_request_json_str)
+        chat_request = ChatRequest(
+            **{
+                "payload": request_json,
+                "stream_transport": app.config.STREAM_TRANSPORT,
+            }
+        )
 
+        # deterministic completions are served from cache, if enabled
         is_streaming = request_json.get("stream", False)
-
-        # queue request to remote ollama api server
-        task = exec_completion.delay(chat_request_json_str)
-        task_id = task.id
-        logger.info(
-            "chat request queued task_id=%s stream=%s model=%s",
-            task_id,
-            is_streaming,
-            request_json.get("model"),
+        cache_key = app.response_cache.get_key(
+            "chat", chat_request.payload.model_dump(), request.headers
         )
-
-        if is_streaming:
-            logger.info("streaming mode enabled task_id=%s", task_id)
-
-            def stream_generator():
-                redis_service = RedisService(app.celery_app.conf.broker_url)
-                stream_channel = f"oshepherd:stream:{task_id}"
-                logger.debug(
-                    "subscribing to stream channel task_id=%s channel=%s",
-                    task_id,
-                    stream_channel,
+        cached_res = await app.response_cache.get(cache_key, request.headers)
+        if cached_res is not None:
+            logger.info(
+                "chat response served from cache stream=%s model=%s",
+                is_streaming,
+                request_json.get("model"),
+            )
+            cache_headers = {"X-Oshepherd-Cache": "hit"}
+            if is_streaming:
+                return streamify_chunks(
+                    app.response_cache.replay(cached_res), cache_headers
                 )
+            return streamify_json(cached_res, headers=cache_headers)
 
-                try:
-                    for chunk in redis_service.subscribe_to_channel(stream_channel):
-                        # Each chunk is already a dict from Redis
-                        chunk_json = json.dumps(chunk) + "\n"
-                        # Send worker chunk response to client
-                        yield chunk_json.encode("utf-8")
-
-                        # Break after receiving the final chunk
-                        if chunk.get("done") is True:
-                            logger.info("stream completed task_id=%s", task_id)
-                            break
-                except Exception as e:
-                    logger.exception("error streaming response task_id=%s", task_id)
-                    error_response = {
-                        "error": f"Streaming error: {str(e)}",
-                        "done": True,
-                    }
-                    yield (json.dumps(error_response) + "\n").encode("utf-8")
+        # req as json string ready to be sent through broker, large fields stored apart if enabled
+        chat_request_json_str = await app.blob_store.offload(chat_request)
+        logger.debug("chat task payload=%s", chat_request_json_str)
 
-            return StreamingResponse(
-                stream_generator(),
-                media_type="application/x-ndjson",
-                status_code=200,
+        def submit_task(dispatcher):
+            # queue request to remote ollama api server, preferably one with the model loaded
+            queue = app.scheduler.get_queue(
+                request_json.get("model"), OSHEPHERD_GENERATION_KIND
+            )
+            task = dispatcher.submit(
+                exec_completion, chat_request_json_str, queue=queue
+            )
+            app.scheduler.track(
+                task.id,
+                queue,
+                request_json.get("model"),
+                lambda queue: dispatcher.submit(
+                    exec_completion, chat_request_json_str, task_id=task.id, queue=queue
+                ),
+            )
+            logger.info(
+                "chat request queued task_id=%s stream=%s model=%s queue=%s",
+                task.id,
+                is_streaming,
+                request_json.get("model"),
+                queue,
             )
+            return task
+
+        async def execute():
+            task = submit_task(app.task_waiter)
+            try:
+                return await app.task_waiter.wait(task)
+            finally:
+                app.scheduler.release(task.id)
+
+        # identical requests in flight share a single task
+        flight_key = app.single_flight.get_key(
+            "chat", chat_request.payload.model_dump()
+        )
+        if is_streaming:
+            task_id = app.single_flight.submit_stream(
+                flight_key, lambda: submit_task(app.stream_dispatcher).id
+            )
+            logger.info("streaming mode enabled task_id=%s", task_id)
+            return streamify_task(app, task_id, cache_key)
         else:
-            logger.info("celery mode enabled task_id=%s", task_id)
-
-            while not task.ready():
-                logger.debug("waiting for response task_id=%s", task_id)
-                time.sleep(1)
-            ollama_res = task.get(timeout=1)
+            logger.info("celery mode enabled model=%s", request_json.get("model"))
+            ollama_res = await app.single_flight.run(flight_key, execute)
 
             status = 200
             if ollama_res.get("error"):
@@ -93,9 +104,13 @@ def load_chat_routes(app):
                     "message": f"error executing completion: {ollama_res['error']['message']}",
                 }
                 status = 500
+            else:
+                await app.response_cache.set(cache_key, ollama_res)
 
             logger.info(
-                "ollama response received task_id=%s status=%s", task_id, status
+                "ollama response received model=%s status=%s",
+                request_json.get("model"),
+                status,
             )
 
             return streamify_json(ollama_res, status)
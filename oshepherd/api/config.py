@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Literal
 from multiprocessing import cpu_count
 
 
@@ -11,3 +11,35 @@ class ApiConfig(BaseModel):
     WORKERS: Optional[int] = max(1, cpu_count() - 1)
     LOGLEVEL: Optional[str] = "info"
     UVICORN_ACCESS_LOG: Optional[bool] = False
+    COMPLETION_TIMEOUT: Optional[int] = 600  # secs
+    # Workers registry snapshot served by tags, ps, show and version endpoints
+    REGISTRY_REFRESH_INTERVAL: Optional[float] = 2  # secs
+    # Older snapshots are refreshed right away
+    REGISTRY_MAX_STALENESS: Optional[float] = 10  # secs
+    # Micro-batching of `/api/embed` requests for the same model
+    EMBED_BATCH_WINDOW: Optional[float] = 0.005  # secs
+    EMBED_BATCH_MAX_INPUTS: Optional[int] = 256
+    # Larger batches are split in shards embedded in parallel across workers
+    EMBED_SHARD_SIZE: Optional[int] = 256
+    EMBED_SHARD_RETRIES: Optional[int] = 2
+    # Embeddings results packed between workers and the API, "float32" or "float16", JSON numbers if unset
+    EMBEDDINGS_ENCODING: Optional[Literal["float32", "float16"]] = None
+    # Embeddings cache in Redis, looked up before queueing tasks
+    EMBEDDING_CACHE: Optional[bool] = False
+    EMBEDDING_CACHE_TTL: Optional[int] = 86400  # secs since last access
+    EMBEDDING_CACHE_MAX_BYTES: Optional[int] = 16 * 1024 * 1024
+    # Cache of deterministic generate and chat completions (temperature 0 or fixed seed)
+    RESPONSE_CACHE: Optional[bool] = False
+    RESPONSE_CACHE_TTL: Optional[int] = 3600  # secs since last access
+    RESPONSE_CACHE_MAX_BYTES: Optional[int] = 16 * 1024 * 1024
+    # Identical concurrent embeddings, and deterministic generate and chat, requests share a single task
+    SINGLE_FLIGHT: Optional[bool] = True
+    # Request fields over the threshold are stored apart in Redis, workers must support it
+    BLOB_STORE: Optional[bool] = False
+    BLOB_THRESHOLD: Optional[int] = 32768  # bytes
+    BLOB_TTL: Optional[int] = 3600  # secs since last request carrying the blob
+    # Task messages over the threshold are compressed, results and stream messages are by workers
+    ENABLE_COMPRESSION: Optional[bool] = False
+    COMPRESSION_THRESHOLD: Optional[int] = 4096  # bytes
+    # Token streams transport, "pubsub" or "streams" (Redis Streams, lossless and resumable)
+    STREAM_TRANSPORT: Optional[Literal["pubsub", "streams"]] = "pubsub"
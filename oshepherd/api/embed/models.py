@@ -0,0 +1,25 @@
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel
+
+
+class EmbedPayload(BaseModel):
+    model: str
+    input: Union[str, List[str]]
+    truncate: Optional[bool] = None
+    options: Optional[dict] = None
+    keep_alive: Optional[str] = "5m"
+    dimensions: Optional[int] = None
+
+
+class EmbedRequest(BaseModel):
+    type: str = "embed"
+    payload: EmbedPayload
+    embeddings_encoding: Optional[Literal["float32", "float16"]] = None
+
+
+class EmbedResponse(BaseModel):
+    model: str
+    embeddings: List[List[float]]
+    total_duration: Optional[int] = None
+    load_duration: Optional[int] = None
+    prompt_eval_count: Optional[int] = None
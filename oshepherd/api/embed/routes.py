@@ -0,0 +1,54 @@
+"""
+Generate embeddings
+API implementation of `POST /api/embed` endpoint, handling batch embeddings orchestration, as replica of the same Ollama server endpoint.
+Ollama endpoint reference: https://github.com/ollama/ollama/blob/main/docs/api.md#generate-embeddings
+"""
+
+import logging
+from fastapi import Request
+from oshepherd.api.utils import (
+    get_embeddings_encoding,
+    streamify_embeddings,
+    streamify_json,
+)
+from oshepherd.api.embed.models import EmbedRequest
+
+logger = logging.getLogger(__name__)
+
+
+def load_embed_routes(app):
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        request_json = await request.json()
+        logger.debug("embed request payload=%s", request_json)
+        embed_request = EmbedRequest(**{"payload": request_json})
+        try:
+            encoding = get_embeddings_encoding(request.headers)
+        except ValueError as e:
+            return streamify_json({"error": "Bad Request", "message": str(e)}, 400)
+
+        # batched along with concurrent requests for the same model, identical ones sharing the result
+        payload = embed_request.payload
+        flight_key = app.single_flight.get_key("embed", payload.model_dump())
+        ollama_res = await app.single_flight.run(
+            flight_key, lambda: app.embed_batcher.embed(payload)
+        )
+
+        status = 200
+        if ollama_res.get("error"):
+            ollama_res = {
+                "error": "Internal Server Error",
+                "message": f"error executing completion: {ollama_res['error']['message']}",
+            }
+            status = 500
+
+        logger.info(
+            "ollama response received model=%s status=%s",
+            embed_request.payload.model,
+            status,
+        )
+
+        return streamify_embeddings(ollama_res, encoding, status)
+
+    return app
@@ -0,0 +1,308 @@
+"""
+Embed Batcher
+Micro-batching of `POST /api/embed` requests. Requests for the same model and options arriving within
+`EMBED_BATCH_WINDOW` seconds are coalesced into a single task, running one batched Ollama embed call, and its
+embeddings are split back to each request in input order. A batch is sent right away once it reaches
+`EMBED_BATCH_MAX_INPUTS` inputs.
+Larger batches, i.e.: a single request with thousands of inputs, are split in shards of `EMBED_SHARD_SIZE`
+inputs, run in parallel by every worker holding the model, and gathered back in input order. Shards failing on
+timeouts or connection errors are retried alone, up to `EMBED_SHARD_RETRIES` times; other failures, like an
+unknown model, would fail again.
+Each request gets its share of the batch token count and durations, after its share of the input characters.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional, Set, Tuple
+from oshepherd.api.config import ApiConfig
+from oshepherd.api.embed.models import EmbedPayload, EmbedRequest
+from oshepherd.api.embedding_cache import EmbeddingCache
+from oshepherd.api.scheduler import Scheduler
+from oshepherd.api.task_waiter import TaskWaiter
+from oshepherd.common.embeddings_encoding import unpack_response
+from oshepherd.common.metrics import metrics
+from oshepherd.common.queues import OSHEPHERD_EMBEDDINGS_KIND
+
+# Errors of shards worth retrying, as reported by workers or raised queueing and waiting for them
+OSHEPHERD_EMBED_RETRYABLE_ERRORS = (
+    "TimeoutError",
+    "ConnectionError",
+    "ConnectionResetError",
+    "ConnectError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "OperationalError",
+    "RecoverableConnectionError",
+)
+# Response fields accounting the whole batch, split among its requests
+OSHEPHERD_EMBED_SHARED_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+)
+logger = logging.getLogger(__name__)
+
+
+class EmbedBatch:
+
+    def __init__(self, payload: dict):
+        # Payload shared by every request in the batch, inputs apart
+        self.payload = payload
+        self.inputs: List[str] = []
+        # Offset and count of the inputs of each request, along with its result future
+        self.requests: List[Tuple[int, int, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, inputs: List[str]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.requests.append((len(self.inputs), len(inputs), future))
+        self.inputs.extend(inputs)
+        return future
+
+
+class EmbedBatcher:
+
+    def __init__(
+        self,
+        config: ApiConfig,
+        task_waiter: TaskWaiter,
+        scheduler: Scheduler,
+        embedding_cache: EmbeddingCache,
+    ):
+        self.task_waiter = task_waiter
+        self.scheduler = scheduler
+        self.embedding_cache = embedding_cache
+        self.window = config.EMBED_BATCH_WINDOW
+        self.max_inputs = config.EMBED_BATCH_MAX_INPUTS
+        self.shard_size = config.EMBED_SHARD_SIZE
+        self.shard_retries = config.EMBED_SHARD_RETRIES
+        self.embeddings_encoding = config.EMBEDDINGS_ENCODING
+        # Batch being filled, by model and options
+        self._batches: Dict[str, EmbedBatch] = {}
+        # Batches running, referenced until done so they aren't garbage collected
+        self._running: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def get_batch_key(payload: dict) -> str:
+        return json.dumps(payload, sort_keys=True, default=str)
+
+    async def embed(self, payload: EmbedPayload) -> Dict[str, Any]:
+        """
+        Embed the payload inputs along with concurrent requests for the same model and options, skipping
+        inputs found in the embedding cache.
+        Returns the Ollama embed response for this request inputs, or an error dict on failure.
+        """
+        inputs = [payload.input] if isinstance(payload.input, str) else payload.input
+        batch_payload = payload.model_dump(exclude={"input"})
+        metrics.incr("embed_requests")
+        metrics.incr("embed_inputs", len(inputs))
+        if not inputs:
+            return {"model": payload.model, "embeddings": []}
+
+        cache_keys = self.embedding_cache.get_keys("embed", batch_payload, inputs)
+        if cache_keys is None:
+            return await self._embed_batched(batch_payload, inputs)
+
+        embeddings = await self.embedding_cache.get(cache_keys)
+        missing = [
+            index for index, embedding in enumerate(embeddings) if embedding is None
+        ]
+        if not missing:
+            return {"model": payload.model, "embeddings": embeddings}
+
+        ollama_res = await self._embed_batched(
+            batch_payload, [inputs[index] for index in missing]
+        )
+        if ollama_res.get("error"):
+            return ollama_res
+
+        await self.embedding_cache.set(
+            [cache_keys[index] for index in missing], ollama_res["embeddings"]
+        )
+        for index, embedding in zip(missing, ollama_res["embeddings"]):
+            embeddings[index] = embedding
+        return {**ollama_res, "embeddings": embeddings}
+
+    async def _embed_batched(
+        self, batch_payload: dict, inputs: List[str]
+    ) -> Dict[str, Any]:
+        key = self.get_batch_key(batch_payload)
+
+        batch = self._batches.get(key)
+        if batch and len(batch.inputs) + len(inputs) > self.max_inputs:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = self._batches[key] = EmbedBatch(batch_payload)
+            batch.timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush, key
+            )
+
+        future = batch.add(inputs)
+        if len(batch.inputs) >= self.max_inputs:
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key: str):
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+
+        batch.timer.cancel()
+        running = asyncio.create_task(self._run(batch))
+        self._running.add(running)
+        running.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: EmbedBatch):
+        metrics.incr("embed_batches")
+        try:
+            await self._run_batch(batch)
+        except Exception as e:
+            # Requests of the batch must get a response whatever fails
+            logger.exception(
+                "embed batch failed model=%s error=%s", batch.payload.get("model"), e
+            )
+            error_res = {"error": {"type": e.__class__.__name__, "message": str(e)}}
+            for _, _, future in batch.requests:
+                if not future.done():
+                    future.set_result(error_res)
+
+    async def _run_batch(self, batch: EmbedBatch):
+        inputs = batch.inputs
+        shards = [
+            inputs[offset : offset + self.shard_size]
+            for offset in range(0, len(inputs), self.shard_size)
+        ]
+        # Shards are scheduled one after the other, each to the least loaded worker at the time
+        shard_results = await asyncio.gather(
+            *(self._run_shard(batch.payload, shard) for shard in shards)
+        )
+        ollama_res = self._gather(shard_results)
+
+        embeddings = ollama_res.get("embeddings")
+        if not ollama_res.get("error") and (
+            embeddings is None or len(embeddings) != len(inputs)
+        ):
+            ollama_res = {
+                "error": {
+                    "type": "ValueError",
+                    "message": f"expected {len(inputs)} embeddings, got {len(embeddings or [])}",
+                }
+            }
+
+        total_chars = sum(len(text) for text in inputs) or 1
+        for offset, count, future in batch.requests:
+            if future.done():
+                continue
+            if ollama_res.get("error"):
+                future.set_result(ollama_res)
+                continue
+
+            share = sum(len(text) for text in inputs[offset : offset + count])
+            future.set_result(
+                {
+                    **ollama_res,
+                    **self._get_share(ollama_res, share / total_chars),
+                    "embeddings": embeddings[offset : offset + count],
+                }
+            )
+
+    @staticmethod
+    def _get_share(ollama_res: Dict[str, Any], share: float) -> Dict[str, int]:
+        """Token count and durations of a batch response, for a request with the given share of its inputs."""
+        return {
+            field: round(ollama_res[field] * share)
+            for field in OSHEPHERD_EMBED_SHARED_FIELDS
+            if isinstance(ollama_res.get(field), (int, float))
+        }
+
+    async def _run_shard(self, payload: dict, inputs: List[str]) -> Dict[str, Any]:
+        """Embed a shard of a batch in its own task, retried on timeouts and connection errors."""
+        from oshepherd.worker.tasks import exec_completion
+
+        model = payload["model"]
+        for attempt in range(self.shard_retries + 1):
+            if attempt:
+                metrics.incr("embed_shard_retries")
+            metrics.incr("embed_shards")
+            try:
+                embed_request = EmbedRequest(
+                    payload=EmbedPayload(**payload, input=inputs),
+                    embeddings_encoding=self.embeddings_encoding,
+                )
+                queue = self.scheduler.get_queue(model, OSHEPHERD_EMBEDDINGS_KIND)
+                request_str = embed_request.model_dump_json(exclude_none=True)
+                task = self.task_waiter.submit(
+                    exec_completion, request_str, queue=queue
+                )
+                self.scheduler.track(
+                    task.id,
+                    queue,
+                    model,
+                    lambda queue, task_id=task.id: self.task_waiter.submit(
+                        exec_completion, request_str, task_id=task_id, queue=queue
+                    ),
+                )
+                logger.info(
+                    "embed shard queued task_id=%s model=%s inputs=%s queue=%s attempt=%s",
+                    task.id,
+                    model,
+                    len(inputs),
+                    queue,
+                    attempt,
+                )
+                try:
+                    ollama_res = await self.task_waiter.wait(task)
+                finally:
+                    self.scheduler.release(task.id)
+            except Exception as e:
+                ollama_res = {
+                    "error": {"type": e.__class__.__name__, "message": str(e)}
+                }
+
+            if not ollama_res.get("error"):
+                # Embeddings may travel packed from the worker
+                ollama_res = unpack_response(ollama_res)
+                break
+            error_type = ollama_res["error"].get("type")
+            logger.warning(
+                "embed shard failed model=%s attempt=%s error_type=%s error=%s",
+                model,
+                attempt,
+                error_type,
+                ollama_res["error"].get("message"),
+            )
+            if error_type not in OSHEPHERD_EMBED_RETRYABLE_ERRORS:
+                break
+
+        return ollama_res
+
+    @staticmethod
+    def _gather(shard_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Merge the results of the shards of a batch, in input order."""
+        for shard_res in shard_results:
+            if shard_res.get("error"):
+                return shard_res
+        if len(shard_results) == 1:
+            return shard_results[0]
+
+        # Shards ran in parallel, durations are the slowest shard ones
+        return {
+            **shard_results[0],
+            "embeddings": [
+                embedding
+                for shard_res in shard_results
+                for embedding in shard_res.get("embeddings") or []
+            ],
+            "total_duration": max(
+                shard_res.get("total_duration") or 0 for shard_res in shard_results
+            ),
+            "load_duration": max(
+                shard_res.get("load_duration") or 0 for shard_res in shard_results
+            ),
+            "prompt_eval_count": sum(
+                shard_res.get("prompt_eval_count") or 0 for shard_res in shard_results
+            ),
+        }
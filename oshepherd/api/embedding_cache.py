@@ -0,0 +1,84 @@
+"""
+Embedding Cache
+Embeddings looked up by the API before queueing any task, so repeated inputs use no worker capacity.
+Entries are keyed by a hash of the model digest, the request options and the input, so a model update never
+serves stale embeddings, and are stored as packed little-endian float32 values, 4 bytes per dimension.
+Embeddings sent by workers as float16, see `EMBEDDINGS_ENCODING`, lose precision, so they are keyed apart and
+only served to API processes receiving float16 embeddings as well.
+"""
+
+import hashlib
+import json
+import logging
+from typing import List, Optional
+from oshepherd.api.config import ApiConfig
+from oshepherd.api.network_data import NetworkData
+from oshepherd.api.redis_cache import RedisCache
+from oshepherd.common.embeddings_encoding import pack_floats, unpack_floats
+
+# Request fields other than the input changing the resulting embeddings
+OSHEPHERD_EMBEDDING_KEY_FIELDS = ("options", "truncate", "dimensions")
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+
+    def __init__(self, config: ApiConfig, network_data: NetworkData):
+        self.enabled = config.EMBEDDING_CACHE
+        # Precision of the embeddings received from workers
+        self.precision = (
+            "float16" if config.EMBEDDINGS_ENCODING == "float16" else "float32"
+        )
+        self.network_data = network_data
+        self.cache = RedisCache(
+            config.CELERY_BACKEND_URL,
+            "embedding",
+            config.EMBEDDING_CACHE_TTL,
+            config.EMBEDDING_CACHE_MAX_BYTES,
+        )
+
+    async def close(self):
+        await self.cache.close()
+
+    @staticmethod
+    def pack(embedding: List[float]) -> bytes:
+        return pack_floats(embedding, "float32")[1]
+
+    @staticmethod
+    def unpack(data: bytes) -> List[float]:
+        return unpack_floats(data, "float32")
+
+    def get_keys(
+        self, request_type: str, payload: dict, inputs: List[str]
+    ) -> Optional[List[str]]:
+        """
+        Cache keys of the given inputs, embedded as a request of the given type.
+        None when the cache is disabled, or the model isn't held by any active worker.
+        """
+        if not self.enabled:
+            return None
+
+        digest = self.network_data.get_model_digest(payload["model"])
+        if not digest:
+            return None
+
+        params = json.dumps(
+            {field: payload.get(field) for field in OSHEPHERD_EMBEDDING_KEY_FIELDS},
+            sort_keys=True,
+            default=str,
+        )
+        prefix = f"{request_type}\0{self.precision}\0{digest}\0{params}\0".encode(
+            "utf-8"
+        )
+        return [
+            hashlib.sha256(prefix + text.encode("utf-8")).hexdigest() for text in inputs
+        ]
+
+    async def get(self, keys: List[str]) -> List[Optional[List[float]]]:
+        values = await self.cache.get_many(keys)
+        return [self.unpack(value) if value is not None else None for value in values]
+
+    async def set(self, keys: List[str], embeddings: List[List[float]]):
+        await self.cache.set_many(
+            {key: self.pack(embedding) for key, embedding in zip(keys, embeddings)}
+        )
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 from pydantic import BaseModel
 
 
@@ -12,6 +12,7 @@ class EmbeddingsPayload(BaseModel):
 class EmbeddingsRequest(BaseModel):
     type: str = "embeddings"
     payload: EmbeddingsPayload
+    embeddings_encoding: Optional[Literal["float32", "float16"]] = None
 
 
 class EmbeddingsResponse(BaseModel):
@@ -4,10 +4,15 @@ API implementation of `POST /api/embeddings` endpoint, handling embeddings orche
 Ollama endpoint reference: https://github.com/ollama/ollama/blob/main/docs/api.md#generate-embeddings
 """
 
-import time
 import logging
 from fastapi import Request
-from oshepherd.api.utils import streamify_json
+from oshepherd.common.queues import OSHEPHERD_EMBEDDINGS_KIND
+from oshepherd.common.embeddings_encoding import unpack_response
+from oshepherd.api.utils import (
+    get_embeddings_encoding,
+    streamify_embeddings,
+    streamify_json,
+)
 from oshepherd.api.embeddings.models import EmbeddingsRequest
 
 logger = logging.getLogger(__name__)
@@ -21,24 +26,68 @@ def load_embeddings_routes(app):
 
         request_json = await request.json()
         logger.debug("embeddings request payload=%s", request_json)
-        embeddings_request = EmbeddingsRequest(**{"payload": request_json})
+        embeddings_request = EmbeddingsRequest(
+            **{
+                "payload": request_json,
+                "embeddings_encoding": app.config.EMBEDDINGS_ENCODING,
+            }
+        )
+        try:
+            encoding = get_embeddings_encoding(request.headers)
+        except ValueError as e:
+            return streamify_json({"error": "Bad Request", "message": str(e)}, 400)
+
+        # served from cache when this input was already embedded
+        payload = embeddings_request.payload
+        cache_keys = app.embedding_cache.get_keys(
+            "embeddings", payload.model_dump(), [payload.input]
+        )
+        if cache_keys:
+            embedding = (await app.embedding_cache.get(cache_keys))[0]
+            if embedding is not None:
+                logger.info("embeddings served from cache model=%s", payload.model)
+                return streamify_embeddings({"embedding": embedding}, encoding)
 
         # req as json string ready to be sent through broker
         embeddings_request_json_str = embeddings_request.model_dump_json()
         logger.debug("embeddings task payload=%s", embeddings_request_json_str)
 
-        # queue request to remote ollama api server
-        task = exec_completion.delay(embeddings_request_json_str)
-        task_id = task.id
-        logger.info(
-            "embeddings request queued task_id=%s model=%s",
-            task_id,
-            request_json.get("model"),
-        )
-        while not task.ready():
-            logger.debug("waiting for response task_id=%s", task_id)
-            time.sleep(1)
-        ollama_res = task.get(timeout=1)
+        async def execute():
+            # queue request to remote ollama api server, preferably one with the model loaded
+            queue = app.scheduler.get_queue(
+                request_json.get("model"), OSHEPHERD_EMBEDDINGS_KIND
+            )
+            task = app.task_waiter.submit(
+                exec_completion, embeddings_request_json_str, queue=queue
+            )
+            app.scheduler.track(
+                task.id,
+                queue,
+                request_json.get("model"),
+                lambda queue: app.task_waiter.submit(
+                    exec_completion,
+                    embeddings_request_json_str,
+                    task_id=task.id,
+                    queue=queue,
+                ),
+            )
+            logger.info(
+                "embeddings request queued task_id=%s model=%s queue=%s",
+                task.id,
+                request_json.get("model"),
+                queue,
+            )
+            try:
+                ollama_res = await app.task_waiter.wait(task)
+            finally:
+                app.scheduler.release(task.id)
+            return (
+                ollama_res if ollama_res.get("error") else unpack_response(ollama_res)
+            )
+
+        # identical requests in flight share a single task
+        flight_key = app.single_flight.get_key("embeddings", payload.model_dump())
+        ollama_res = await app.single_flight.run(flight_key, execute)
 
         status = 200
         if ollama_res.get("error"):
@@ -47,9 +96,13 @@ def load_embeddings_routes(app):
                 "message": f"error executing completion: {ollama_res['error']['message']}",
             }
             status = 500
+        elif cache_keys:
+            await app.embedding_cache.set(cache_keys, [ollama_res["embedding"]])
 
-        logger.info("ollama response received task_id=%s status=%s", task_id, status)
+        logger.info(
+            "ollama response received model=%s status=%s", payload.model, status
+        )
 
-        return streamify_json(ollama_res, status)
+        return streamify_embeddings(ollama_res, encoding, status)
 
     return app
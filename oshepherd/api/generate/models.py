@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 
 class GenerateRequestPayload(BaseModel):
@@ -19,6 +19,7 @@ class GenerateRequestPayload(BaseModel):
 class GenerateRequest(BaseModel):
     type: str = "generate"
     payload: GenerateRequestPayload
+    stream_transport: Optional[Literal["pubsub", "streams"]] = "pubsub"
 
 
 class GenerateResponse(BaseModel):
@@ -0,0 +1,14 @@
+from oshepherd.common.metrics import metrics
+
+
+def load_metrics_routes(app):
+
+    @app.get("/metrics")
+    async def get_metrics():
+        return {
+            "counters": metrics.snapshot(),
+            "scheduler": app.scheduler.get_stats(),
+            "single_flight": app.single_flight.get_stats(),
+        }
+
+    return app
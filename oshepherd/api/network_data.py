@@ -1,32 +1,202 @@
-from datetime import datetime, timedelta, timezone
-import json
+import asyncio
 import logging
+import threading
+import time
+from typing import Dict, List, Optional
 from oshepherd.api.config import ApiConfig
 from oshepherd.common.redis_service import RedisService
+from oshepherd.common.queues import OSHEPHERD_TASK_KINDS, normalize_model_name
+from oshepherd.common import json_codec
 
-OSHEPHERD_WORKERS_PATTERN = "oshepherd_worker:*"
+OSHEPHERD_WORKERS_PREFIX_KEY = "oshepherd_worker:"
+# Sorted set of worker ids scored by their last heartbeat epoch
+OSHEPHERD_WORKERS_INDEX_KEY = "oshepherd_workers"
+# Show data shared by all workers holding a model, keyed by model digest
+OSHEPHERD_MODELS_PREFIX_KEY = "oshepherd_model:"
 OSHEPHERD_IDLE_WORKER_DELTA = 60  # secs
+# Worker hash fields holding json documents, parsed once per change
+OSHEPHERD_WORKER_JSON_FIELDS = ("version", "tags", "ps")
 logger = logging.getLogger(__name__)
 
 
 class NetworkData:
+    """
+    In-process snapshot of the workers registry.
+    Live workers are looked up in the heartbeat index, then fetched with a single pipelined HGETALL.
+    A background thread refreshes it every `REGISTRY_REFRESH_INTERVAL` seconds, re-parsing only the worker fields
+    that changed, so endpoints are served from memory, never blocking the event loop on Redis. Reads of a snapshot
+    older than `REGISTRY_MAX_STALENESS` seconds wake the thread up to refresh it right away.
+    """
 
     def __init__(self, config: ApiConfig):
         self.backend_url = config.CELERY_BACKEND_URL
-        self.redis_service = RedisService(self.backend_url)
-        self.workers_pattern = OSHEPHERD_WORKERS_PATTERN
+        self.redis_service = RedisService(self.backend_url, preflight_ping=False)
+        self.workers_prefix = OSHEPHERD_WORKERS_PREFIX_KEY
+        self.workers_index = OSHEPHERD_WORKERS_INDEX_KEY
+        self.models_prefix = OSHEPHERD_MODELS_PREFIX_KEY
         self.idle_worker_delta = OSHEPHERD_IDLE_WORKER_DELTA
+        self.refresh_interval = config.REGISTRY_REFRESH_INTERVAL
+        self.max_staleness = config.REGISTRY_MAX_STALENESS
+        self._workers: Dict[str, dict] = {}
+        # Parsed show data by model digest, immutable as it is content addressed
+        self._models: Dict[str, dict] = {}
+        self._models_lock = threading.Lock()
+        self._refreshed_at: Optional[float] = None
+        self._refresh_lock = threading.Lock()
+        self._refresh_wanted = threading.Event()
 
-    def get_version(self):
-        for key in self.redis_service.scan_iter(match=self.workers_pattern):
-            data = self.redis_service.hgetall(key)
-            # Decode bytes to strings
-            decoded_data = {
-                k.decode("utf-8"): v.decode("utf-8") for k, v in data.items()
+    def refresh(self):
+        """Reload the registry snapshot from Redis."""
+        with self._refresh_lock:
+            workers = {}
+            worker_ids = self.redis_service.zrangebyscore(
+                self.workers_index, time.time() - self.idle_worker_delta, "+inf"
+            )
+            keys = [
+                f"{self.workers_prefix}{worker_id.decode('utf-8')}"
+                for worker_id in worker_ids
+            ]
+            with self.redis_service.pipeline() as batch:
+                for key in keys:
+                    batch.hgetall(key)
+
+            for key, data in zip(keys, batch.results):
+                if not data:
+                    logger.debug("worker data expired, skipped key=%s", key)
+                    continue
+                # Decode bytes to strings
+                decoded_data = {
+                    k.decode("utf-8"): v.decode("utf-8") for k, v in data.items()
+                }
+                workers[key] = self._parse_worker(decoded_data, self._workers.get(key))
+
+            self._workers = workers
+            self._refreshed_at = time.monotonic()
+
+            # Forget show data of models no longer held by any worker
+            digests = {
+                model.get("digest")
+                for worker in workers.values()
+                for model in worker["tags"].get("models", [])
             }
+            with self._models_lock:
+                self._models = {
+                    digest: model_info
+                    for digest, model_info in self._models.items()
+                    if digest in digests
+                }
+            logger.debug("registry refreshed workers=%s", len(workers))
+
+    def _parse_worker(self, decoded_data: dict, previous: Optional[dict]) -> dict:
+        heartbeat_ts = decoded_data.get("heartbeat_ts")
+        worker = {
+            "worker_id": decoded_data.get("worker_id"),
+            "heartbeat_ts": float(heartbeat_ts) if heartbeat_ts else None,
+            "raw": decoded_data,
+        }
+        for field in OSHEPHERD_WORKER_JSON_FIELDS:
+            raw_value = decoded_data.get(field)
+            if previous and previous["raw"].get(field) == raw_value:
+                worker[field] = previous[field]
+                continue
+
+            try:
+                worker[field] = json_codec.loads(raw_value) if raw_value else {}
+            except json_codec.JSONDecodeError:
+                logger.warning(
+                    "worker has invalid %s data worker_id=%s",
+                    field,
+                    worker["worker_id"],
+                )
+                worker[field] = {}
+
+        worker["models"] = {
+            name
+            for model in worker["tags"].get("models", [])
+            for name in (model.get("model"), model.get("name"))
+            if name
+        }
+        # Models loaded in memory
+        worker["running"] = {
+            name
+            for model in worker["ps"].get("models", [])
+            for name in (model.get("model"), model.get("name"))
+            if name
+        }
+        # Task slots of each kind, as advertised by the worker when tasks start and finish
+        worker["slots"] = {
+            kind: self._parse_slots(decoded_data, kind) for kind in OSHEPHERD_TASK_KINDS
+        }
+        return worker
+
+    @staticmethod
+    def _parse_slots(decoded_data: dict, kind: str) -> dict:
+        try:
+            concurrency = max(int(decoded_data.get(f"{kind}_concurrency") or 0), 0)
+            in_flight = max(int(decoded_data.get(f"{kind}_in_flight") or 0), 0)
+            free_slots = decoded_data.get(f"{kind}_free_slots")
+            free_slots = (
+                int(free_slots) if free_slots is not None else concurrency - in_flight
+            )
+        except ValueError:
+            concurrency, in_flight, free_slots = 0, 0, 0
+        return {
+            "concurrency": concurrency,
+            "in_flight": in_flight,
+            "free_slots": min(max(free_slots, 0), concurrency),
+        }
+
+    def start_refresh(self):
+        logger.info(
+            "registry refresh setup starting interval=%s", self.refresh_interval
+        )
+
+        def refresh():
+            try:
+                self.refresh()
+                return True
+            except Exception as e:
+                logger.exception("registry refresh failed error=%s", e)
+                return False
+
+        def run_periodically():
+            while True:
+                self._refresh_wanted.wait(self.refresh_interval)
+                self._refresh_wanted.clear()
+                if not refresh():
+                    # Back off, rather than retrying on every read of the stale snapshot
+                    time.sleep(self.refresh_interval)
+
+        # First snapshot loaded before serving requests
+        refresh()
+        thread = threading.Thread(target=run_periodically)
+        thread.daemon = True
+        thread.start()
+
+        logger.info("registry refresh setup finished")
 
-            worker_id = decoded_data.get("worker_id")
-            heartbeat = decoded_data.get("heartbeat")
+    def get_refreshed_at(self) -> Optional[float]:
+        """Monotonic time of the last registry snapshot refresh."""
+        return self._refreshed_at
+
+    def get_registry_age(self) -> Optional[float]:
+        """Seconds since the registry snapshot was last refreshed."""
+        if self._refreshed_at is None:
+            return None
+        return time.monotonic() - self._refreshed_at
+
+    def get_active_workers(self) -> List[dict]:
+        age = self.get_registry_age()
+        if (
+            age is None or age > self.max_staleness
+        ) and not self._refresh_wanted.is_set():
+            logger.warning("registry snapshot is stale, refreshing age=%s", age)
+            self._refresh_wanted.set()
+
+        active_workers = []
+        for worker in self._workers.values():
+            worker_id = worker["worker_id"]
+            heartbeat = worker["heartbeat_ts"]
             if not heartbeat:
                 logger.debug("worker has no heartbeat, skipped worker_id=%s", worker_id)
                 continue
@@ -35,9 +205,15 @@ class NetworkData:
                 logger.debug("worker is idle, skipped worker_id=%s", worker_id)
                 continue
 
-            version = decoded_data.get("version")
+            active_workers.append(worker)
+
+        return active_workers
+
+    def get_version(self):
+        for worker in self.get_active_workers():
+            version = worker["version"]
             if version:
-                return json.loads(version)
+                return version
 
         return {}
 
@@ -45,25 +221,8 @@ class NetworkData:
         tags_dict = {}
         tags_res = {"models": []}
 
-        for key in self.redis_service.scan_iter(match=self.workers_pattern):
-            data = self.redis_service.hgetall(key)
-            # Decode bytes to strings
-            decoded_data = {
-                k.decode("utf-8"): v.decode("utf-8") for k, v in data.items()
-            }
-
-            worker_id = decoded_data.get("worker_id")
-            heartbeat = decoded_data.get("heartbeat")
-            if not heartbeat:
-                logger.debug("worker has no heartbeat, skipped worker_id=%s", worker_id)
-                continue
-
-            if self.is_worker_idle(heartbeat):
-                logger.debug("worker is idle, skipped worker_id=%s", worker_id)
-                continue
-
-            tags = json.loads(decoded_data.get("tags", "[]"))
-            for model in tags.get("models", []):
+        for worker in self.get_active_workers():
+            for model in worker["tags"].get("models", []):
                 model_name = model.get("name")
                 tags_dict[model_name] = model
 
@@ -74,71 +233,58 @@ class NetworkData:
         """Get list of running models from all active workers."""
 
         models_list = []
-        for key in self.redis_service.scan_iter(match=self.workers_pattern):
-            data = self.redis_service.hgetall(key)
-            # Decode bytes to strings
-            decoded_data = {
-                k.decode("utf-8"): v.decode("utf-8") for k, v in data.items()
-            }
-
-            worker_id = decoded_data.get("worker_id")
-            heartbeat = decoded_data.get("heartbeat")
-            if not heartbeat:
-                logger.debug("worker has no heartbeat, skipped worker_id=%s", worker_id)
-                continue
-
-            if self.is_worker_idle(heartbeat):
-                logger.debug("worker is idle, skipped worker_id=%s", worker_id)
-                continue
-
-            ps_data = json.loads(decoded_data.get("ps", "{}"))
+        for worker in self.get_active_workers():
+            ps_data = worker["ps"]
             if "models" in ps_data:
                 models_list.extend(ps_data["models"])
 
         return {"models": models_list}
 
-    def get_model_info(self, model_name):
-        """Get show information for a specific model from any active worker."""
+    def get_model_workers(self, model_name):
+        """Get active workers holding a model."""
+        model_name = normalize_model_name(model_name)
+        return [
+            worker
+            for worker in self.get_active_workers()
+            if model_name in worker["models"]
+        ]
 
-        for key in self.redis_service.scan_iter(match=self.workers_pattern):
-            data = self.redis_service.hgetall(key)
-            # Decode bytes to strings
-            decoded_data = {
-                k.decode("utf-8"): v.decode("utf-8") for k, v in data.items()
-            }
+    def get_model_digest(self, model_name):
+        """Get the digest of a model from any active worker holding it."""
+        model_name = normalize_model_name(model_name)
+        for worker in self.get_model_workers(model_name):
+            for model in worker["tags"].get("models", []):
+                if model_name in (model.get("model"), model.get("name")):
+                    return model.get("digest")
 
-            worker_id = decoded_data.get("worker_id")
-            heartbeat = decoded_data.get("heartbeat")
-            if not heartbeat:
-                logger.debug("worker has no heartbeat, skipped worker_id=%s", worker_id)
-                continue
+        return None
 
-            if self.is_worker_idle(heartbeat):
-                logger.debug("worker is idle, skipped worker_id=%s", worker_id)
-                continue
+    async def get_model_info(self, model_name):
+        """Get show information for a specific model, shared by all workers holding it."""
 
-            show_data_raw = decoded_data.get("show")
-            if show_data_raw:
+        digest = self.get_model_digest(model_name)
+        model_info = self._models.get(digest) if digest else None
+        if digest and model_info is None:
+            # Fetched off the event loop, the Redis client being sync
+            model_data_raw = await asyncio.to_thread(
+                self.redis_service.get, f"{self.models_prefix}{digest}"
+            )
+            if model_data_raw:
                 try:
-                    show_map = json.loads(show_data_raw)
-                    if model_name in show_map:
-                        model_info = show_map[model_name]
-                        if not model_info.get("error"):
-                            # Wrap model_info in the format expected by ollama.Client
-                            return {"model_info": model_info}
-                except json.JSONDecodeError:
-                    logger.warning(
-                        "worker has invalid show data, skipped worker_id=%s",
-                        worker_id,
-                    )
-                    continue
+                    model_info = json_codec.loads(model_data_raw)
+                    with self._models_lock:
+                        self._models[digest] = model_info
+                except json_codec.JSONDecodeError:
+                    logger.warning("invalid model data, skipped digest=%s", digest)
+
+        if model_info:
+            # Wrap model_info in the format expected by ollama.Client
+            return {"model_info": model_info}
 
         return {
             "error": "Model not found",
             "message": f"Model '{model_name}' not found on any active worker",
         }
 
-    def is_worker_idle(self, heartbeat):
-        heartbeat_time = datetime.fromisoformat(heartbeat)
-        current_time = datetime.now(timezone.utc)
-        return current_time - heartbeat_time > timedelta(seconds=self.idle_worker_delta)
+    def is_worker_idle(self, heartbeat_ts):
+        return time.time() - heartbeat_ts > self.idle_worker_delta
@@ -0,0 +1,151 @@
+"""
+Redis Cache
+Bounded cache of binary values in Redis, shared by every API process.
+    1. Entries are stored under `oshepherd_cache:{name}:{key}`, expiring `ttl` seconds after their last access.
+    2. Entries are indexed by last access time, evicting the least recently used ones once the cache holds more
+       than `max_bytes`. Eviction is done by the API, regardless of the Redis server `maxmemory-policy`.
+Lookups and stores failing, i.e.: Redis down, or no pooled connection freeing up in time under load, are
+skipped, and counted apart from misses, as `{name}_cache_errors` and `{name}_cache_pool_exhausted`.
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Union
+from oshepherd.common.metrics import metrics
+from oshepherd.common.redis_service import AsyncRedisService, RedisPoolExhaustedError
+
+OSHEPHERD_CACHE_PREFIX_KEY = "oshepherd_cache:"
+# Entries evicted per round-trip once the cache is over its memory cap
+OSHEPHERD_CACHE_EVICT_BATCH = 64
+OSHEPHERD_CACHE_MAX_CONNECTIONS = 10
+logger = logging.getLogger(__name__)
+
+
+class RedisCache:
+
+    def __init__(self, backend_url: str, name: str, ttl: int, max_bytes: int):
+        self.redis_service = AsyncRedisService(
+            backend_url, max_connections=OSHEPHERD_CACHE_MAX_CONNECTIONS
+        )
+        self.name = name
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries_prefix = f"{OSHEPHERD_CACHE_PREFIX_KEY}{name}:"
+        # Last access time and size of each entry, along with the size of them all
+        self.index_key = f"{OSHEPHERD_CACHE_PREFIX_KEY}{name}_index"
+        self.sizes_key = f"{OSHEPHERD_CACHE_PREFIX_KEY}{name}_sizes"
+        self.bytes_key = f"{OSHEPHERD_CACHE_PREFIX_KEY}{name}_bytes"
+
+    async def close(self):
+        await self.redis_service.close()
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Get the values of the given keys, None for missing ones. Hits are marked as recently used."""
+        if not keys:
+            return []
+
+        try:
+            async with self.redis_service.pipeline() as batch:
+                batch.mget([f"{self.entries_prefix}{key}" for key in keys])
+            values = batch.results[0]
+
+            hits = [key for key, value in zip(keys, values) if value is not None]
+            if hits:
+                now = time.time()
+                async with self.redis_service.pipeline() as batch:
+                    batch.zadd(self.index_key, {key: now for key in hits})
+                    for key in hits:
+                        batch.expire(f"{self.entries_prefix}{key}", self.ttl)
+        except Exception as e:
+            # Served as a miss, though not counted as one
+            self._count_failure("lookup", e)
+            return [None] * len(keys)
+
+        metrics.incr(f"{self.name}_cache_hits", len(hits))
+        metrics.incr(f"{self.name}_cache_misses", len(keys) - len(hits))
+        return values
+
+    async def set_many(self, items: Dict[str, bytes]):
+        """Store the given values, evicting least recently used entries when over the memory cap."""
+        if not items:
+            return
+
+        try:
+            now = time.time()
+            async with self.redis_service.pipeline() as batch:
+                for key, value in items.items():
+                    batch.set(f"{self.entries_prefix}{key}", value, ex=self.ttl)
+                    batch.zadd(self.index_key, {key: now})
+                    batch.hset(self.sizes_key, key, len(value))
+
+            # Entries already cached by a concurrent request keep their accounted size
+            added_bytes = sum(
+                len(value)
+                for value, added in zip(items.values(), batch.results[2::3])
+                if added
+            )
+            async with self.redis_service.pipeline() as batch:
+                batch.incrby(self.bytes_key, added_bytes)
+                batch.zrangebyscore(self.index_key, "-inf", now - self.ttl)
+            total_bytes, expired = batch.results
+
+            if expired:
+                total_bytes = await self._remove(expired)
+            while total_bytes > self.max_bytes:
+                oldest = await self._get_oldest(total_bytes - self.max_bytes)
+                if not oldest:
+                    break
+                total_bytes = await self._remove(oldest)
+                metrics.incr(f"{self.name}_cache_evictions", len(oldest))
+        except Exception as e:
+            self._count_failure("store", e)
+
+    def _count_failure(self, operation: str, error: Exception):
+        if isinstance(error, RedisPoolExhaustedError):
+            metrics.incr(f"{self.name}_cache_pool_exhausted")
+            logger.warning(
+                "cache %s skipped, no Redis connection available cache=%s",
+                operation,
+                self.name,
+            )
+            return
+
+        metrics.incr(f"{self.name}_cache_errors")
+        logger.warning("cache %s failed cache=%s error=%s", operation, self.name, error)
+
+    async def _get_oldest(self, min_bytes: int) -> List[str]:
+        """Least recently used entries, as many as needed to free `min_bytes`, up to a batch of them."""
+        async with self.redis_service.pipeline() as batch:
+            batch.zrange(self.index_key, 0, OSHEPHERD_CACHE_EVICT_BATCH - 1)
+        keys = [key.decode("utf-8") for key in batch.results[0]]
+        if not keys:
+            return []
+
+        async with self.redis_service.pipeline() as batch:
+            batch.hmget(self.sizes_key, keys)
+        oldest, freed_bytes = [], 0
+        for key, size in zip(keys, batch.results[0]):
+            oldest.append(key)
+            freed_bytes += int(size or 0)
+            if freed_bytes >= min_bytes:
+                break
+        return oldest
+
+    async def _remove(self, keys: List[Union[str, bytes]]) -> int:
+        """Remove the given entries, returning the size of the remaining ones."""
+        keys = [key.decode("utf-8") if isinstance(key, bytes) else key for key in keys]
+        async with self.redis_service.pipeline() as batch:
+            batch.hmget(self.sizes_key, keys)
+        removed_bytes = sum(int(size) for size in batch.results[0] if size is not None)
+        async with self.redis_service.pipeline() as batch:
+            batch.delete(*[f"{self.entries_prefix}{key}" for key in keys])
+            batch.zrem(self.index_key, *keys)
+            batch.hdel(self.sizes_key, *keys)
+            batch.decrby(self.bytes_key, removed_bytes)
+        logger.debug(
+            "cache entries removed cache=%s entries=%s bytes=%s",
+            self.name,
+            len(keys),
+            removed_bytes,
+        )
+        return batch.results[-1]
@@ -0,0 +1,129 @@
+"""
+Response Cache
+Opt-in cache of deterministic generate and chat completions, those with `temperature: 0` or a fixed `seed`
+option, served by the API without queueing any task.
+Entries are keyed by a hash of the request type, the model digest and the validated request payload, streaming
+and keep alive apart. A completion cached from a streaming request can be served to a non streaming one, and the
+other way around, replayed as a synthesized chunk stream.
+Requests with `Cache-Control: no-cache` skip the lookup but refresh the entry, `no-store` skip the cache at all.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Mapping, Optional
+from oshepherd.api.config import ApiConfig
+from oshepherd.api.network_data import NetworkData
+from oshepherd.api.redis_cache import RedisCache
+from oshepherd.common import json_codec
+
+# Payload fields not changing the completion
+OSHEPHERD_RESPONSE_KEY_EXCLUDED_FIELDS = ("stream", "keep_alive")
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+
+    def __init__(self, config: ApiConfig, network_data: NetworkData):
+        self.enabled = config.RESPONSE_CACHE
+        self.network_data = network_data
+        self.cache = RedisCache(
+            config.CELERY_BACKEND_URL,
+            "response",
+            config.RESPONSE_CACHE_TTL,
+            config.RESPONSE_CACHE_MAX_BYTES,
+        )
+
+    async def close(self):
+        await self.cache.close()
+
+    @staticmethod
+    def is_deterministic(payload: dict) -> bool:
+        options = payload.get("options") or {}
+        return options.get("temperature") == 0 or options.get("seed") is not None
+
+    @staticmethod
+    def get_cache_control(headers: Mapping[str, str]) -> List[str]:
+        cache_control = headers.get("cache-control") or ""
+        return [directive.strip().lower() for directive in cache_control.split(",")]
+
+    def get_key(
+        self, request_type: str, payload: dict, headers: Mapping[str, str]
+    ) -> Optional[str]:
+        """
+        Cache key of a request, None when the cache is disabled or skipped, the completion isn't deterministic,
+        or the model isn't held by any active worker.
+        """
+        if not self.enabled or "no-store" in self.get_cache_control(headers):
+            return None
+        if not self.is_deterministic(payload):
+            return None
+
+        digest = self.network_data.get_model_digest(payload["model"])
+        if not digest:
+            return None
+
+        canonical_payload = json.dumps(
+            {
+                field: value
+                for field, value in payload.items()
+                if field not in OSHEPHERD_RESPONSE_KEY_EXCLUDED_FIELDS
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(
+            f"{request_type}\0{digest}\0{canonical_payload}".encode("utf-8")
+        ).hexdigest()
+
+    async def get(
+        self, key: Optional[str], headers: Mapping[str, str]
+    ) -> Optional[Dict[str, Any]]:
+        if not key or "no-cache" in self.get_cache_control(headers):
+            return None
+
+        value = (await self.cache.get_many([key]))[0]
+        if value is None:
+            return None
+        return json_codec.loads(value)
+
+    async def set(self, key: Optional[str], response: Dict[str, Any]):
+        if not key or response.get("error") or not response.get("done", True):
+            return
+        await self.cache.set_many({key: json_codec.dumps(response)})
+
+    @staticmethod
+    def aggregate(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Build the non streaming completion out of the chunks of a streaming one."""
+        response = dict(chunks[-1])
+        if any("response" in chunk for chunk in chunks):
+            response["response"] = "".join(
+                chunk.get("response") or "" for chunk in chunks
+            )
+        if any("message" in chunk for chunk in chunks):
+            messages = [chunk.get("message") or {} for chunk in chunks]
+            response["message"] = {
+                **(response.get("message") or {}),
+                "content": "".join(
+                    message.get("content") or "" for message in messages
+                ),
+            }
+        return response
+
+    @staticmethod
+    def replay(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Synthesize the chunks of a streaming completion out of a non streaming one."""
+        content_chunk = {
+            "model": response.get("model"),
+            "created_at": response.get("created_at"),
+            "done": False,
+        }
+        final_chunk = dict(response)
+        if "response" in response:
+            content_chunk["response"] = response["response"]
+            final_chunk["response"] = ""
+        if "message" in response:
+            content_chunk["message"] = response["message"]
+            final_chunk["message"] = {**response["message"], "content": ""}
+        return [content_chunk, final_chunk]
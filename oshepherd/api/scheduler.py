@@ -0,0 +1,250 @@
+"""
+Scheduler
+Load and warm-model aware scheduling of tasks to workers. Workers report the models loaded in memory (`ollama.ps()`),
+along with their tasks in flight and free slots, updated as tasks start and finish. A task is published to the
+direct queue of the least loaded worker already holding its model loaded, skipping the model load time. Cold
+workers are only picked when every warm one is saturated, that is, without free slots. When every worker holding
+the model is saturated, the task goes to the model queue, to be taken by the first one freeing a slot.
+Slots are accounted apart for each task kind, as each kind is taken by its own worker pool.
+Tasks scheduled to a worker leaving the registry, i.e.: dying, would stay in its direct queue for good, so the ones
+still in flight are published again, to the queue they would be scheduled to now.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from oshepherd.api.config import ApiConfig
+from oshepherd.api.network_data import NetworkData
+from oshepherd.common.metrics import metrics
+from oshepherd.common.queues import (
+    OSHEPHERD_GENERATION_KIND,
+    default_queue,
+    model_queue,
+    normalize_model_name,
+    queue_kind,
+    queue_worker_id,
+    worker_queue,
+)
+
+# How often tasks scheduled to workers gone from the registry are looked for
+OSHEPHERD_SCHEDULER_REQUEUE_INTERVAL = 10  # secs
+logger = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """
+    Worker loads come from the registry snapshot, so tasks this API process scheduled since the snapshot was
+    refreshed are added on top of them. Tasks are accounted from the moment they are queued until their response
+    is relayed, see `track` and `release`.
+    """
+
+    def __init__(self, config: ApiConfig, network_data: NetworkData):
+        self.network_data = network_data
+        # Tasks are released at the latest once their completion would have timed out
+        self.task_timeout = config.COMPLETION_TIMEOUT
+        # Worker id, task kind and queue time of each task in flight, by task id
+        self._in_flight: Dict[str, Tuple[str, str, float]] = {}
+        # Model and publishing function of each task in flight, to publish it again to another queue
+        self._requeues: Dict[str, Tuple[Optional[str], Callable[[str], Any]]] = {}
+        self._lock = threading.Lock()
+        self._requeuer: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._requeuer = asyncio.create_task(self._requeue_periodically())
+        logger.info("scheduler started")
+
+    async def stop(self):
+        if self._requeuer:
+            self._requeuer.cancel()
+            try:
+                await self._requeuer
+            except asyncio.CancelledError:
+                pass
+        logger.info("scheduler stopped")
+
+    def get_queue(
+        self, model_name: Optional[str], kind: str = OSHEPHERD_GENERATION_KIND
+    ) -> str:
+        """
+        Get the queue to publish a task of the given kind for the given model to. The default queue of the
+        kind, when no active worker taking tasks of this kind holds the model.
+        """
+        if not model_name:
+            return default_queue(kind)
+
+        workers = [
+            worker
+            for worker in self.network_data.get_model_workers(model_name)
+            if worker["slots"][kind]["concurrency"]
+        ]
+        if not workers:
+            return default_queue(kind)
+
+        model_name = normalize_model_name(model_name)
+        warm = [worker for worker in workers if model_name in worker["running"]]
+        cold = [worker for worker in workers if model_name not in worker["running"]]
+
+        with self._lock:
+            self._prune()
+            pending = self._get_pending(kind)
+            worker = self._least_loaded(warm, kind, pending)
+            if worker is None and warm:
+                metrics.incr("scheduler_warm_saturated")
+            if worker is None:
+                worker = self._least_loaded(cold, kind, pending)
+
+        if worker is None:
+            metrics.incr("scheduler_saturated")
+            logger.debug(
+                "every worker holding model is saturated model=%s kind=%s",
+                model_name,
+                kind,
+            )
+            return model_queue(model_name, kind)
+
+        metrics.incr("scheduler_scheduled")
+        # Cold starts expected when picking any worker holding the model, as the shared model queue does
+        metrics.incr("scheduler_baseline_cold", len(cold) / len(workers))
+        if worker in warm:
+            metrics.incr("scheduler_warm")
+        else:
+            metrics.incr("scheduler_cold")
+        logger.debug(
+            "task scheduled model=%s kind=%s worker_id=%s warm=%s in_flight=%s",
+            model_name,
+            kind,
+            worker["worker_id"],
+            worker in warm,
+            worker["slots"][kind]["in_flight"] + pending.get(worker["worker_id"], 0),
+        )
+        return worker_queue(worker["worker_id"], kind)
+
+    def _get_pending(self, kind: str) -> Dict[str, int]:
+        """Tasks of the given kind scheduled to each worker since the registry snapshot was refreshed."""
+        refreshed_at = self.network_data.get_refreshed_at() or 0
+        pending = {}
+        for worker_id, task_kind, queued_at in self._in_flight.values():
+            if task_kind == kind and queued_at >= refreshed_at:
+                pending[worker_id] = pending.get(worker_id, 0) + 1
+        return pending
+
+    def _least_loaded(
+        self, workers: List[dict], kind: str, pending: Dict[str, int]
+    ) -> Optional[dict]:
+        available = [
+            worker
+            for worker in workers
+            if worker["slots"][kind]["free_slots"] > pending.get(worker["worker_id"], 0)
+        ]
+        if not available:
+            return None
+
+        def load(worker):
+            slots = worker["slots"][kind]
+            in_flight = slots["in_flight"] + pending.get(worker["worker_id"], 0)
+            return in_flight / slots["concurrency"]
+
+        return min(available, key=load)
+
+    def _prune(self):
+        expired_before = time.monotonic() - self.task_timeout
+        for task_id, (_, _, queued_at) in list(self._in_flight.items()):
+            if queued_at < expired_before:
+                logger.warning("in flight task expired, released task_id=%s", task_id)
+                del self._in_flight[task_id]
+                self._requeues.pop(task_id, None)
+
+    def track(
+        self,
+        task_id: str,
+        queue: Optional[str],
+        model_name: Optional[str] = None,
+        requeue: Optional[Callable[[str], Any]] = None,
+    ):
+        """
+        Account a task queued to the given queue as in flight, when it was scheduled to a worker.
+        With `requeue`, publishing the task again to the queue it is given, the task is published again
+        when the worker leaves the registry before the task is released.
+        """
+        worker_id = queue_worker_id(queue)
+        if worker_id is None:
+            return
+
+        with self._lock:
+            self._in_flight[task_id] = (worker_id, queue_kind(queue), time.monotonic())
+            if requeue:
+                self._requeues[task_id] = (model_name, requeue)
+
+    def release(self, task_id: str):
+        """Stop accounting a task as in flight, once its response was relayed."""
+        with self._lock:
+            self._in_flight.pop(task_id, None)
+            self._requeues.pop(task_id, None)
+
+    async def _requeue_periodically(self):
+        while True:
+            await asyncio.sleep(OSHEPHERD_SCHEDULER_REQUEUE_INTERVAL)
+            try:
+                self.requeue_stranded()
+            except Exception as e:
+                logger.exception("stranded tasks requeue failed error=%s", e)
+
+    def requeue_stranded(self):
+        """Publish again the tasks in flight scheduled to workers gone from the registry."""
+        age = self.network_data.get_registry_age()
+        if age is None or age > self.network_data.max_staleness:
+            # Workers missing from an outdated snapshot may well be alive
+            return
+
+        active = {
+            worker["worker_id"] for worker in self.network_data.get_active_workers()
+        }
+        with self._lock:
+            stranded = {
+                task_id: (kind, *self._requeues.pop(task_id))
+                for task_id, (worker_id, kind, _) in self._in_flight.items()
+                if worker_id not in active and task_id in self._requeues
+            }
+            for task_id in stranded:
+                del self._in_flight[task_id]
+
+        for task_id, (kind, model_name, requeue) in stranded.items():
+            queue = self.get_queue(model_name, kind)
+            try:
+                requeue(queue)
+            except Exception as e:
+                logger.warning(
+                    "stranded task not requeued task_id=%s error=%s", task_id, e
+                )
+                continue
+
+            metrics.incr("scheduler_requeued")
+            logger.warning("stranded task requeued task_id=%s queue=%s", task_id, queue)
+            self.track(task_id, queue, model_name, requeue)
+
+    def get_stats(self) -> dict:
+        """
+        Cold start rate of tasks scheduled to a worker, along with the rate avoided compared to publishing them
+        to the model queue. Tasks left to the model queue, as every worker was saturated, are counted apart,
+        as are the ones sent to a cold worker as every warm one was saturated, and the ones published again
+        as their worker left.
+        """
+        scheduled = metrics.get("scheduler_scheduled")
+        stats = {
+            "scheduled": scheduled,
+            "saturated": metrics.get("scheduler_saturated"),
+            "warm_saturated": metrics.get("scheduler_warm_saturated"),
+            "requeued": metrics.get("scheduler_requeued"),
+            "in_flight": len(self._in_flight),
+        }
+        if scheduled:
+            cold = metrics.get("scheduler_cold")
+            baseline_cold = metrics.get("scheduler_baseline_cold")
+            stats["cold_start_rate"] = round(cold / scheduled, 4)
+            stats["baseline_cold_start_rate"] = round(baseline_cold / scheduled, 4)
+            stats["avoided_cold_start_rate"] = round(
+                (baseline_cold - cold) / scheduled, 4
+            )
+        return stats
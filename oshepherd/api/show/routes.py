@@ -6,7 +6,7 @@ Ollama endpoint reference: https://github.com/ollama/ollama/blob/main/docs/api.m
 
 import logging
 from fastapi import Request
-from oshepherd.api.utils import streamify_json
+from oshepherd.api.utils import streamify_json, registry_headers
 from oshepherd.api.show.models import ShowRequest
 from oshepherd.api.network_data import NetworkData
 
@@ -23,7 +23,7 @@ def load_show_routes(app):
         show_request = ShowRequest(**request_json)
         logger.info("show request received model=%s", show_request.model)
 
-        ollama_res = network_data.get_model_info(show_request.model)
+        ollama_res = await network_data.get_model_info(show_request.model)
 
         status = 200
         if ollama_res.get("error"):
@@ -33,6 +33,6 @@ def load_show_routes(app):
 
         logger.info("show response status=%s model=%s", status, show_request.model)
 
-        return streamify_json(ollama_res, status)
+        return streamify_json(ollama_res, status, registry_headers(network_data))
 
     return app
@@ -0,0 +1,225 @@
+"""
+Single Flight
+Coalescing of identical concurrent requests, so a burst of them runs a single task. Requests are identical when
+their type and validated payload are, and generate and chat ones are only coalesced when deterministic, see
+`ResponseCache.is_deterministic`, as sampled completions are expected to differ. The first one runs the task,
+while the ones arriving before it finishes attach to it and share its result:
+    1. non streaming requests await the same result.
+    2. streaming requests read the same chunk stream, from its first chunk, however late they attach.
+Tasks run apart from the request that started them, so a client disconnecting doesn't fail the others, and are
+released from the scheduler once done.
+Every stream read by an API process, coalesced or not, is buffered once, so resuming it through
+`GET /api/stream/{task_id}` reads the buffer from the requested chunk instead of the Redis Stream again.
+Requests are coalesced within an API process.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+from oshepherd.api.config import ApiConfig
+from oshepherd.api.response_cache import ResponseCache
+from oshepherd.api.scheduler import Scheduler
+from oshepherd.api.stream_dispatcher import (
+    StreamDispatcher,
+    StreamMessage,
+    error_message,
+)
+from oshepherd.common.metrics import metrics
+from oshepherd.common.stream_frames import split_lines
+
+# Secs completed shared streams stay buffered, for requests attached right before completion
+OSHEPHERD_SHARED_STREAM_RETENTION = 30
+# Request types of sampled completions, only coalesced when deterministic
+OSHEPHERD_SAMPLED_REQUEST_TYPES = ("generate", "chat")
+logger = logging.getLogger(__name__)
+
+
+class SharedStream:
+    """Messages of a streaming task, buffered for every request reading it."""
+
+    def __init__(self, task_id: str, start: int = 0):
+        self.task_id = task_id
+        # Chunks of the task before the buffered ones
+        self.start = start
+        self.messages: List[StreamMessage] = []
+        self.done = False
+        self._changed = asyncio.Event()
+        self.pump: Optional[asyncio.Task] = None
+
+    def append(self, message: StreamMessage):
+        self.messages.append(message)
+        if message.done:
+            self.done = True
+        self._notify()
+
+    def close(self):
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        # Readers wait on the current event, replaced for the next change
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def read(self, offset: int = 0) -> AsyncGenerator[StreamMessage, None]:
+        """Yield the messages of the task after its first `offset` chunks, `start` at least."""
+        skip = max(offset - self.start, 0)
+        index = 0
+        while True:
+            while index < len(self.messages):
+                message = self.messages[index]
+                index += 1
+                if skip:
+                    # Messages hold one chunk per line
+                    lines = split_lines(message.data)
+                    message = StreamMessage(b"".join(lines[skip:]), message.done)
+                    skip = max(skip - len(lines), 0)
+                    if not message.data and not message.done:
+                        continue
+                yield message
+            if self.done:
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+
+    def __init__(
+        self,
+        config: ApiConfig,
+        scheduler: Scheduler,
+        stream_dispatcher: StreamDispatcher,
+    ):
+        self.enabled = config.SINGLE_FLIGHT
+        self.completion_timeout = config.COMPLETION_TIMEOUT
+        self.scheduler = scheduler
+        self.stream_dispatcher = stream_dispatcher
+        # Task running each request, by request key
+        self._flights: Dict[str, asyncio.Task] = {}
+        # Streaming task of each request, by request key, and the chunks of every stream by task id
+        self._stream_tasks: Dict[str, str] = {}
+        self._streams: Dict[str, SharedStream] = {}
+
+    def get_key(self, request_type: str, payload: dict) -> Optional[str]:
+        """Key of a request, None when coalescing is disabled or the completion isn't deterministic."""
+        if not self.enabled:
+            return None
+        if request_type in OSHEPHERD_SAMPLED_REQUEST_TYPES and not (
+            ResponseCache.is_deterministic(payload)
+        ):
+            return None
+
+        canonical_payload = json.dumps(
+            payload, sort_keys=True, separators=(",", ":"), default=str
+        )
+        return hashlib.sha256(
+            f"{request_type}\0{canonical_payload}".encode("utf-8")
+        ).hexdigest()
+
+    async def run(
+        self, key: Optional[str], execute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Run `execute`, unless an identical request is already running it, and return its result."""
+        if key is None:
+            return await execute()
+
+        metrics.incr("single_flight_requests")
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = asyncio.create_task(execute())
+            flight.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            metrics.incr("single_flight_coalesced")
+            logger.debug("request attached to in flight task key=%s", key)
+
+        return await asyncio.shield(flight)
+
+    def submit_stream(self, key: Optional[str], submit: Callable[[], str]) -> str:
+        """
+        Get the id of the streaming task running a request, calling `submit` to queue it unless an identical
+        request already did. Chunks of the task are read with `stream`.
+        """
+        if key is not None:
+            metrics.incr("single_flight_requests")
+            task_id = self._stream_tasks.get(key)
+            if task_id is not None:
+                metrics.incr("single_flight_coalesced")
+                logger.debug(
+                    "request attached to in flight stream key=%s task_id=%s",
+                    key,
+                    task_id,
+                )
+                return task_id
+
+        task_id = submit()
+        if key is not None:
+            self._stream_tasks[key] = task_id
+        self._share(task_id, key)
+        return task_id
+
+    def resume(self, task_id: str, offset: int) -> bool:
+        """
+        Get a streaming task ready to be read with `stream` after its first `offset` chunks.
+        Streams already read by this API process are served from their buffer, False when it starts past `offset`.
+        """
+        shared_stream = self._streams.get(task_id)
+        if shared_stream is not None:
+            return offset >= shared_stream.start
+
+        self.stream_dispatcher.open(task_id, "streams", offset)
+        self._share(task_id, start=offset)
+        return True
+
+    def _share(self, task_id: str, key: Optional[str] = None, start: int = 0):
+        shared_stream = self._streams[task_id] = SharedStream(task_id, start)
+        shared_stream.pump = asyncio.create_task(self._pump(key, shared_stream))
+
+    async def _pump(self, key: Optional[str], shared_stream: SharedStream):
+        try:
+            async for message in self.stream_dispatcher.stream(
+                shared_stream.task_id, timeout=self.completion_timeout
+            ):
+                shared_stream.append(message)
+        except Exception as e:
+            logger.warning(
+                "shared stream failed task_id=%s error=%s", shared_stream.task_id, e
+            )
+            shared_stream.append(error_message(f"Streaming error: {str(e)}"))
+        finally:
+            # Requests arriving from now on start a new task
+            if key is not None:
+                self._stream_tasks.pop(key, None)
+            shared_stream.close()
+            self.scheduler.release(shared_stream.task_id)
+            asyncio.get_running_loop().call_later(
+                OSHEPHERD_SHARED_STREAM_RETENTION,
+                self._streams.pop,
+                shared_stream.task_id,
+                None,
+            )
+
+    async def stream(
+        self, task_id: str, offset: int = 0
+    ) -> AsyncGenerator[StreamMessage, None]:
+        """
+        Yield the messages of a task queued with `submit_stream` or resumed with `resume`, after its first
+        `offset` chunks, until the one with the final chunk.
+        """
+        shared_stream = self._streams.get(task_id)
+        if shared_stream is None:
+            yield error_message(f"Streaming error: stream '{task_id}' not found")
+            return
+
+        async for message in shared_stream.read(offset):
+            yield message
+
+    def get_stats(self) -> dict:
+        requests = metrics.get("single_flight_requests")
+        coalesced = metrics.get("single_flight_coalesced")
+        return {
+            "requests": requests,
+            "coalesced": coalesced,
+            "coalescing_rate": round(coalesced / requests, 4) if requests else 0,
+        }
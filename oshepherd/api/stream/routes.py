@@ -0,0 +1,51 @@
+"""
+Resume a stream
+API implementation of `GET /api/stream/{task_id}` endpoint, relaying again the chunks of a streaming generate/chat
+completion, starting after the first `offset` chunks. Requires `STREAM_TRANSPORT="streams"`.
+Oshepherd specific endpoint, no Ollama equivalent.
+"""
+
+import logging
+from fastapi import Request
+from oshepherd.api.utils import streamify_json, streamify_task
+
+logger = logging.getLogger(__name__)
+
+
+def load_stream_routes(app):
+
+    @app.get("/api/stream/{task_id}")
+    async def stream(request: Request, task_id: str, offset: int = 0):
+        logger.info("stream resume request task_id=%s offset=%s", task_id, offset)
+
+        if app.config.STREAM_TRANSPORT != "streams":
+            return streamify_json(
+                {
+                    "error": "Bad Request",
+                    "message": "resuming streams requires the streams transport",
+                },
+                400,
+            )
+
+        if not await app.stream_dispatcher.exists(task_id):
+            return streamify_json(
+                {
+                    "error": "Not Found",
+                    "message": f"stream '{task_id}' not found or expired",
+                },
+                404,
+            )
+
+        offset = max(offset, 0)
+        if not app.single_flight.resume(task_id, offset):
+            return streamify_json(
+                {
+                    "error": "Conflict",
+                    "message": f"stream '{task_id}' is being read past chunk {offset}",
+                },
+                409,
+            )
+
+        return streamify_task(app, task_id, offset=offset)
+
+    return app
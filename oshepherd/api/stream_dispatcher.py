@@ -0,0 +1,282 @@
+"""
+Stream Dispatcher
+Relays worker token streams to API clients over a constant number of Redis connections per API process.
+    1. pubsub transport: one pattern subscription to `oshepherd:stream:*` is fanned out to per-task in-memory queues.
+    2. streams transport: one blocking XREAD over every active `oshepherd:stream:{task_id}` Redis Stream,
+       fanned out the same way. Streams keep every chunk until they expire, so readers can start from any chunk.
+Workers publish framed NDJSON messages of one or more chunks, relayed to clients without decoding them.
+Queues are bounded, a reader falling `OSHEPHERD_STREAM_QUEUE_MAXSIZE` messages behind gets its stream failed, and
+queues registered but never read, i.e.: clients gone before their response started, are dropped after
+`OSHEPHERD_UNREAD_QUEUE_TTL` seconds.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, AsyncGenerator, Dict, NamedTuple, Optional, Set
+from celery.result import AsyncResult
+from oshepherd.api.config import ApiConfig
+from oshepherd.common import json_codec
+from oshepherd.common.redis_service import AsyncRedisService
+from oshepherd.common.stream_frames import decode_frame, split_lines
+
+OSHEPHERD_STREAM_CHANNEL_PREFIX = "oshepherd:stream:"
+# Max time for a newly registered Redis Stream to be picked up by the XREAD loop
+OSHEPHERD_XREAD_BLOCK = 100  # millisecs
+OSHEPHERD_STREAM_QUEUE_MAXSIZE = 1024  # messages, of one or more chunks
+OSHEPHERD_UNREAD_QUEUE_TTL = 60  # secs
+logger = logging.getLogger(__name__)
+
+
+class StreamMessage(NamedTuple):
+    # NDJSON lines of one or more chunks
+    data: bytes
+    # Whether the final chunk is among them
+    done: bool
+
+
+def error_message(message: str) -> StreamMessage:
+    """Final message of a stream failing with the given error."""
+    data = json_codec.dumps({"error": message, "done": True}) + b"\n"
+    return StreamMessage(data, True)
+
+
+class StreamDispatcher:
+
+    def __init__(self, config: ApiConfig):
+        self.backend_url = config.CELERY_BACKEND_URL
+        self.redis_service = AsyncRedisService(self.backend_url)
+        self.pattern = f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}*"
+        self.transport = config.STREAM_TRANSPORT
+        # Messages of every task being relayed, by task id
+        self._queues: Dict[str, asyncio.Queue] = {}
+        # Last read entry id of every Redis Stream being relayed, by stream name
+        self._stream_offsets: Dict[str, str] = {}
+        # Registration time of the queues not being read yet, by task id
+        self._unread: Dict[str, float] = {}
+        # Tasks with chunks relayed already
+        self._started: Set[str] = set()
+        self._streams_added = asyncio.Event()
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self._subscribe()
+        self._listener = asyncio.create_task(self._listen())
+        self._reader = asyncio.create_task(self._read_streams())
+        logger.info(
+            "stream dispatcher started pattern=%s transport=%s",
+            self.pattern,
+            self.transport,
+        )
+
+    async def stop(self):
+        for task in (self._listener, self._reader):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._pubsub:
+            await self._pubsub.aclose()
+        await self.redis_service.close()
+        logger.info("stream dispatcher stopped pattern=%s", self.pattern)
+
+    async def _subscribe(self):
+        self._pubsub = self.redis_service.pubsub()
+        await self._pubsub.psubscribe(self.pattern)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message and message["type"] == "pmessage":
+                    self._dispatch(message["channel"], message["data"])
+                self._drop_unread()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    "stream dispatcher lost connection, resubscribing error=%s", e
+                )
+                # Chunks published meanwhile are gone, end the Pub/Sub streams
+                self._fail_all(f"Streaming error: {str(e)}")
+                await asyncio.sleep(1)
+                try:
+                    await self._pubsub.aclose()
+                    await self._subscribe()
+                except Exception as resubscribe_error:
+                    logger.warning(
+                        "stream dispatcher resubscribe failed error=%s",
+                        resubscribe_error,
+                    )
+
+    async def _read_streams(self):
+        while True:
+            if not self._stream_offsets:
+                await self._streams_added.wait()
+                self._streams_added.clear()
+                continue
+
+            try:
+                res = await self.redis_service.xread(
+                    dict(self._stream_offsets), block=OSHEPHERD_XREAD_BLOCK
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Chunks stay in Redis, reading just resumes from the last offsets
+                logger.warning("stream dispatcher failed reading streams error=%s", e)
+                await asyncio.sleep(1)
+                continue
+
+            for name, entries in res or []:
+                if isinstance(name, bytes):
+                    name = name.decode("utf-8")
+                for entry_id, fields in entries:
+                    if name not in self._stream_offsets:
+                        break
+                    # Entry ids are numbered by chunk, a resumed read may start halfway a batch
+                    new_chunks = self._chunk_number(entry_id) - self._chunk_number(
+                        self._stream_offsets[name]
+                    )
+                    self._stream_offsets[name] = entry_id
+                    self._dispatch(name, fields[b"data"], new_chunks)
+
+    @staticmethod
+    def _chunk_number(entry_id: Any) -> int:
+        if isinstance(entry_id, bytes):
+            entry_id = entry_id.decode("utf-8")
+        return int(entry_id.split("-")[1])
+
+    def _dispatch(self, channel: Any, data: Any, new_chunks: Optional[int] = None):
+        """Queue a message, only its last `new_chunks` chunks if given."""
+        if isinstance(channel, bytes):
+            channel = channel.decode("utf-8")
+        task_id = channel[len(OSHEPHERD_STREAM_CHANNEL_PREFIX) :]
+        queue = self._queues.get(task_id)
+        if queue is None:
+            # Stream of a task queued by another API process, or already finished
+            return
+
+        try:
+            data, done = decode_frame(data)
+        except (json_codec.JSONDecodeError, UnicodeDecodeError, AttributeError):
+            logger.warning("failed to decode Redis message channel=%s", channel)
+            return
+
+        if new_chunks is not None:
+            lines = split_lines(data)
+            if new_chunks < len(lines):
+                data = b"".join(lines[-new_chunks:]) if new_chunks > 0 else b""
+        if not data and not done:
+            return
+        if queue.full():
+            logger.warning("stream reader fell behind task_id=%s", task_id)
+            self._fail(task_id, "Streaming error: reader fell behind")
+            return
+        self._started.add(task_id)
+        queue.put_nowait(StreamMessage(data, done))
+
+    def _fail(self, task_id: str, message: str):
+        """End the stream of a task with an error, dropping the messages not read yet."""
+        queue = self._queues.get(task_id)
+        self.close(task_id)
+        if queue is None:
+            return
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(error_message(message))
+
+    def _fail_all(self, message: str):
+        for task_id in list(self._queues):
+            if (
+                f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}{task_id}"
+                not in self._stream_offsets
+            ):
+                self._fail(task_id, message)
+
+    def _drop_unread(self):
+        expired_before = time.monotonic() - OSHEPHERD_UNREAD_QUEUE_TTL
+        for task_id, opened_at in list(self._unread.items()):
+            if opened_at < expired_before:
+                logger.warning("stream never read, dropped task_id=%s", task_id)
+                self.close(task_id)
+
+    def submit(
+        self, task, request_str: str, task_id: Optional[str] = None, **options
+    ) -> AsyncResult:
+        """
+        Queue a streaming task, registering its chunk queue before any chunk can be published.
+        Given the `task_id` of a task already queued, it is published again, unless its chunks are being relayed.
+        """
+        requeued = task_id is not None
+        if not requeued:
+            task_id = uuid.uuid4().hex
+            self.open(task_id, self.transport)
+        elif task_id not in self._queues or task_id in self._started:
+            raise RuntimeError(f"stream '{task_id}' already relayed, can't restart")
+        try:
+            return task.apply_async((request_str,), task_id=task_id, **options)
+        except Exception:
+            if not requeued:
+                self.close(task_id)
+            raise
+
+    def open(self, task_id: str, transport: str, offset: int = 0):
+        """
+        Register the chunk queue of a task.
+        For the streams transport, chunks are read after the first `offset` ones.
+        """
+        if task_id not in self._queues:
+            self._queues[task_id] = asyncio.Queue(OSHEPHERD_STREAM_QUEUE_MAXSIZE)
+            self._unread[task_id] = time.monotonic()
+        if transport == "streams":
+            name = f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}{task_id}"
+            self._stream_offsets[name] = f"0-{offset}"
+            self._streams_added.set()
+
+    def close(self, task_id: str):
+        self._queues.pop(task_id, None)
+        self._unread.pop(task_id, None)
+        self._started.discard(task_id)
+        self._stream_offsets.pop(f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}{task_id}", None)
+
+    async def exists(self, task_id: str) -> bool:
+        """Whether a task Redis Stream is still available to be read."""
+        return await self.redis_service.exists(
+            f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}{task_id}"
+        )
+
+    async def stream(
+        self, task_id: str, timeout: Optional[float] = None
+    ) -> AsyncGenerator[StreamMessage, None]:
+        """
+        Yield the messages of a task registered with `submit` or `open`, until the one with the final chunk.
+
+        Args:
+            task_id: Id of the streaming task
+            timeout: Optional timeout in seconds to wait for each chunk
+        """
+        queue = self._queues.get(task_id)
+        if queue is None:
+            yield error_message(f"Streaming error: stream '{task_id}' not registered")
+            return
+
+        self._unread.pop(task_id, None)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout)
+                except TimeoutError:
+                    raise TimeoutError(f"no messages received in {timeout} secs")
+
+                yield message
+
+                if message.done:
+                    break
+        finally:
+            self.close(task_id)
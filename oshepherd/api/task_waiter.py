@@ -0,0 +1,152 @@
+"""
+Task Waiter
+Asyncio-native completion waiting for tasks queued by the API. Workers push a completion notification to the
+API process reply channel when a task finishes, so route handlers await it instead of polling the result backend.
+"""
+
+import asyncio
+import logging
+import uuid
+from typing import Any, Dict, Optional
+from celery.result import AsyncResult
+from oshepherd.api.config import ApiConfig
+from oshepherd.common.redis_service import AsyncRedisService
+from oshepherd.worker.ollama_task import OSHEPHERD_DONE_CHANNEL_PREFIX
+from oshepherd.common import json_codec
+
+# How often a pending wait double checks the result backend, in case a notification got lost
+OSHEPHERD_WAIT_FALLBACK_INTERVAL = 5  # secs
+logger = logging.getLogger(__name__)
+
+
+class TaskWaiter:
+
+    def __init__(self, config: ApiConfig):
+        self.backend_url = config.CELERY_BACKEND_URL
+        self.redis_service = AsyncRedisService(self.backend_url)
+        self.channel = f"{OSHEPHERD_DONE_CHANNEL_PREFIX}{uuid.uuid4().hex}"
+        self.completion_timeout = config.COMPLETION_TIMEOUT
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Subscribe to this API process reply channel and start listening for completions."""
+        await self._subscribe()
+        self._listener = asyncio.create_task(self._listen())
+        logger.info("task waiter started channel=%s", self.channel)
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub:
+            await self._pubsub.aclose()
+        await self.redis_service.close()
+        logger.info("task waiter stopped channel=%s", self.channel)
+
+    async def _subscribe(self):
+        self._pubsub = self.redis_service.pubsub()
+        await self._pubsub.subscribe(self.channel)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message and message["type"] == "message":
+                    self._resolve(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Pending waits fall back to the result backend meanwhile
+                logger.warning("task waiter lost connection, resubscribing error=%s", e)
+                await asyncio.sleep(1)
+                try:
+                    await self._pubsub.aclose()
+                    await self._subscribe()
+                except Exception as resubscribe_error:
+                    logger.warning(
+                        "task waiter resubscribe failed error=%s", resubscribe_error
+                    )
+
+    def _resolve(self, data: Any):
+        try:
+            notification = json_codec.loads_compressed(data)
+        except json_codec.JSONDecodeError:
+            logger.warning("failed to decode completion notification")
+            return
+
+        future = self._pending.get(notification.get("task_id"))
+        if future and not future.done():
+            future.set_result(notification)
+
+    def submit(
+        self, task, request_str: str, task_id: Optional[str] = None, **options
+    ) -> AsyncResult:
+        """
+        Queue a task, registering its completion future before it can possibly finish.
+        Given the `task_id` of a task already queued, it is published again, keeping its pending wait.
+        """
+        requeued = task_id is not None
+        if not requeued:
+            task_id = uuid.uuid4().hex
+            self._pending[task_id] = asyncio.get_running_loop().create_future()
+        try:
+            return task.apply_async(
+                (request_str,), task_id=task_id, reply_to=self.channel, **options
+            )
+        except Exception:
+            if not requeued:
+                self._pending.pop(task_id, None)
+            raise
+
+    async def wait(self, task: AsyncResult) -> dict:
+        """
+        Await the result of a task queued with `submit`.
+        Returns the task result, or an error dict (same shape workers report) on failure or timeout.
+        """
+        loop = asyncio.get_running_loop()
+        future = self._pending.get(task.id)
+        if future is None:
+            future = self._pending[task.id] = loop.create_future()
+        deadline = loop.time() + self.completion_timeout
+
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    logger.warning("timed out waiting for task_id=%s", task.id)
+                    return {
+                        "error": {
+                            "type": "TimeoutError",
+                            "message": f"no response after {self.completion_timeout} secs",
+                        }
+                    }
+
+                try:
+                    notification = await asyncio.wait_for(
+                        asyncio.shield(future),
+                        min(remaining, OSHEPHERD_WAIT_FALLBACK_INTERVAL),
+                    )
+                    if "error" in notification:
+                        return {"error": notification["error"]}
+                    return notification["result"]
+                except TimeoutError:
+                    logger.debug("waiting for response task_id=%s", task.id)
+                    backend_res = await asyncio.to_thread(self._read_backend, task)
+                    if backend_res is not None:
+                        return backend_res
+        finally:
+            self._pending.pop(task.id, None)
+
+    def _read_backend(self, task: AsyncResult) -> Optional[dict]:
+        if not task.ready():
+            return None
+
+        res = task.get(timeout=1, propagate=False)
+        if task.failed():
+            return {"error": {"type": res.__class__.__name__, "message": str(res)}}
+        return res
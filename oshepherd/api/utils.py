@@ -1,13 +1,118 @@
-import json
+import logging
 from fastapi.responses import StreamingResponse
+from oshepherd.common import json_codec
+from oshepherd.common.stream_frames import decode_chunks
+from oshepherd.common.embeddings_encoding import (
+    OSHEPHERD_EMBEDDINGS_ENCODINGS,
+    pack_response,
+)
 
+# Request header asking for packed embeddings, see `oshepherd.common.embeddings_encoding`
+OSHEPHERD_EMBEDDINGS_ENCODING_HEADER = "X-Oshepherd-Embeddings-Encoding"
+logger = logging.getLogger(__name__)
 
-def streamify_json(json_data, status=200):
+
+def streamify_json(json_data, status=200, headers=None):
     async def json_stream(data):
-        yield json.dumps(data).encode("utf-8")
+        yield json_codec.dumps(data)
 
     return StreamingResponse(
         json_stream(json_data),
         status_code=status,
         media_type="application/json",
+        headers=headers,
+    )
+
+
+def registry_headers(network_data):
+    """Response headers exposing how stale the workers registry snapshot is."""
+    age = network_data.get_registry_age()
+    if age is None:
+        return None
+    return {"X-Oshepherd-Registry-Age": f"{age:.3f}"}
+
+
+def get_embeddings_encoding(headers):
+    """
+    Encoding of the embeddings asked by the client, None for JSON numbers.
+    Raises ValueError on unsupported encodings.
+    """
+    encoding = headers.get(OSHEPHERD_EMBEDDINGS_ENCODING_HEADER)
+    if encoding is None:
+        return None
+
+    encoding = encoding.strip().lower()
+    if encoding not in OSHEPHERD_EMBEDDINGS_ENCODINGS:
+        raise ValueError(f"unsupported embeddings encoding '{encoding}'")
+    return encoding
+
+
+def streamify_embeddings(ollama_res, encoding=None, status=200):
+    """Send an embed or embeddings response, its vectors packed in the given encoding if any."""
+    if encoding and status == 200:
+        return streamify_json(
+            pack_response(ollama_res, encoding),
+            status,
+            {OSHEPHERD_EMBEDDINGS_ENCODING_HEADER: encoding},
+        )
+    return streamify_json(ollama_res, status)
+
+
+def streamify_chunks(chunks, headers=None):
+    """Send already available chunks as an NDJSON streaming response."""
+
+    async def stream_generator():
+        for chunk in chunks:
+            yield json_codec.dumps(chunk) + b"\n"
+
+    return StreamingResponse(
+        stream_generator(),
+        media_type="application/x-ndjson",
+        status_code=200,
+        headers=headers,
+    )
+
+
+def streamify_task(app, task_id, cache_key=None, offset=0):
+    """
+    Relay the chunks a worker publishes for a streaming task as an NDJSON response, after the first `offset`.
+    The task id is sent back in `X-Oshepherd-Task-Id`, to resume the stream through `GET /api/stream/{task_id}`.
+    Requests coalesced into the same task relay the same chunks.
+    With a `cache_key`, the completed response is stored in the response cache.
+    """
+
+    async def stream_generator():
+        logger.debug("relaying stream task_id=%s", task_id)
+        chunks = []
+
+        try:
+            async for message in app.single_flight.stream(task_id, offset):
+                # NDJSON lines as encoded by the worker, sent to the client untouched
+                yield message.data
+
+                # Chunks are only decoded to be cached
+                if cache_key:
+                    chunks.extend(decode_chunks(message.data))
+
+                # Break after receiving the final chunk
+                if message.done:
+                    logger.info("stream completed task_id=%s", task_id)
+                    if cache_key and chunks and not chunks[-1].get("error"):
+                        await app.response_cache.set(
+                            cache_key, app.response_cache.aggregate(chunks)
+                        )
+                    break
+        except Exception as e:
+            logger.exception("error streaming response task_id=%s", task_id)
+            error_response = {
+                "error": f"Streaming error: {str(e)}",
+                "done": True,
+            }
+            yield json_codec.dumps(error_response) + b"\n"
+
+    return StreamingResponse(
+        stream_generator(),
+        media_type="application/x-ndjson",
+        status_code=200,
+        headers={"X-Oshepherd-Task-Id": task_id},
     )
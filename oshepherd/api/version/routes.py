@@ -6,7 +6,7 @@ Ollama endpoint reference: https://github.com/ollama/ollama/blob/main/docs/api.m
 
 import logging
 from fastapi import Request
-from oshepherd.api.utils import streamify_json
+from oshepherd.api.utils import streamify_json, registry_headers
 from oshepherd.api.network_data import NetworkData
 
 logger = logging.getLogger(__name__)
@@ -31,6 +31,6 @@ def load_version_routes(app):
 
         logger.info("version response status=%s", status)
 
-        return streamify_json(ollama_res, status)
+        return streamify_json(ollama_res, status, registry_headers(network_data))
 
     return app
@@ -1,4 +1,7 @@
 import click
+import multiprocessing
+import os
+import signal
 from oshepherd.common.lib import load_and_validate_env
 from oshepherd.api.app import setup_api_app
 from oshepherd.api.server import setup_api_server
@@ -6,7 +9,14 @@ from oshepherd.api.config import ApiConfig
 from oshepherd.worker.config import WorkerConfig
 from oshepherd.worker.worker_data import WorkerData
 from oshepherd.worker.app import create_celery_app
+from oshepherd.worker.model_queues import ModelQueues
+from oshepherd.worker.ollama_task import OllamaCeleryTask
 from oshepherd.common.logging_config import configure_logging
+from oshepherd.common.queues import (
+    OSHEPHERD_EMBEDDINGS_KIND,
+    OSHEPHERD_GENERATION_KIND,
+    OSHEPHERD_TASK_KINDS,
+)
 
 
 @click.group()
@@ -33,13 +43,92 @@ def start_api(env_file):
     server.run()
 
 
+def get_worker_pools(config: WorkerConfig, queues, concurrency) -> list:
+    """
+    Worker pools to run, as the task kinds each one takes along with its concurrency. Every kind is taken by a
+    single pool, unless embeddings are given a concurrency of their own.
+    """
+    kinds = [kind.strip() for kind in (queues or config.QUEUES).split(",") if kind]
+    for kind in kinds:
+        if kind not in OSHEPHERD_TASK_KINDS:
+            raise click.BadParameter(
+                f"unknown task kind '{kind}', expected: {', '.join(OSHEPHERD_TASK_KINDS)}",
+                param_hint="--queues",
+            )
+
+    pools = {
+        OSHEPHERD_GENERATION_KIND: config.CONCURRENCY,
+        OSHEPHERD_EMBEDDINGS_KIND: config.EMBEDDINGS_CONCURRENCY,
+    }
+    for option in concurrency:
+        kind, _, value = option.partition("=")
+        if kind not in OSHEPHERD_TASK_KINDS or not value.isdigit() or int(value) < 1:
+            raise click.BadParameter(
+                f"invalid pool concurrency '{option}', expected i.e.: embeddings=4",
+                param_hint="--concurrency",
+            )
+        pools[kind] = int(value)
+
+    own_pools = {
+        kind: pools[kind]
+        for kind in kinds
+        if kind != OSHEPHERD_GENERATION_KIND and pools[kind]
+    }
+    shared_kinds = tuple(kind for kind in kinds if kind not in own_pools)
+    worker_pools = [((kind,), value) for kind, value in own_pools.items()]
+    if shared_kinds:
+        worker_pools.insert(0, (shared_kinds, pools[OSHEPHERD_GENERATION_KIND]))
+    return worker_pools
+
+
+def run_worker_pool(config: WorkerConfig, worker_data: WorkerData, kinds, concurrency):
+    """Run a Celery worker taking tasks of the given kinds."""
+    celery_app = create_celery_app(config)
+    # Inherited by the pool processes, which account their tasks in the slots of every kind the pool takes
+    OllamaCeleryTask.pool_kinds = tuple(kinds)
+
+    # Consume own queue and queues of the local models, kept in sync with local models
+    # Pools taking a single task kind are named after it
+    name = f"oshepherd-{kinds[0]}" if len(kinds) == 1 else "oshepherd"
+    nodename = f"{name}-{worker_data.worker_uuid}@{worker_data.hostname}"
+    model_queues = ModelQueues(celery_app, nodename, worker_data.worker_id, kinds)
+    queues = model_queues.get_initial_queues(worker_data.get_ollama_list())
+    model_queues.start_sync(worker_data.get_ollama_list)
+
+    worker = celery_app.Worker(
+        hostname=nodename,
+        queues=queues,
+        loglevel=config.LOGLEVEL,
+        concurrency=concurrency,
+        prefetch_multiplier=config.PREFETCH_MULTIPLIER,
+        redis_retry_on_timeout=config.REDIS_RETRY_ON_TIMEOUT,
+        redis_socket_keepalive=config.REDIS_SOCKET_KEEPALIVE,
+    )
+    worker.start()
+
+
+def run_forked_worker_pool(*args):
+    # Own process group, so signals sent to the terminal group only reach the pools once, through the parent
+    os.setpgrp()
+    run_worker_pool(*args)
+
+
 @main.command()
 @click.option(
     "--env-file",
     type=click.Path(exists=True),
     help="Path to the .env file with environment variables.",
 )
-def start_worker(env_file):
+@click.option(
+    "--queues",
+    help="Comma separated task kinds to consume: generation, embeddings.",
+)
+@click.option(
+    "--concurrency",
+    multiple=True,
+    help="Concurrency of the worker pool taking a task kind, embeddings given one run in a pool of their own, i.e.: --concurrency embeddings=4.",
+)
+def start_worker(env_file, queues, concurrency):
     """Starts the Celery Worker serving local Ollama models."""
     config: WorkerConfig = load_and_validate_env(WorkerConfig, env_file)
     if config is None:
@@ -47,18 +136,44 @@ def start_worker(env_file):
 
     configure_logging("worker", config.LOGLEVEL)
 
+    pools = get_worker_pools(config, queues, concurrency)
     worker_data = WorkerData(config)
+    worker_data.pools = {
+        kind: pool_concurrency for kinds, pool_concurrency in pools for kind in kinds
+    }
+    worker_data.reset_slots()
+
+    if len(pools) == 1:
+        worker_data.start_data_push()
+        run_worker_pool(config, worker_data, *pools[0])
+        return
+
+    # A pool per task kind, so short embeddings never wait behind long generations.
+    # Forked, to share the worker identity with the data push running in this process.
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=run_forked_worker_pool,
+            args=(config, worker_data, kinds, pool_concurrency),
+            name=f"oshepherd-{'-'.join(kinds)}",
+        )
+        for kinds, pool_concurrency in pools
+    ]
+    for process in processes:
+        process.start()
+
+    # Forward shutdown signals, for the pools to stop along with this process and its data push
+    def forward_signal(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGINT, forward_signal)
     worker_data.start_data_push()
 
-    celery_app = create_celery_app(config)
-    worker = celery_app.Worker(
-        loglevel=config.LOGLEVEL,
-        concurrency=config.CONCURRENCY,
-        prefetch_multiplier=config.PREFETCH_MULTIPLIER,
-        redis_retry_on_timeout=config.REDIS_RETRY_ON_TIMEOUT,
-        redis_socket_keepalive=config.REDIS_SOCKET_KEEPALIVE,
-    )
-    worker.start()
+    for process in processes:
+        process.join()
 
 
 if __name__ == "__main__":
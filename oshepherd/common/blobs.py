@@ -0,0 +1,67 @@
+"""
+Blobs
+Large request fields, such as base64 images, long messages or generate `context`, are offloaded by the API to a
+content-addressed store in Redis, `oshepherd_blob:{sha256}`, and replaced in the task message by a reference:
+    {"oshepherd_blob": "{sha256}"}
+The task request lists where each reference is, so workers only resolve those, never payload values that merely
+look like references:
+    {"type": "chat", "payload": {...}, "blobs": [{"path": ["messages", 0, "images", 0], "digest": "{sha256}"}]}
+Workers resolve references right before running the task, so broker messages, prefetched ones and retries stay
+small, and identical blobs are stored once however many requests carry them.
+"""
+
+import hashlib
+from typing import Any, Dict, List, Optional, Union
+from oshepherd.common import json_codec
+
+OSHEPHERD_BLOB_PREFIX_KEY = "oshepherd_blob:"
+OSHEPHERD_BLOB_REF = "oshepherd_blob"
+
+BlobRef = Dict[str, Any]  # {"path": [key or index, ...], "digest": sha256}
+
+
+def offload(
+    value: Any,
+    threshold: int,
+    blobs: Dict[str, bytes],
+    refs: List[BlobRef],
+    path: Optional[List[Union[str, int]]] = None,
+) -> Any:
+    """
+    Copy of a value, its strings and lists of numbers encoding to `threshold` bytes or more replaced by
+    references. Offloaded blobs are added to `blobs`, by digest, and their references to `refs`.
+    """
+    path = path or []
+    if isinstance(value, dict):
+        return {
+            key: offload(item, threshold, blobs, refs, path + [key])
+            for key, item in value.items()
+        }
+    if isinstance(value, list) and not all(
+        isinstance(item, (int, float)) for item in value
+    ):
+        return [
+            offload(item, threshold, blobs, refs, path + [index])
+            for index, item in enumerate(value)
+        ]
+    if not isinstance(value, (str, list)):
+        return value
+
+    data = json_codec.dumps(value)
+    if len(data) < threshold:
+        return value
+    digest = hashlib.sha256(data).hexdigest()
+    blobs[digest] = data
+    refs.append({"path": path, "digest": digest})
+    return {OSHEPHERD_BLOB_REF: digest}
+
+
+def resolve(payload: Any, refs: List[BlobRef], blobs: Dict[str, bytes]) -> Any:
+    """Replace, in place, the references listed in `refs` by the blobs they point to."""
+    for ref in refs:
+        *parents, last = ref["path"]
+        container = payload
+        for key in parents:
+            container = container[key]
+        container[last] = json_codec.loads(blobs[ref["digest"]])
+    return payload
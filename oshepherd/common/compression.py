@@ -0,0 +1,118 @@
+"""
+Compression
+Size-adaptive compression of task messages, results and stream frames. Payloads larger than the threshold are
+compressed with zstd when installed (`pip install oshepherd[fast]`), zlib otherwise, and sent raw below it,
+where compression costs more than it saves. Compressed payloads start with a marker byte telling the codec,
+never the first byte of a JSON document, so readers decompress whatever they get, compression enabled or not.
+Codecs are set up with small windows, bounding their memory to a few hundred KB on small instances. zstd
+contexts aren't thread-safe, so each thread gets its own.
+"""
+
+import logging
+import threading
+import zlib
+from typing import Union
+from oshepherd.common.metrics import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+OSHEPHERD_COMPRESSION_ZLIB = b"\x01"
+OSHEPHERD_COMPRESSION_ZSTD = b"\x02"
+OSHEPHERD_COMPRESSION_THRESHOLD = 4096  # bytes
+# zlib memory: 2^(ZLIB_WBITS + 2) + 2^(ZLIB_MEM_LEVEL + 9) bytes to compress, 2^ZLIB_WBITS to decompress
+OSHEPHERD_ZLIB_LEVEL = 6
+OSHEPHERD_ZLIB_WBITS = 15
+OSHEPHERD_ZLIB_MEM_LEVEL = 6
+OSHEPHERD_ZSTD_LEVEL = 3
+OSHEPHERD_ZSTD_WINDOW_LOG = 17
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_threshold = OSHEPHERD_COMPRESSION_THRESHOLD
+# Per-thread zstd compressor and decompressor
+_zstd_contexts = threading.local()
+
+
+def configure(enabled: bool, threshold: int = OSHEPHERD_COMPRESSION_THRESHOLD):
+    """Enable compression of payloads of `threshold` bytes or more, for this process."""
+    global _enabled, _threshold
+
+    _enabled = bool(enabled)
+    _threshold = threshold
+    logger.debug(
+        "compression configured enabled=%s threshold=%s codec=%s",
+        _enabled,
+        _threshold,
+        "zstd" if zstandard else "zlib",
+    )
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _zstd_compressor() -> "zstandard.ZstdCompressor":
+    compressor = getattr(_zstd_contexts, "compressor", None)
+    if compressor is None:
+        compressor = _zstd_contexts.compressor = zstandard.ZstdCompressor(
+            compression_params=zstandard.ZstdCompressionParameters.from_level(
+                OSHEPHERD_ZSTD_LEVEL, window_log=OSHEPHERD_ZSTD_WINDOW_LOG
+            )
+        )
+    return compressor
+
+
+def _zstd_decompressor() -> "zstandard.ZstdDecompressor":
+    decompressor = getattr(_zstd_contexts, "decompressor", None)
+    if decompressor is None:
+        decompressor = _zstd_contexts.decompressor = zstandard.ZstdDecompressor(
+            max_window_size=1 << OSHEPHERD_ZSTD_WINDOW_LOG
+        )
+    return decompressor
+
+
+def compress(data: bytes) -> bytes:
+    """Compress data over the threshold, if enabled and it pays off, returning it as is otherwise."""
+    if not _enabled or len(data) < _threshold:
+        return data
+
+    if zstandard is not None:
+        compressed = OSHEPHERD_COMPRESSION_ZSTD + _zstd_compressor().compress(data)
+    else:
+        compressor = zlib.compressobj(
+            OSHEPHERD_ZLIB_LEVEL,
+            zlib.DEFLATED,
+            OSHEPHERD_ZLIB_WBITS,
+            OSHEPHERD_ZLIB_MEM_LEVEL,
+        )
+        compressed = (
+            OSHEPHERD_COMPRESSION_ZLIB + compressor.compress(data) + compressor.flush()
+        )
+
+    if len(compressed) >= len(data):
+        return data
+    metrics.incr("compression_messages")
+    metrics.incr("compression_bytes_saved", len(data) - len(compressed))
+    return compressed
+
+
+def decompress(data: Union[str, bytes]) -> Union[str, bytes]:
+    """Decompress data compressed with `compress`, returning any other data as is."""
+    if isinstance(data, str):
+        return data
+
+    marker = data[:1]
+    if marker == OSHEPHERD_COMPRESSION_ZLIB:
+        decompressed = zlib.decompress(data[1:], OSHEPHERD_ZLIB_WBITS)
+    elif marker == OSHEPHERD_COMPRESSION_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd compressed payload, but zstandard isn't installed")
+        decompressed = _zstd_decompressor().decompress(data[1:])
+    else:
+        return data
+
+    metrics.incr("decompression_bytes_saved", len(decompressed) - len(data))
+    return decompressed
@@ -0,0 +1,79 @@
+"""
+Embeddings Encoding
+Compact encoding of embeddings results, 4 (float32) or 2 (float16) bytes per dimension instead of about 20 as
+JSON numbers. Vectors are packed as little-endian floats and base64 encoded, to travel within JSON messages,
+along with a header describing them:
+    {"encoding": "float32", "dims": 768, "data": "..."}
+`embeddings` hold every vector of a response in a single packed value, `embedding` its single vector.
+"""
+
+import base64
+import struct
+from itertools import chain
+from typing import Any, Dict, List, Tuple
+
+# struct format character and size of each encoding
+OSHEPHERD_EMBEDDINGS_ENCODINGS = {"float32": ("f", 4), "float16": ("e", 2)}
+# Response fields holding several vectors, or a single one
+OSHEPHERD_EMBEDDINGS_FIELDS = {"embeddings": False, "embedding": True}
+
+
+def pack_floats(values: List[float], encoding: str) -> Tuple[str, bytes]:
+    """Pack values as little-endian floats. Values out of the float16 range are packed as float32."""
+    fmt, _ = OSHEPHERD_EMBEDDINGS_ENCODINGS[encoding]
+    try:
+        return encoding, struct.pack(f"<{len(values)}{fmt}", *values)
+    except (OverflowError, struct.error):
+        return "float32", struct.pack(f"<{len(values)}f", *values)
+
+
+def unpack_floats(data: bytes, encoding: str) -> List[float]:
+    fmt, size = OSHEPHERD_EMBEDDINGS_ENCODINGS[encoding]
+    return list(struct.unpack(f"<{len(data) // size}{fmt}", data))
+
+
+def pack_vectors(vectors: List[List[float]], encoding: str) -> Dict[str, Any]:
+    """Pack vectors of the same dimensions, see `pack_floats`."""
+    dims = len(vectors[0]) if vectors else 0
+    encoding, data = pack_floats(list(chain.from_iterable(vectors)), encoding)
+    return {
+        "encoding": encoding,
+        "dims": dims,
+        "data": base64.b64encode(data).decode("ascii"),
+    }
+
+
+def unpack_vectors(packed: Dict[str, Any]) -> List[List[float]]:
+    dims = packed["dims"]
+    if not dims:
+        return []
+
+    values = unpack_floats(base64.b64decode(packed["data"]), packed["encoding"])
+    return [
+        list(values[offset : offset + dims]) for offset in range(0, len(values), dims)
+    ]
+
+
+def is_packed(value: Any) -> bool:
+    return isinstance(value, dict) and "encoding" in value and "data" in value
+
+
+def pack_response(response: Dict[str, Any], encoding: str) -> Dict[str, Any]:
+    """Copy of an embed or embeddings response, its vectors packed."""
+    response = dict(response)
+    for field, single in OSHEPHERD_EMBEDDINGS_FIELDS.items():
+        value = response.get(field)
+        if isinstance(value, list):
+            response[field] = pack_vectors([value] if single else value, encoding)
+    return response
+
+
+def unpack_response(response: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of an embed or embeddings response, its vectors as lists of floats."""
+    response = dict(response)
+    for field, single in OSHEPHERD_EMBEDDINGS_FIELDS.items():
+        value = response.get(field)
+        if is_packed(value):
+            vectors = unpack_vectors(value)
+            response[field] = (vectors[0] if vectors else []) if single else vectors
+    return response
@@ -0,0 +1,69 @@
+"""
+JSON Codec
+JSON encoding and decoding of every hot path: task requests and results, stream chunks, registry data and
+API responses. Backed by orjson when installed (`pip install oshepherd[fast]`), falling back to the stdlib
+`json` module otherwise. Both produce compact JSON, and values not natively supported are encoded as `str`.
+"""
+
+import json
+from json import JSONDecodeError
+from typing import Any, Union
+from oshepherd.common import compression
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Kombu serializer, sharing the content type of the built-in "json" one so either end can decode the other
+OSHEPHERD_KOMBU_SERIALIZER = "oshepherd_json"
+OSHEPHERD_JSON_BACKEND = "orjson" if orjson else "json"
+
+if orjson:
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        return orjson.loads(data)
+
+else:
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(
+            obj, default=str, separators=(",", ":"), ensure_ascii=False
+        ).encode("utf-8")
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        if isinstance(data, memoryview):
+            data = bytes(data)
+        return json.loads(data)
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode("utf-8")
+
+
+def dumps_compressed(obj: Any) -> bytes:
+    """Encode, compressing large documents if enabled, see `oshepherd.common.compression`."""
+    return compression.compress(dumps(obj))
+
+
+def loads_compressed(data: Union[str, bytes]) -> Any:
+    return loads(compression.decompress(data))
+
+
+def register_kombu_serializer():
+    """
+    Register the codec as a kombu serializer, for Celery task and result messages.
+    Messages are binary so they can be compressed, uncompressed ones are still plain JSON.
+    """
+    from kombu.serialization import register
+
+    register(
+        OSHEPHERD_KOMBU_SERIALIZER,
+        dumps_compressed,
+        loads_compressed,
+        content_type="application/json",
+        content_encoding="binary",
+    )
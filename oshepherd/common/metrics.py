@@ -0,0 +1,30 @@
+"""
+Process-wide counters, exposed by the API through `GET /metrics`.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Union
+
+Number = Union[int, float]
+
+
+class Metrics:
+
+    def __init__(self):
+        self._counters: Dict[str, Number] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, value: Number = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> Number:
+        return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Number]:
+        with self._lock:
+            return dict(self._counters)
+
+
+metrics = Metrics()
@@ -0,0 +1,70 @@
+"""
+Celery queues naming, shared by the API publishing tasks and the workers consuming them.
+Tasks are split by kind, each kind with its own queues, so short embedding tasks never wait behind long
+generations:
+    1. generation: generate and chat completions, on the `celery` default queue, `oshepherd.model.*` and
+       `oshepherd.worker.*` queues.
+    2. embeddings: on the `oshepherd.embeddings` default queue, and `oshepherd.embeddings.*` queues.
+"""
+
+from typing import Optional
+
+OSHEPHERD_GENERATION_KIND = "generation"
+OSHEPHERD_EMBEDDINGS_KIND = "embeddings"
+OSHEPHERD_TASK_KINDS = (OSHEPHERD_GENERATION_KIND, OSHEPHERD_EMBEDDINGS_KIND)
+OSHEPHERD_DEFAULT_QUEUE = "celery"
+OSHEPHERD_EMBEDDINGS_QUEUE = "oshepherd.embeddings"
+OSHEPHERD_MODEL_QUEUE_PREFIXES = {
+    OSHEPHERD_GENERATION_KIND: "oshepherd.model.",
+    OSHEPHERD_EMBEDDINGS_KIND: "oshepherd.embeddings.model.",
+}
+OSHEPHERD_WORKER_QUEUE_PREFIXES = {
+    OSHEPHERD_GENERATION_KIND: "oshepherd.worker.",
+    OSHEPHERD_EMBEDDINGS_KIND: "oshepherd.embeddings.worker.",
+}
+
+
+def task_kind(request_type: str) -> str:
+    """Kind of the task running a request of the given type, i.e.: `chat` runs as a generation."""
+    if request_type in ("embed", "embeddings"):
+        return OSHEPHERD_EMBEDDINGS_KIND
+    return OSHEPHERD_GENERATION_KIND
+
+
+def queue_kind(queue: str) -> str:
+    """Kind of the tasks published to the given queue."""
+    if queue and queue.startswith(OSHEPHERD_EMBEDDINGS_QUEUE):
+        return OSHEPHERD_EMBEDDINGS_KIND
+    return OSHEPHERD_GENERATION_KIND
+
+
+def normalize_model_name(model_name: str) -> str:
+    """Model name as reported by `ollama.list()`, i.e.: `mistral` is `mistral:latest`."""
+    if ":" in model_name.rsplit("/", 1)[-1]:
+        return model_name
+    return f"{model_name}:latest"
+
+
+def default_queue(kind: str = OSHEPHERD_GENERATION_KIND) -> str:
+    """Queue consumed by every worker taking tasks of the given kind."""
+    if kind == OSHEPHERD_EMBEDDINGS_KIND:
+        return OSHEPHERD_EMBEDDINGS_QUEUE
+    return OSHEPHERD_DEFAULT_QUEUE
+
+
+def model_queue(model_name: str, kind: str = OSHEPHERD_GENERATION_KIND) -> str:
+    """Queue consumed only by workers holding the given model."""
+    return f"{OSHEPHERD_MODEL_QUEUE_PREFIXES[kind]}{normalize_model_name(model_name)}"
+
+
+def worker_queue(worker_id: str, kind: str = OSHEPHERD_GENERATION_KIND) -> str:
+    """Queue consumed only by the given worker, for tasks scheduled to it."""
+    return f"{OSHEPHERD_WORKER_QUEUE_PREFIXES[kind]}{worker_id}"
+
+
+def queue_worker_id(queue: str) -> Optional[str]:
+    """Id of the worker consuming the given queue, None unless it is a worker queue."""
+    for prefix in OSHEPHERD_WORKER_QUEUE_PREFIXES.values():
+        if queue and queue.startswith(prefix):
+            return queue[len(prefix) :]
+    return None
@@ -1,20 +1,77 @@
+import asyncio
 import threading
 import logging
-from typing import Any, Optional, Dict, Iterator, Generator
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Optional,
+    Dict,
+    List,
+    Iterator,
+    Generator,
+    Tuple,
+    Union,
+)
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.asyncio.client import PubSub as AsyncPubSub
 from redis.exceptions import ConnectionError as RedisConnectionError
 import json
 
+# Max time asyncio callers wait for a pooled connection to free up
+OSHEPHERD_REDIS_POOL_TIMEOUT = 5  # secs
 logger = logging.getLogger(__name__)
 
 
+class RedisPoolExhaustedError(RedisConnectionError):
+    """No pooled connection freed up in time, every one being busy with other commands."""
+
+
+class AsyncConnectionPool(AsyncBlockingConnectionPool):
+    """
+    Connection pool making callers wait for a free connection once `max_connections` are in use, instead of
+    failing right away, up to its `timeout`.
+    """
+
+    async def get_connection(self, *args: Any, **kwargs: Any) -> Any:
+        try:
+            return await super().get_connection(*args, **kwargs)
+        except RedisConnectionError as e:
+            if isinstance(e.__cause__, asyncio.TimeoutError):
+                raise RedisPoolExhaustedError(str(e)) from e
+            raise
+
+
+class RedisBatch:
+    """
+    Redis commands queued to run in a single round-trip, see `RedisService.pipeline`.
+    Any Redis client command can be queued, i.e.: `batch.hset(name, mapping=data)`.
+    """
+
+    def __init__(self) -> None:
+        self.commands: List[Tuple[str, tuple, dict]] = []
+        self.results: Optional[List[Any]] = None
+
+    def __getattr__(self, command: str) -> Any:
+        def queue(*args: Any, **kwargs: Any) -> "RedisBatch":
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+
 class RedisService:
     """
     Resilient Redis service with automatic reconnection.
+    With `preflight_ping=False` operations skip the connection check `PING`, and the connection
+    is only checked, and restored, once an operation fails.
     """
 
-    def __init__(self, backend_url: str) -> None:
+    def __init__(self, backend_url: str, preflight_ping: bool = True) -> None:
         self.backend_url: str = backend_url
+        self.preflight_ping: bool = preflight_ping
         self.redis_client: Redis = self._create_redis_client()
         self._connection_lock: threading.Lock = threading.Lock()
 
@@ -56,7 +113,7 @@ class RedisService:
 
     def _with_retry(self, operation: Any, *args: Any, **kwargs: Any) -> Any:
         """Execute Redis operation with automatic retry on connection failure."""
-        if not self._ensure_connection():
+        if self.preflight_ping and not self._ensure_connection():
             raise RedisConnectionError("Redis connection unavailable")
 
         try:
@@ -93,15 +150,79 @@ class RedisService:
     def hgetall(self, name: str) -> Dict[str, str]:
         return self._with_retry(self.redis_client.hgetall, name)
 
+    def hincrby(self, name: str, key: str, amount: int = 1) -> int:
+        return self._with_retry(self.redis_client.hincrby, name, key, amount)
+
+    @contextmanager
+    def pipeline(self) -> Iterator[RedisBatch]:
+        """
+        Queue commands to run in a single round-trip when the block exits, with the same reconnection semantics
+        as single operations. Results are available afterwards in `batch.results`.
+        """
+        batch = RedisBatch()
+        yield batch
+        batch.results = (
+            self._with_retry(self._execute_batch, batch.commands)
+            if batch.commands
+            else []
+        )
+
+    def _execute_batch(self, commands: List[Tuple[str, tuple, dict]]) -> List[Any]:
+        # Built on every attempt, so a retry runs on the restored client
+        pipe = self.redis_client.pipeline(transaction=False)
+        for command, args, kwargs in commands:
+            getattr(pipe, command)(*args, **kwargs)
+        return pipe.execute()
+
+    def get(self, name: str) -> Optional[bytes]:
+        return self._with_retry(self.redis_client.get, name)
+
+    def delete(self, *names: str) -> int:
+        return self._with_retry(self.redis_client.delete, *names)
+
+    def expire(self, name: str, time: int) -> bool:
+        return self._with_retry(self.redis_client.expire, name, time)
+
+    def zadd(self, name: str, mapping: Dict[str, float]) -> int:
+        return self._with_retry(self.redis_client.zadd, name, mapping)
+
+    def zrangebyscore(self, name: str, min: Any, max: Any) -> List[bytes]:
+        return self._with_retry(self.redis_client.zrangebyscore, name, min, max)
+
+    def zremrangebyscore(self, name: str, min: Any, max: Any) -> int:
+        return self._with_retry(self.redis_client.zremrangebyscore, name, min, max)
+
     def scan_iter(self, **kwargs: Any) -> Iterator[str]:
         return self._with_retry(self.redis_client.scan_iter, **kwargs)
 
     def ping(self) -> bool:
         return self._with_retry(self.redis_client.ping)
 
-    def publish(self, channel: str, message: str) -> int:
+    def publish(self, channel: str, message: Union[str, bytes]) -> int:
         return self._with_retry(self.redis_client.publish, channel, message)
 
+    def xadd_chunk(
+        self,
+        name: str,
+        message: Union[str, bytes],
+        maxlen: int,
+        ttl: Optional[int] = None,
+        entry_id: str = "0-*",
+    ) -> str:
+        """
+        Append a message to a Redis Stream, capped to about `maxlen` entries.
+        Entry ids are `0-1`, `0-2`, ... (Redis 7+ `0-*` ids), so the sequence part is the chunk number,
+        which lets consumers resume reading after any chunk they already have. Messages batching several
+        chunks are given the number of their last chunk as `entry_id`.
+        If `ttl` is given, the stream (re)expires after `ttl` seconds.
+        """
+        with self.pipeline() as batch:
+            batch.xadd(name, {"data": message}, id=entry_id, maxlen=maxlen)
+            if ttl:
+                batch.expire(name, ttl)
+
+        return batch.results[0]
+
     def subscribe_to_channel(
         self, channel: str, timeout: Optional[float] = None
     ) -> Generator[Dict[str, Any], None, None]:
@@ -145,3 +266,63 @@ class RedisService:
             if pubsub:
                 pubsub.unsubscribe(channel)
                 pubsub.close()
+
+
+class AsyncRedisService:
+    """
+    Asyncio Redis service, to be used from the API event loop without blocking it.
+    Commands wait up to `OSHEPHERD_REDIS_POOL_TIMEOUT` seconds for a connection once `max_connections` are busy,
+    raising `RedisPoolExhaustedError` after.
+    """
+
+    def __init__(self, backend_url: str, max_connections: int = 5) -> None:
+        self.backend_url: str = backend_url
+        self.max_connections: int = max_connections
+        self.redis_client: AsyncRedis = self._create_redis_client()
+
+    def _create_redis_client(self) -> AsyncRedis:
+        """Create asyncio Redis client with the same reliability settings as `RedisService`."""
+        pool = AsyncConnectionPool.from_url(
+            self.backend_url,
+            socket_keepalive=True,
+            retry_on_timeout=True,
+            socket_connect_timeout=5,
+            socket_timeout=30,
+            max_connections=self.max_connections,
+            timeout=OSHEPHERD_REDIS_POOL_TIMEOUT,
+            health_check_interval=30,
+            socket_keepalive_options={},
+        )
+        return AsyncRedis.from_pool(pool)
+
+    async def ping(self) -> bool:
+        return await self.redis_client.ping()
+
+    async def publish(self, channel: str, message: str) -> int:
+        return await self.redis_client.publish(channel, message)
+
+    async def exists(self, name: str) -> bool:
+        return bool(await self.redis_client.exists(name))
+
+    async def xread(
+        self, streams: Dict[str, str], block: int, count: Optional[int] = None
+    ) -> list:
+        return await self.redis_client.xread(streams, count=count, block=block)
+
+    @asynccontextmanager
+    async def pipeline(self) -> AsyncIterator[RedisBatch]:
+        """Queue commands to run in a single round-trip when the block exits, see `RedisService.pipeline`."""
+        batch = RedisBatch()
+        yield batch
+        batch.results = []
+        if batch.commands:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for command, args, kwargs in batch.commands:
+                getattr(pipe, command)(*args, **kwargs)
+            batch.results = await pipe.execute()
+
+    def pubsub(self) -> AsyncPubSub:
+        return self.redis_client.pubsub(ignore_subscribe_messages=True)
+
+    async def close(self) -> None:
+        await self.redis_client.aclose()
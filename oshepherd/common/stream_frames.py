@@ -0,0 +1,66 @@
+"""
+Stream Frames
+Wire format of token stream messages, relayed by the API to its clients as they are: a frame byte followed by
+the NDJSON lines of one or more chunks, as the worker already encoded them. The frame byte tells whether the
+message holds the final chunk, so the API never decodes chunks just to relay them, and whether the lines are
+compressed, for messages over the compression threshold.
+"""
+
+from typing import Any, Dict, List, Tuple
+from oshepherd.common import compression, json_codec
+
+# Frame byte of messages holding only intermediate chunks, or the final one
+OSHEPHERD_FRAME_CHUNKS = b"c"
+OSHEPHERD_FRAME_DONE = b"d"
+# Same ones, lines compressed
+OSHEPHERD_FRAME_COMPRESSED_CHUNKS = b"C"
+OSHEPHERD_FRAME_COMPRESSED_DONE = b"D"
+
+
+def encode_frame(lines: List[bytes], done: bool) -> bytes:
+    """Frame the given JSON encoded chunks, as NDJSON lines."""
+    data = b"".join(line + b"\n" for line in lines)
+    compressed = compression.compress(data)
+    if compressed is not data:
+        frame = (
+            OSHEPHERD_FRAME_COMPRESSED_DONE
+            if done
+            else OSHEPHERD_FRAME_COMPRESSED_CHUNKS
+        )
+        return frame + compressed
+
+    frame = OSHEPHERD_FRAME_DONE if done else OSHEPHERD_FRAME_CHUNKS
+    return frame + data
+
+
+def decode_frame(message: bytes) -> Tuple[bytes, bool]:
+    """
+    Get the NDJSON lines of a message, and whether they include the final chunk.
+    Messages of JSON encoded chunks, or arrays of them, published by older workers are converted.
+    """
+    frame = message[:1]
+    if frame == OSHEPHERD_FRAME_CHUNKS or frame == OSHEPHERD_FRAME_DONE:
+        return message[1:], frame == OSHEPHERD_FRAME_DONE
+    if (
+        frame == OSHEPHERD_FRAME_COMPRESSED_CHUNKS
+        or frame == OSHEPHERD_FRAME_COMPRESSED_DONE
+    ):
+        return (
+            compression.decompress(message[1:]),
+            frame == OSHEPHERD_FRAME_COMPRESSED_DONE,
+        )
+
+    chunks = json_codec.loads(message)
+    if not isinstance(chunks, list):
+        chunks = [chunks]
+    data = b"".join(json_codec.dumps(chunk) + b"\n" for chunk in chunks)
+    return data, any(chunk.get("done") is True for chunk in chunks)
+
+
+def split_lines(data: bytes) -> List[bytes]:
+    """NDJSON lines of a message, newline included, one per chunk."""
+    return data.splitlines(keepends=True)
+
+
+def decode_chunks(data: bytes) -> List[Dict[str, Any]]:
+    return [json_codec.loads(line) for line in data.splitlines()]
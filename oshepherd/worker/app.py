@@ -1,6 +1,11 @@
 from celery import Celery
 from celery.signals import worker_ready, worker_process_init
 from oshepherd.worker.config import WorkerConfig
+from oshepherd.common import compression
+from oshepherd.common.json_codec import (
+    OSHEPHERD_KOMBU_SERIALIZER,
+    register_kombu_serializer,
+)
 import redis
 import time
 import threading
@@ -21,6 +26,9 @@ def create_celery_app(config: WorkerConfig):
     """
     global celery_app
 
+    # Wire compatible with the built-in "json" serializer, just faster
+    register_kombu_serializer()
+    compression.configure(config.ENABLE_COMPRESSION, config.COMPRESSION_THRESHOLD)
     celery_app = Celery(
         TASKS_MODULE, broker=config.CELERY_BROKER_URL, backend=config.CELERY_BACKEND_URL
     )
@@ -40,12 +48,13 @@ def create_celery_app(config: WorkerConfig):
         task_acks_late=True,
         task_reject_on_worker_lost=True,
         worker_disable_rate_limits=True,
-        # Disable compression (having in mind smallest 30MB memory limit)
+        # Large messages are compressed by the serializer instead, with bounded memory codecs
+        # (having in mind smallest 30MB memory limit)
         task_compression=None,
         result_compression=None,
         result_accept_content=["json"],
-        task_serializer="json",
-        result_serializer="json",
+        task_serializer=OSHEPHERD_KOMBU_SERIALIZER,
+        result_serializer=OSHEPHERD_KOMBU_SERIALIZER,
         accept_content=["json"],
         worker_hijack_root_logger=False,
         # Redis-specific optimizations
@@ -162,6 +171,8 @@ def create_celery_app_for_fastapi(config):
         CELERY_BROKER_URL=config.CELERY_BROKER_URL,
         CELERY_BACKEND_URL=config.CELERY_BACKEND_URL,
         RESULTS_EXPIRES=WorkerConfig.model_fields["RESULTS_EXPIRES"].default,
+        ENABLE_COMPRESSION=config.ENABLE_COMPRESSION,
+        COMPRESSION_THRESHOLD=config.COMPRESSION_THRESHOLD,
     )
 
     celery_app = create_celery_app(config)
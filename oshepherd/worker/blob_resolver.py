@@ -0,0 +1,73 @@
+"""
+Blob Resolver
+Resolution of the blob references in task requests, see `oshepherd.common.blobs`. Blobs are fetched from Redis
+right before running the task, and kept in a local least recently used cache of up to `BLOB_CACHE_MAX_BYTES`,
+so blobs repeated across requests, such as the same image, are fetched once per worker process.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List
+from oshepherd.common import blobs
+from oshepherd.common.redis_service import RedisService
+
+logger = logging.getLogger(__name__)
+
+
+class BlobResolver:
+
+    def __init__(self, redis_service: RedisService, max_bytes: int):
+        self.redis_service = redis_service
+        self.max_bytes = max_bytes
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    def resolve(
+        self, payload: Dict[str, Any], refs: List[blobs.BlobRef]
+    ) -> Dict[str, Any]:
+        """Resolve the blob references `refs` of a request payload. Raises ValueError on expired blobs."""
+        digests = {ref["digest"] for ref in refs}
+        if not digests:
+            return payload
+
+        found = self._get_cached(digests)
+        missing = [digest for digest in digests if digest not in found]
+        if missing:
+            keys = [f"{blobs.OSHEPHERD_BLOB_PREFIX_KEY}{digest}" for digest in missing]
+            with self.redis_service.pipeline() as batch:
+                batch.mget(keys)
+            for digest, data in zip(missing, batch.results[0]):
+                if data is None:
+                    raise ValueError(f"request blob '{digest}' not found or expired")
+                found[digest] = data
+                self._cache_blob(digest, data)
+
+        logger.debug(
+            "request blobs resolved blobs=%s fetched=%s", len(digests), len(missing)
+        )
+        return blobs.resolve(payload, refs, found)
+
+    def _get_cached(self, digests) -> Dict[str, bytes]:
+        found = {}
+        with self._lock:
+            for digest in digests:
+                data = self._cache.get(digest)
+                if data is not None:
+                    self._cache.move_to_end(digest)
+                    found[digest] = data
+        return found
+
+    def _cache_blob(self, digest: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            if digest in self._cache:
+                return
+            self._cache[digest] = data
+            self._cache_bytes += len(data)
+            while self._cache_bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
@@ -8,10 +8,18 @@ class WorkerConfig(BaseModel):
     OLLAMA_BASE_URL: Optional[str] = "http://localhost:11434"
     LOGLEVEL: Optional[str] = "info"
     CONCURRENCY: Optional[int] = 1
+    # Task kinds to consume: "generation" (generate, chat) and "embeddings"
+    QUEUES: Optional[str] = "generation,embeddings"
+    # Embeddings get a pool of their own with this concurrency when set, they share the `CONCURRENCY` pool otherwise
+    EMBEDDINGS_CONCURRENCY: Optional[int] = None
     PREFETCH_MULTIPLIER: Optional[int] = 1
     RESULTS_EXPIRES: Optional[int] = 3600
     # Performance tuning options
+    # Local cache of request blobs offloaded by the API
+    BLOB_CACHE_MAX_BYTES: Optional[int] = 16 * 1024 * 1024
+    # Task messages, results and stream messages over the threshold are compressed
     ENABLE_COMPRESSION: Optional[bool] = False
+    COMPRESSION_THRESHOLD: Optional[int] = 4096  # bytes
     CONNECTION_POOL_SIZE: Optional[int] = 3
     REDIS_SOCKET_KEEPALIVE_IDLE: Optional[int] = 240
     REDIS_SOCKET_KEEPALIVE_INTERVAL: Optional[int] = 15
@@ -30,5 +38,12 @@ class WorkerConfig(BaseModel):
         "health_check_interval": 60,
         "socket_keepalive_options": {},
     }
+    # Redis Streams transport for token streams
+    STREAM_MAXLEN: Optional[int] = 10000  # messages, of one or more chunks
+    STREAM_TTL: Optional[int] = 600  # secs, how long a finished stream can be resumed
+    # Stream chunks batched into a single message, flushed on whichever limit is hit first
+    STREAM_BATCH_MAX_CHUNKS: Optional[int] = 64
+    STREAM_BATCH_MAX_BYTES: Optional[int] = 16384
+    STREAM_BATCH_MAX_MS: Optional[int] = 50
     REDIS_RETRY_ON_TIMEOUT: bool = True
     REDIS_SOCKET_KEEPALIVE: bool = True
@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from typing import Callable, Iterable
+from celery.signals import worker_ready
+from oshepherd.common.queues import default_queue, model_queue, worker_queue
+
+# How often local models are listed, to follow models pulled or removed
+OSHEPHERD_MODEL_QUEUES_SYNC_INTERVAL = 10  # secs
+
+logger = logging.getLogger(__name__)
+
+
+class ModelQueues:
+    """
+    Keeps a worker subscribed to the queues of the models it holds, so model specific tasks only reach workers
+    able to run them. Besides those, the default queue is always consumed, for tasks of any other model, along
+    with the worker own queue, for tasks the API scheduled to this worker. Only queues of the given task kinds
+    are consumed.
+    """
+
+    def __init__(self, celery_app, nodename: str, worker_id: str, kinds: Iterable[str]):
+        self.celery_app = celery_app
+        self.nodename = nodename
+        self.kinds = tuple(kinds)
+        self.base_queues = [
+            queue
+            for kind in self.kinds
+            for queue in (default_queue(kind), worker_queue(worker_id, kind))
+        ]
+        self.queues = set()
+        self._ready = threading.Event()
+        worker_ready.connect(self._on_worker_ready, weak=False)
+
+    def _on_worker_ready(self, sender=None, **kwargs):
+        self._ready.set()
+
+    def get_initial_queues(self, tags_res: dict) -> list:
+        """Queues to start the worker consuming from."""
+        self.queues = self.get_model_queues(tags_res)
+        return [*self.base_queues, *sorted(self.queues)]
+
+    def get_model_queues(self, tags_res: dict) -> set:
+        return {
+            model_queue(model["model"], kind)
+            for model in tags_res.get("models", [])
+            if model.get("model")
+            for kind in self.kinds
+        }
+
+    def sync(self, tags_res: dict):
+        """Subscribe to queues of new models, and unsubscribe from queues of removed ones."""
+        if tags_res.get("error") or not self._ready.is_set():
+            return
+
+        queues = self.get_model_queues(tags_res)
+        control = self.celery_app.control
+        for queue in queues - self.queues:
+            try:
+                control.add_consumer(queue, destination=[self.nodename], reply=False)
+                self.queues.add(queue)
+                logger.info("worker subscribed to model queue=%s", queue)
+            except Exception as e:
+                logger.warning("failed to subscribe queue=%s error=%s", queue, e)
+
+        for queue in self.queues - queues:
+            try:
+                control.cancel_consumer(queue, destination=[self.nodename], reply=False)
+                self.queues.discard(queue)
+                logger.info("worker unsubscribed from model queue=%s", queue)
+            except Exception as e:
+                logger.warning("failed to unsubscribe queue=%s error=%s", queue, e)
+
+    def start_sync(self, list_models: Callable[[], dict]):
+        """Keep model queues in sync with the local models listed by `list_models`, i.e.: `ollama.list()`."""
+        logger.info("model queues sync setup starting nodename=%s", self.nodename)
+
+        def run_periodically():
+            while True:
+                time.sleep(OSHEPHERD_MODEL_QUEUES_SYNC_INTERVAL)
+                try:
+                    self.sync(list_models())
+                except Exception as e:
+                    logger.exception("model queues sync failed error=%s", e)
+
+        thread = threading.Thread(target=run_periodically)
+        thread.daemon = True
+        thread.start()
+
+        logger.info("model queues sync setup finished nodename=%s", self.nodename)
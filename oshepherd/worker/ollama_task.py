@@ -1,9 +1,19 @@
 from celery import Task as CeleryTask
+from celery import states
 from redis.exceptions import ConnectionError as RedisConnectionError
 from amqp.exceptions import RecoverableConnectionError as AMQPConnectionError
 from httpx import ConnectError
+from oshepherd.common.redis_service import RedisService
+from oshepherd.common.lib import load_and_validate_env
+from oshepherd.common.queues import OSHEPHERD_TASK_KINDS
+from oshepherd.worker.config import WorkerConfig
+from oshepherd.worker.worker_data import WorkerData
+from oshepherd.worker.blob_resolver import BlobResolver
+from oshepherd.common import json_codec
 import logging
 
+# API processes ask for completion notifications through `reply_to` channels with this prefix
+OSHEPHERD_DONE_CHANNEL_PREFIX = "oshepherd:done:"
 logger = logging.getLogger(__name__)
 
 
@@ -32,6 +42,37 @@ class OllamaCeleryTask(CeleryTask):
     retry_backoff = True
     retry_backoff_max = 60
     retry_jitter = True
+    _redis_service = None
+    _worker_data = None
+    _blob_resolver = None
+    # Task kinds taken by the pool running tasks, sharing its slots
+    pool_kinds = OSHEPHERD_TASK_KINDS
+
+    @property
+    def redis_service(self) -> RedisService:
+        """Redis service shared by every task run in this worker process."""
+        if self._redis_service is None:
+            self._redis_service = RedisService(
+                self.app.conf.result_backend, preflight_ping=False
+            )
+        return self._redis_service
+
+    @property
+    def worker_data(self) -> WorkerData:
+        """Worker data of this worker, as seen from the worker process running tasks."""
+        if self._worker_data is None:
+            self._worker_data = WorkerData(load_and_validate_env(WorkerConfig))
+        return self._worker_data
+
+    @property
+    def blob_resolver(self) -> BlobResolver:
+        """Blob resolver shared by every task run in this worker process."""
+        if self._blob_resolver is None:
+            config = load_and_validate_env(WorkerConfig)
+            self._blob_resolver = BlobResolver(
+                self.redis_service, config.BLOB_CACHE_MAX_BYTES
+            )
+        return self._blob_resolver
 
     def refresh_connections(self):
         """Refresh all worker connections when connection errors occur."""
@@ -63,8 +104,29 @@ class OllamaCeleryTask(CeleryTask):
         )
         self.refresh_connections()
 
+    def notify_completion(self, task_id, notification):
+        """Push the task outcome to the API process waiting for it, if any."""
+        reply_to = self.request.reply_to
+        if not reply_to or not reply_to.startswith(OSHEPHERD_DONE_CHANNEL_PREFIX):
+            return
+
+        try:
+            self.redis_service.publish(
+                reply_to,
+                json_codec.dumps_compressed({"task_id": task_id, **notification}),
+            )
+        except Exception as e:
+            # The API falls back to the result backend when notifications get lost
+            logger.warning(
+                "failed to notify completion task_id=%s channel=%s error=%s",
+                task_id,
+                reply_to,
+                e,
+            )
+
     def on_success(self, retval, task_id, args, kwargs):
         logger.info("completed task name=%s task_id=%s", self.name, task_id)
+        self.notify_completion(task_id, {"result": retval})
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         logger.error(
@@ -74,6 +136,20 @@ class OllamaCeleryTask(CeleryTask):
             exc,
             einfo,
         )
+        self.notify_completion(
+            task_id,
+            {"error": {"type": str(exc.__class__.__name__), "message": str(exc)}},
+        )
+
+    def before_start(self, task_id, args, kwargs):
+        # Advertise the taken slot, for the API to balance load among workers
+        self.worker_data.update_slots(self.pool_kinds, 1)
+
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        self.worker_data.update_slots(self.pool_kinds, -1)
+        # Tasks load and unload models, publish it without waiting for the next data push
+        if status != states.RETRY:
+            self.worker_data.push_ps(getattr(self.request, "model", None))
 
     def run(self, *args, **kwargs):
         raise NotImplementedError("Tasks must implement its run method")
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from typing import List, Optional
+from oshepherd.common import json_codec
+from oshepherd.common.redis_service import RedisService
+from oshepherd.common.stream_frames import encode_frame
+from oshepherd.worker.config import WorkerConfig
+
+OSHEPHERD_STREAM_PREFIX = "oshepherd:stream:"
+# Fraction of the stream ttl after which appending a message refreshes it
+OSHEPHERD_STREAM_TTL_REFRESH_RATIO = 0.5
+logger = logging.getLogger(__name__)
+
+
+class StreamPublisher:
+    """
+    Publishes the chunks of a streaming task, for the API to relay them to its client.
+    Transports:
+        1. pubsub: chunks are published to the `oshepherd:stream:{task_id}` channel, fire and forget.
+        2. streams: chunks are appended to the `oshepherd:stream:{task_id}` Redis Stream, so readers
+           can start at any chunk, and resume after reconnecting until the stream expires.
+    Chunks are batched into a single message, framed NDJSON lines relayed by the API as they are (see
+    `oshepherd.common.stream_frames`), following a flush policy:
+        1. the first chunk after `STREAM_BATCH_MAX_MS` without publishing is sent right away.
+        2. the following ones are held up to `STREAM_BATCH_MAX_MS`, `STREAM_BATCH_MAX_CHUNKS` or
+           `STREAM_BATCH_MAX_BYTES`, whatever comes first.
+        3. the final chunk flushes every held one.
+    Held chunks are only dropped once published. A failed timer flush is retried by the next `publish` or
+    `close`, in the task thread, which raises if it fails again.
+    Redis Stream entry ids are `0-{n}`, `n` being the number of chunks published up to the last one in the
+    entry, so readers keep resuming after any chunk.
+    """
+
+    def __init__(
+        self,
+        redis_service: RedisService,
+        task_id: str,
+        config: WorkerConfig,
+        transport: str = "pubsub",
+    ):
+        self.redis_service = redis_service
+        self.name = f"{OSHEPHERD_STREAM_PREFIX}{task_id}"
+        self.transport = transport
+        self.maxlen = config.STREAM_MAXLEN
+        self.ttl = config.STREAM_TTL
+        self.max_chunks = config.STREAM_BATCH_MAX_CHUNKS
+        self.max_bytes = config.STREAM_BATCH_MAX_BYTES
+        self.max_delay = config.STREAM_BATCH_MAX_MS / 1000
+        self.published = 0
+        self.messages = 0
+        self.done = False
+        # Chunks held for the next message, flushed by a timer at most `max_delay` after the last message
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        self._flushed_at = 0.0
+        self._expire_at = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._timer_error: Optional[Exception] = None
+        self._lock = threading.Lock()
+
+    def publish(self, chunk: dict):
+        message = json_codec.dumps(chunk)
+        with self._lock:
+            self.done = self.done or chunk.get("done") is True
+            self._pending.append(message)
+            self._pending_bytes += len(message)
+
+            elapsed = time.monotonic() - self._flushed_at
+            if (
+                self._timer_error is not None
+                or self.done
+                or elapsed >= self.max_delay
+                or len(self._pending) >= self.max_chunks
+                or self._pending_bytes >= self.max_bytes
+            ):
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(
+                    self.max_delay - elapsed, self._flush_on_timer
+                )
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            try:
+                self._flush()
+            except Exception as error:
+                # held chunks are kept, and flushed again from the task thread
+                logger.warning(
+                    "stream flush failed name=%s chunks=%s error=%s",
+                    self.name,
+                    len(self._pending),
+                    error,
+                )
+                self._timer_error = error
+
+    def close(self):
+        """Flush held chunks, once the task stops producing them."""
+        self.flush()
+        logger.debug(
+            "stream published name=%s chunks=%s messages=%s",
+            self.name,
+            self.published,
+            self.messages,
+        )
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        chunks = len(self._pending)
+        message = encode_frame(self._pending, self.done)
+        if self.transport == "streams":
+            # Expire on first and last message, and periodically in between, so streams running longer
+            # than their ttl don't expire mid-way. The stream lives on for resuming readers.
+            refresh_ttl = self.done or time.monotonic() >= self._expire_at
+            self.redis_service.xadd_chunk(
+                self.name,
+                message,
+                self.maxlen,
+                self.ttl if refresh_ttl else None,
+                entry_id=f"0-{self.published + chunks}",
+            )
+            if refresh_ttl:
+                self._expire_at = (
+                    time.monotonic() + self.ttl * OSHEPHERD_STREAM_TTL_REFRESH_RATIO
+                )
+        else:
+            self.redis_service.publish(self.name, message)
+        self._pending, self._pending_bytes = [], 0
+        self._timer_error = None
+        self.published += chunks
+        self.messages += 1
+        self._flushed_at = time.monotonic()
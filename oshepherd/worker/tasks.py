@@ -1,12 +1,14 @@
-import json
 import logging
 import ollama
 from oshepherd.worker.app import celery_app
 from oshepherd.worker.ollama_task import OllamaCeleryTask
 from oshepherd.common.ollama import serialize_ollama_res
+from oshepherd.common.embeddings_encoding import pack_response
 from oshepherd.common.redis_service import RedisService
+from oshepherd.worker.stream_publisher import StreamPublisher
 from oshepherd.worker.config import WorkerConfig
 from oshepherd.common.lib import load_and_validate_env
+from oshepherd.common import json_codec
 
 logger = logging.getLogger(__name__)
 
@@ -18,15 +20,20 @@ logger = logging.getLogger(__name__)
 )
 def exec_completion(self, request_str: str):
     is_streaming = False
-    redis_service = None
-    stream_channel = None
+    stream_publisher = None
     task_id = self.request.id
     try:
-        request = json.loads(request_str)
+        request = json_codec.loads(request_str)
         logger.debug("exec_completion request task_id=%s payload=%s", task_id, request)
         req_type = request["type"]
         req_payload = request["payload"]
+        # large fields may have been offloaded to Redis by the API, listed in `blobs`
+        if request.get("blobs"):
+            req_payload = self.blob_resolver.resolve(req_payload, request["blobs"])
         is_streaming = req_payload.get("stream", False)
+        # model used, for `after_return` to tell whether ps data may have changed
+        self.request.model = req_payload.get("model")
+        stream_transport = request.get("stream_transport", "pubsub")
         logger.info(
             "exec_completion started task_id=%s type=%s stream=%s model=%s",
             task_id,
@@ -38,20 +45,24 @@ def exec_completion(self, request_str: str):
         # Initialize Redis service for streaming
         if is_streaming:
             config = load_and_validate_env(WorkerConfig)
-            redis_service = RedisService(config.CELERY_BACKEND_URL)
-            stream_channel = f"oshepherd:stream:{task_id}"
+            redis_service = RedisService(
+                config.CELERY_BACKEND_URL, preflight_ping=False
+            )
+            stream_publisher = StreamPublisher(
+                redis_service, task_id, config, stream_transport
+            )
             logger.debug(
-                "streaming enabled task_id=%s channel=%s", task_id, stream_channel
+                "streaming enabled task_id=%s channel=%s transport=%s",
+                task_id,
+                stream_publisher.name,
+                stream_transport,
             )
 
         if req_type == "generate":
             if is_streaming:
-                # Stream responses via Redis Pub/Sub
+                # Stream responses via Redis Pub/Sub or Redis Streams
                 for chunk in ollama.generate(**req_payload):
-                    serializable_chunk = serialize_ollama_res(chunk)
-                    redis_service.publish(
-                        stream_channel, json.dumps(serializable_chunk)
-                    )
+                    stream_publisher.publish(serialize_ollama_res(chunk))
 
                 # Return success indicator for the celery task
                 serializable_response = {"status": "streaming_completed"}
@@ -61,12 +72,9 @@ def exec_completion(self, request_str: str):
 
         elif req_type == "chat":
             if is_streaming:
-                # Stream responses via Redis Pub/Sub
+                # Stream responses via Redis Pub/Sub or Redis Streams
                 for chunk in ollama.chat(**req_payload):
-                    serializable_chunk = serialize_ollama_res(chunk)
-                    redis_service.publish(
-                        stream_channel, json.dumps(serializable_chunk)
-                    )
+                    stream_publisher.publish(serialize_ollama_res(chunk))
 
                 # Return success indicator for the celery task
                 serializable_response = {"status": "streaming_completed"}
@@ -83,9 +91,25 @@ def exec_completion(self, request_str: str):
                 keep_alive=req_payload.get("keep_alive"),
             )
             serializable_response = serialize_ollama_res(response)
+
+        elif req_type == "embed":
+            # batch of inputs, possibly coalesced from several API requests
+            response = ollama.embed(**req_payload)
+            serializable_response = serialize_ollama_res(response)
         else:
             raise ValueError(f"Unsupported request type: {req_type}")
 
+        # publish held chunks, failing the task if they can't be
+        if stream_publisher:
+            stream_publisher.close()
+
+        # embeddings travel packed through Redis when the API asks for it
+        embeddings_encoding = request.get("embeddings_encoding")
+        if embeddings_encoding and req_type in ("embed", "embeddings"):
+            serializable_response = pack_response(
+                serializable_response, embeddings_encoding
+            )
+
         logger.info("exec_completion completed task_id=%s type=%s", task_id, req_type)
     except Exception as error:
         logger.exception(
@@ -98,13 +122,13 @@ def exec_completion(self, request_str: str):
             "error": {"type": str(error.__class__.__name__), "message": str(error)}
         }
 
-        if is_streaming and redis_service:
+        if is_streaming and stream_publisher:
             try:
                 error_chunk = {
                     "error": serializable_response["error"]["message"],
                     "done": True,
                 }
-                redis_service.publish(stream_channel, json.dumps(error_chunk))
+                stream_publisher.publish(error_chunk)
             except Exception as publish_error:
                 logger.exception(
                     "error publishing failure to stream task_id=%s error=%s",
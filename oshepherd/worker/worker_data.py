@@ -1,4 +1,4 @@
-import json
+import hashlib
 import logging
 import ollama
 import socket
@@ -9,11 +9,30 @@ import requests
 from datetime import datetime, timezone
 from oshepherd.worker.config import WorkerConfig
 from oshepherd.common.redis_service import RedisService
+from oshepherd.common.queues import (
+    OSHEPHERD_GENERATION_KIND,
+    OSHEPHERD_TASK_KINDS,
+    normalize_model_name,
+)
+from oshepherd.common import json_codec
 
 OSHEPHERD_WORKER_HOSTNAME = socket.gethostname()
 OSHEPHERD_WORKER_UUID = uuid.uuid4().hex
 OSHEPHERD_WORKER_DATA_PUSH_INTERVAL = 10  # secs
 OSHEPHERD_WORKERS_PREFIX_KEY = "oshepherd_worker:"
+# Sorted set of worker ids scored by their last heartbeat epoch
+OSHEPHERD_WORKERS_INDEX_KEY = "oshepherd_workers"
+# Worker data outlives a few missed pushes, then expires along with its index entry
+OSHEPHERD_WORKER_DATA_TTL = 120  # secs
+# Every field is rewritten at this interval even if unchanged, other pushes only write changed sections
+OSHEPHERD_WORKER_FULL_PUSH_INTERVAL = 300  # secs
+OSHEPHERD_WORKER_SECTIONS = ("version", "tags", "ps")
+# Show data is shared by all workers holding a model, keyed by model digest
+OSHEPHERD_MODELS_PREFIX_KEY = "oshepherd_model:"
+OSHEPHERD_MODEL_DATA_TTL = 3600  # secs
+OSHEPHERD_WORKER_HEARTBEAT_FIELDS = ("heartbeat", "heartbeat_ts")
+# ps fields telling which models are loaded, others like `expires_at` change on every request
+OSHEPHERD_WORKER_PS_STABLE_FIELDS = ("model", "name", "digest", "size_vram")
 logger = logging.getLogger(__name__)
 
 
@@ -23,10 +42,25 @@ class WorkerData:
         self.backend_url = config.CELERY_BACKEND_URL
         self.config = config
         self.ollama_base_url = config.OLLAMA_BASE_URL
-        self.redis_service = RedisService(self.backend_url)
+        self.redis_service = RedisService(self.backend_url, preflight_ping=False)
         self.hostname = OSHEPHERD_WORKER_HOSTNAME
         self.worker_uuid = OSHEPHERD_WORKER_UUID
         self.worker_id = f"{self.hostname}-{self.worker_uuid}"
+        self.worker_key = f"{OSHEPHERD_WORKERS_PREFIX_KEY}{self.worker_id}"
+        # Fingerprint of each section as last written to Redis
+        self._fingerprints = {}
+        self._last_full_push = None
+        # Models loaded as of the last ps read by this process, and when it was read
+        self._ps_models = set()
+        self._ps_read_at = None
+        # Show data by model name, along with the model digest it was fetched for
+        self._show_cache = {}
+        # Digests whose show data was already published to the shared models namespace
+        self._published_digests = set()
+        self._version_res = None
+        self._version_fetched_at = None
+        # Concurrency of the worker pool taking each task kind, none for kinds not consumed
+        self.pools = {OSHEPHERD_GENERATION_KIND: config.CONCURRENCY}
 
     def get_ollama_version(self):
         res = {}
@@ -110,23 +144,56 @@ class WorkerData:
             )
         return res
 
-    def get_ollama_show_map(self):
-        """Get show information for all available models."""
+    def get_cached_ollama_version(self):
+        """Ollama version only changes on restarts, fetched once every full push interval."""
+        if (
+            self._version_res is None
+            or self._version_res.get("error")
+            or time.monotonic() - self._version_fetched_at
+            > OSHEPHERD_WORKER_FULL_PUSH_INTERVAL
+        ):
+            self._version_res = self.get_ollama_version()
+            self._version_fetched_at = time.monotonic()
+        return self._version_res
+
+    def get_ollama_show_map(self, list_res=None):
+        """
+        Get show information for all available models.
+        Show data only changes along with the model digest, so it's only fetched for new or changed digests,
+        and dropped for removed models.
+        """
         show_map = {}
         try:
-            list_res = self.get_ollama_list()
+            if list_res is None:
+                list_res = self.get_ollama_list()
             models = list_res.get("models", [])
 
+            show_cache = {}
+            fetched = 0
             for model in models:
                 model_name = model.get("model")
-                if model_name:
+                if not model_name:
+                    continue
+
+                digest = model.get("digest")
+                cached = self._show_cache.get(model_name)
+                if cached and digest and cached[0] == digest:
+                    show_res = cached[1]
+                else:
                     show_res = self.get_ollama_show(model_name)
-                    show_map[model_name] = show_res
+                    fetched += 1
+
+                show_map[model_name] = show_res
+                # Errors are not cached, to be fetched again on next push
+                if digest and not show_res.get("error"):
+                    show_cache[model_name] = (digest, show_res)
 
+            self._show_cache = show_cache
             logger.debug(
-                "worker fetched show data worker_id=%s models=%s",
+                "worker fetched show data worker_id=%s models=%s fetched=%s",
                 self.worker_id,
                 len(show_map),
+                fetched,
             )
         except Exception as e:
             logger.exception("failed to fetch show data error=%s", e)
@@ -134,15 +201,15 @@ class WorkerData:
         return show_map
 
     def get_data(self):
-        version_res = self.get_ollama_version()
-        serialized_version_res = json.dumps(version_res, default=str)
+        version_res = self.get_cached_ollama_version()
+        serialized_version_res = json_codec.dumps_str(version_res)
         tags_list_res = self.get_ollama_list()
-        serialized_tags_list_res = json.dumps(tags_list_res, default=str)
+        serialized_tags_list_res = json_codec.dumps_str(tags_list_res)
         ps_res = self.get_ollama_ps()
-        serialized_ps_res = json.dumps(ps_res, default=str)
-        show_map = self.get_ollama_show_map()
-        serialized_show_map = json.dumps(show_map, default=str)
-        now = datetime.now(timezone.utc).isoformat()
+        serialized_ps_res = json_codec.dumps_str(ps_res)
+        # Show data is published apart, see `push_model_data`
+        self.get_ollama_show_map(tags_list_res)
+        now = datetime.now(timezone.utc)
 
         return {
             "worker_id": self.worker_id,
@@ -151,22 +218,213 @@ class WorkerData:
             "version": serialized_version_res,
             "tags": serialized_tags_list_res,
             "ps": serialized_ps_res,
-            "show": serialized_show_map,
-            "heartbeat": now,
+            **{
+                f"{kind}_concurrency": self.pools.get(kind, 0)
+                for kind in OSHEPHERD_TASK_KINDS
+            },
+            "heartbeat": now.isoformat(),
+            "heartbeat_ts": now.timestamp(),
         }
 
-    def push_data(self):
+    @staticmethod
+    def fingerprint(serialized_section):
+        return hashlib.sha1(serialized_section.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def fingerprint_ps(cls, ps_res):
+        """Fingerprint of the models loaded, ignoring fields changing on every request, like `expires_at`."""
+        if "models" not in ps_res:
+            return cls.fingerprint(json_codec.dumps_str(ps_res))
+
+        loaded = sorted(
+            (
+                [model.get(field) for field in OSHEPHERD_WORKER_PS_STABLE_FIELDS]
+                for model in ps_res["models"]
+            ),
+            key=str,
+        )
+        return cls.fingerprint(json_codec.dumps_str(loaded))
+
+    def section_fingerprint(self, field, serialized_section):
+        if field == "ps":
+            return self.fingerprint_ps(json_codec.loads(serialized_section))
+        return self.fingerprint(serialized_section)
+
+    def get_changed_data(self, worker_data, full=False):
+        """
+        Fields of `worker_data` to be written: heartbeat, plus sections whose fingerprint changed since
+        their last write. A full push includes every field.
+        """
+        changed_data = {}
+        fingerprints = {}
+        for field, value in worker_data.items():
+            if field in OSHEPHERD_WORKER_SECTIONS:
+                fingerprints[field] = self.section_fingerprint(field, value)
+                if full or fingerprints[field] != self._fingerprints.get(field):
+                    changed_data[field] = value
+            elif full or field in OSHEPHERD_WORKER_HEARTBEAT_FIELDS:
+                changed_data[field] = value
+
+        return changed_data, fingerprints
+
+    def push_data(self, full=False):
         try:
             worker_data = self.get_data()
-            self.redis_service.hset(
-                f"{OSHEPHERD_WORKERS_PREFIX_KEY}{self.worker_id}", mapping=worker_data
+            full = (
+                full
+                or self._last_full_push is None
+                or time.monotonic() - self._last_full_push
+                > OSHEPHERD_WORKER_FULL_PUSH_INTERVAL
+            )
+            changed_data, fingerprints = self.get_changed_data(worker_data, full)
+            heartbeat_ts = worker_data["heartbeat_ts"]
+            with self.redis_service.pipeline() as batch:
+                batch.hset(self.worker_key, mapping=changed_data)
+                batch.expire(self.worker_key, OSHEPHERD_WORKER_DATA_TTL)
+                batch.zadd(OSHEPHERD_WORKERS_INDEX_KEY, {self.worker_id: heartbeat_ts})
+                # Prune index entries of workers whose data already expired
+                batch.zremrangebyscore(
+                    OSHEPHERD_WORKERS_INDEX_KEY,
+                    "-inf",
+                    heartbeat_ts - OSHEPHERD_WORKER_DATA_TTL,
+                )
+
+            # Heartbeat fields always exist, unless the hash expired and got recreated partially
+            if not full and batch.results[0] > 0:
+                logger.warning(
+                    "worker data missing, pushing all fields worker_id=%s",
+                    self.worker_id,
+                )
+                return self.push_data(full=True)
+
+            self._fingerprints = fingerprints
+            self.push_model_data(full)
+            if full:
+                self._last_full_push = time.monotonic()
+            logger.debug(
+                "worker data pushed worker_id=%s fields=%s",
+                self.worker_id,
+                list(changed_data.keys()),
             )
-            logger.debug("worker data pushed worker_id=%s", self.worker_id)
         except Exception as e:
             logger.exception(
                 "data push failed worker_id=%s error=%s", self.worker_id, e
             )
 
+    def push_model_data(self, full=False):
+        """
+        Publish show data of local models under `oshepherd_model:{digest}`, a namespace shared by every worker
+        holding the same model, so each model is stored once cluster-wide. Only digests not published yet are
+        written; a full push refreshes the expiry of all of them, writing back any that went missing.
+        """
+        show_by_digest = {digest: show for digest, show in self._show_cache.values()}
+        if full:
+            digests = list(show_by_digest.keys())
+            with self.redis_service.pipeline() as batch:
+                for digest in digests:
+                    batch.expire(
+                        f"{OSHEPHERD_MODELS_PREFIX_KEY}{digest}",
+                        OSHEPHERD_MODEL_DATA_TTL,
+                    )
+            missing = [
+                digest for digest, found in zip(digests, batch.results) if not found
+            ]
+        else:
+            missing = [
+                digest
+                for digest in show_by_digest.keys()
+                if digest not in self._published_digests
+            ]
+
+        with self.redis_service.pipeline() as batch:
+            for digest in missing:
+                batch.set(
+                    f"{OSHEPHERD_MODELS_PREFIX_KEY}{digest}",
+                    json_codec.dumps(show_by_digest[digest]),
+                    ex=OSHEPHERD_MODEL_DATA_TTL,
+                )
+
+        self._published_digests = set(show_by_digest.keys())
+        if missing:
+            logger.debug(
+                "worker model data pushed worker_id=%s digests=%s",
+                self.worker_id,
+                len(missing),
+            )
+
+    def push_ps(self, model=None):
+        """
+        Push ps data right away, i.e.: once a task loaded or unloaded a model. Skipped if the task `model` was
+        already loaded as of the last ps read, less than a data push interval ago.
+        """
+        if (
+            model
+            and normalize_model_name(model) in self._ps_models
+            and time.monotonic() - self._ps_read_at
+            < OSHEPHERD_WORKER_DATA_PUSH_INTERVAL
+        ):
+            return
+
+        try:
+            ps_res = self.get_ollama_ps()
+            self._ps_models = {
+                name
+                for loaded in ps_res.get("models", [])
+                for name in (loaded.get("model"), loaded.get("name"))
+                if name
+            }
+            self._ps_read_at = time.monotonic()
+            fingerprint = self.fingerprint_ps(ps_res)
+            if fingerprint == self._fingerprints.get("ps"):
+                return
+
+            serialized_ps_res = json_codec.dumps_str(ps_res)
+            if self.redis_service.hset(self.worker_key, "ps", serialized_ps_res) > 0:
+                # Worker data is missing, leave it to the next full data push
+                self.redis_service.delete(self.worker_key)
+                return
+
+            self._fingerprints["ps"] = fingerprint
+            logger.debug("worker ps pushed worker_id=%s", self.worker_id)
+        except Exception as e:
+            logger.exception("ps push failed worker_id=%s error=%s", self.worker_id, e)
+
+    def reset_slots(self):
+        """Advertise every task slot as free, before the worker pools start taking tasks."""
+        try:
+            slots = {}
+            for kind in OSHEPHERD_TASK_KINDS:
+                slots[f"{kind}_in_flight"] = 0
+                slots[f"{kind}_free_slots"] = self.pools.get(kind, 0)
+            with self.redis_service.pipeline() as batch:
+                batch.hset(self.worker_key, mapping=slots)
+                batch.expire(self.worker_key, OSHEPHERD_WORKER_DATA_TTL)
+        except Exception as e:
+            logger.exception(
+                "slots reset failed worker_id=%s error=%s", self.worker_id, e
+            )
+
+    def update_slots(self, kinds, delta):
+        """
+        Account `delta` tasks as started, or finished if negative, in the slots of every task kind taken by
+        the pool running them. Counters are incremented in place, as tasks run in several worker processes.
+        """
+        try:
+            with self.redis_service.pipeline() as batch:
+                for kind in kinds:
+                    batch.hincrby(self.worker_key, f"{kind}_in_flight", delta)
+                    batch.hincrby(self.worker_key, f"{kind}_free_slots", -delta)
+            logger.debug(
+                "worker slots updated worker_id=%s kinds=%s in_flight=%s free_slots=%s",
+                self.worker_id,
+                ",".join(kinds),
+                *batch.results[:2],
+            )
+        except Exception as e:
+            logger.exception(
+                "slots update failed worker_id=%s error=%s", self.worker_id, e
+            )
+
     def start_data_push(self):
         logger.info("worker data push setup starting worker_id=%s", self.worker_id)
 
@@ -29,10 +29,15 @@ setup(
             "twine"
         ],
         'tests': [
-            "pytest"
+            "pytest",
+            "fakeredis"
         ],
         'lint': [
             "black"
+        ],
+        'fast': [
+            "orjson",
+            "zstandard"
         ]
     },
     entry_points={
@@ -0,0 +1,193 @@
+"""
+Unit tests for the offloading of large request fields to blobs, and their resolution by workers.
+"""
+
+import asyncio
+import copy
+import json
+from types import SimpleNamespace
+from typing import Any, Dict
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from pydantic import BaseModel
+from oshepherd.api.blob_store import BlobStore
+from oshepherd.common import blobs
+from oshepherd.common.redis_service import RedisPoolExhaustedError, RedisService
+from oshepherd.worker.blob_resolver import BlobResolver
+
+BACKEND_URL = "redis://localhost:6379/0"
+IMAGE = "iVBORw0KGgo" * 100
+PAYLOAD = {
+    "model": "llava",
+    "messages": [
+        {"role": "user", "content": "What is in this picture?", "images": [IMAGE]},
+        {"role": "assistant", "content": "A cat."},
+        {"role": "user", "content": "And in this one?", "images": [IMAGE]},
+    ],
+    "context": list(range(300)),
+    "options": {"temperature": 0},
+}
+
+
+class TaskRequest(BaseModel):
+    type: str
+    payload: Dict[str, Any]
+
+
+@pytest.fixture
+def redis_server():
+    return fakeredis.FakeServer()
+
+
+def get_blob_store(redis_server) -> BlobStore:
+    config = SimpleNamespace(
+        BLOB_STORE=True,
+        BLOB_THRESHOLD=256,
+        BLOB_TTL=3600,
+        CELERY_BACKEND_URL=BACKEND_URL,
+    )
+    blob_store = BlobStore(config)
+    blob_store.redis_service.redis_client = fakeredis.aioredis.FakeRedis(
+        server=redis_server
+    )
+    return blob_store
+
+
+def get_blob_resolver(redis_server, max_bytes: int = 1024 * 1024) -> BlobResolver:
+    redis_service = RedisService(BACKEND_URL, preflight_ping=False)
+    redis_service.redis_client = fakeredis.FakeRedis(server=redis_server)
+    return BlobResolver(redis_service, max_bytes)
+
+
+def offload_request(redis_server) -> dict:
+    request = TaskRequest(type="chat", payload=PAYLOAD)
+    return json.loads(asyncio.run(get_blob_store(redis_server).offload(request)))
+
+
+def test_offload_resolve_round_trip():
+    offloaded, refs = {}, []
+    payload = blobs.offload(copy.deepcopy(PAYLOAD), 256, offloaded, refs)
+
+    assert payload["messages"][0]["images"][0] == {
+        blobs.OSHEPHERD_BLOB_REF: refs[0]["digest"]
+    }
+    assert payload["context"] == {blobs.OSHEPHERD_BLOB_REF: refs[-1]["digest"]}
+    assert [ref["path"] for ref in refs] == [
+        ["messages", 0, "images", 0],
+        ["messages", 2, "images", 0],
+        ["context"],
+    ]
+    assert blobs.resolve(payload, refs, offloaded) == PAYLOAD
+
+
+def test_offload_keeps_small_values():
+    offloaded, refs = {}, []
+    payload = blobs.offload(copy.deepcopy(PAYLOAD), 256, offloaded, refs)
+
+    assert payload["model"] == PAYLOAD["model"]
+    assert payload["messages"][1] == PAYLOAD["messages"][1]
+    assert payload["options"] == PAYLOAD["options"]
+
+
+def test_offload_stores_identical_blobs_once():
+    offloaded, refs = {}, []
+    blobs.offload(copy.deepcopy(PAYLOAD), 256, offloaded, refs)
+
+    assert len(refs) == 3
+    assert len(offloaded) == 2
+    assert refs[0]["digest"] == refs[1]["digest"]
+
+
+def test_offload_below_threshold_is_a_no_op():
+    offloaded, refs = {}, []
+    payload = blobs.offload(copy.deepcopy(PAYLOAD), 1024 * 1024, offloaded, refs)
+
+    assert payload == PAYLOAD
+    assert not offloaded and not refs
+
+
+def test_resolve_skips_values_looking_like_references():
+    # A structured output schema may well have a property named after the reference key
+    payload = {
+        "model": "llama3",
+        "prompt": "Describe the blob.",
+        "format": {
+            "type": "object",
+            "properties": {blobs.OSHEPHERD_BLOB_REF: {"type": "string"}},
+        },
+        "images": [IMAGE],
+    }
+    offloaded, refs = {}, []
+    offloaded_payload = blobs.offload(copy.deepcopy(payload), 256, offloaded, refs)
+
+    assert [ref["path"] for ref in refs] == [["images", 0]]
+    assert blobs.resolve(offloaded_payload, refs, offloaded) == payload
+
+
+def test_resolve_without_references():
+    payload = copy.deepcopy(PAYLOAD)
+
+    assert blobs.resolve(payload, [], {}) == PAYLOAD
+
+
+def test_blob_store_disabled(redis_server):
+    blob_store = get_blob_store(redis_server)
+    blob_store.enabled = False
+    request = TaskRequest(type="chat", payload=PAYLOAD)
+
+    request_str = asyncio.run(blob_store.offload(request))
+    assert json.loads(request_str) == request.model_dump(mode="json")
+
+
+def test_blob_store_failure_sends_fields_inline(redis_server):
+    class BrokenClient:
+        def pipeline(self, transaction=False):
+            raise RedisPoolExhaustedError("No connection available.")
+
+    blob_store = get_blob_store(redis_server)
+    blob_store.redis_service.redis_client = BrokenClient()
+    request = TaskRequest(type="chat", payload=PAYLOAD)
+
+    request_data = json.loads(asyncio.run(blob_store.offload(request)))
+    assert request_data == request.model_dump(mode="json")
+    assert "blobs" not in request_data
+
+
+def test_blob_store_to_blob_resolver(redis_server):
+    request_data = offload_request(redis_server)
+    assert len(request_data["blobs"]) == 3
+    assert IMAGE not in json.dumps(request_data)
+
+    blob_resolver = get_blob_resolver(redis_server)
+    payload = blob_resolver.resolve(request_data["payload"], request_data["blobs"])
+    assert payload == PAYLOAD
+
+
+def test_blob_resolver_caches_blobs(redis_server):
+    request_data = offload_request(redis_server)
+    blob_resolver = get_blob_resolver(redis_server)
+    blob_resolver.resolve(copy.deepcopy(request_data["payload"]), request_data["blobs"])
+
+    # Blobs are served from the local cache once fetched
+    fakeredis.FakeRedis(server=redis_server).flushall()
+    payload = blob_resolver.resolve(request_data["payload"], request_data["blobs"])
+    assert payload == PAYLOAD
+
+
+def test_blob_resolver_fails_on_expired_blobs(redis_server):
+    request_data = offload_request(redis_server)
+    fakeredis.FakeRedis(server=redis_server).flushall()
+
+    with pytest.raises(ValueError):
+        get_blob_resolver(redis_server).resolve(
+            request_data["payload"], request_data["blobs"]
+        )
+
+
+def test_blob_resolver_cache_is_bounded(redis_server):
+    request_data = offload_request(redis_server)
+    blob_resolver = get_blob_resolver(redis_server, max_bytes=2048)
+    blob_resolver.resolve(request_data["payload"], request_data["blobs"])
+
+    assert blob_resolver._cache_bytes <= 2048
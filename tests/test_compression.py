@@ -0,0 +1,112 @@
+"""
+Unit tests for the size-adaptive compression of task messages, results and stream frames.
+"""
+
+import os
+import threading
+import pytest
+from oshepherd.common import compression, json_codec
+
+DOCUMENT = {"response": "Why is the sky blue? " * 400, "done": True}
+
+
+@pytest.fixture(autouse=True)
+def enabled_compression():
+    compression.configure(True)
+    yield
+    compression.configure(False)
+
+
+def test_disabled_returns_data_as_is():
+    compression.configure(False)
+    data = json_codec.dumps(DOCUMENT)
+
+    assert compression.compress(data) is data
+
+
+def test_below_threshold_returns_data_as_is():
+    data = b'{"response":"short"}'
+
+    assert len(data) < compression.OSHEPHERD_COMPRESSION_THRESHOLD
+    assert compression.compress(data) is data
+
+
+def test_threshold_is_configurable():
+    data = b'{"response":"%s"}' % (b"a" * 200)
+    compression.configure(True, threshold=100)
+
+    assert compression.compress(data) is not data
+
+
+def test_incompressible_data_returned_as_is():
+    data = os.urandom(2 * compression.OSHEPHERD_COMPRESSION_THRESHOLD)
+
+    assert compression.compress(data) is data
+
+
+def test_compressed_with_codec_marker():
+    data = json_codec.dumps(DOCUMENT)
+    compressed = compression.compress(data)
+
+    marker = (
+        compression.OSHEPHERD_COMPRESSION_ZSTD
+        if compression.zstandard
+        else compression.OSHEPHERD_COMPRESSION_ZLIB
+    )
+    assert compressed[:1] == marker
+    assert len(compressed) < len(data)
+    assert compression.decompress(compressed) == data
+
+
+def test_zlib_fallback(monkeypatch):
+    monkeypatch.setattr(compression, "zstandard", None)
+    data = json_codec.dumps(DOCUMENT)
+    compressed = compression.compress(data)
+
+    assert compressed[:1] == compression.OSHEPHERD_COMPRESSION_ZLIB
+    assert compression.decompress(compressed) == data
+
+
+def test_markers_never_start_json():
+    for marker in (
+        compression.OSHEPHERD_COMPRESSION_ZLIB,
+        compression.OSHEPHERD_COMPRESSION_ZSTD,
+    ):
+        assert not marker.isspace()
+        assert marker not in b'{["-0123456789tfn'
+
+
+def test_uncompressed_data_decompressed_as_is():
+    data = json_codec.dumps(DOCUMENT)
+
+    assert compression.decompress(data) is data
+    assert compression.decompress("text") == "text"
+
+
+def test_compressed_document_round_trip():
+    data = json_codec.dumps_compressed(DOCUMENT)
+
+    assert json_codec.loads_compressed(data) == DOCUMENT
+
+
+def test_concurrent_threads_round_trip():
+    documents = [
+        json_codec.dumps({"thread": index, "response": f"token {index} " * 1000})
+        for index in range(8)
+    ]
+    errors = []
+
+    def round_trip(data):
+        try:
+            for _ in range(50):
+                assert compression.decompress(compression.compress(data)) == data
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=round_trip, args=(data,)) for data in documents]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
@@ -13,6 +13,7 @@ import ollama
 from oshepherd.api.generate.models import GenerateResponse
 from oshepherd.api.chat.models import ChatResponse
 from oshepherd.api.embeddings.models import EmbeddingsResponse
+from oshepherd.api.embed.models import EmbedResponse
 from oshepherd.api.tags.models import TagsResponse
 from oshepherd.api.version.models import VersionResponse
 from oshepherd.common.ollama import serialize_ollama_res
@@ -21,6 +22,7 @@ HOST = "http://127.0.0.1:5001"
 GENERATE_ENDPOINT = f"{HOST}/api/generate/"
 CHAT_ENDPOINT = f"{HOST}/api/chat/"
 EMBEDDINGS_ENDPOINT = f"{HOST}/api/embeddings/"
+EMBED_ENDPOINT = f"{HOST}/api/embed/"
 TAGS_ENDPOINT = f"{HOST}/api/tags/"
 VERSION_ENDPOINT = f"{HOST}/api/version/"
 SHOW_ENDPOINT = f"{HOST}/api/show/"
@@ -38,6 +40,15 @@ def test_health_endpoint():
     assert res_json == {'status': 200}, "response should not be empty"
 
 
+def test_metrics_endpoint():
+    response = requests.get(f"{HOST}/metrics", headers=req_headers)
+
+    assert response.status_code == 200
+    res_json = response.json()
+    assert "counters" in res_json
+    assert "scheduled" in res_json["scheduler"]
+
+
 def test_basic_generate_completion_using_ollama():
     params = {"model": "mistral", "prompt": "Why is the sky blue?"}
     client = ollama.Client(host=HOST)
@@ -98,16 +109,28 @@ def test_basic_embeddings_using_requests():
 
 
 def test_basic_embeddings_using_ollama():
-    # ponytail: calls Ollama directly (not oshepherd) since client.embed() hits /api/embed which oshepherd doesn't route
     params = {
         "model": "embeddinggemma",
         "input": "The sky is blue because of rayleigh scattering",
     }
-    client = ollama.Client()
+    client = ollama.Client(host=HOST)
     ollama_res = client.embed(**params)
     assert len(ollama_res.embeddings[0]) > 0, "response should not be empty"
 
 
+def test_batch_embed_using_requests():
+    data = {
+        "model": "embeddinggemma",
+        "input": ["The sky is blue", "The grass is green", "The sun is yellow"],
+    }
+    response = requests.post(EMBED_ENDPOINT, headers=req_headers, data=json.dumps(data))
+
+    assert response.status_code == 200
+    ollama_res = EmbedResponse(**response.json())
+    assert len(ollama_res.embeddings) == 3, "one embedding per input expected"
+    assert all(len(embedding) > 0 for embedding in ollama_res.embeddings)
+
+
 def test_basic_tags_using_requests():
     response = requests.get(TAGS_ENDPOINT, headers=req_headers)
 
@@ -0,0 +1,159 @@
+"""
+Unit tests for the micro-batching and sharding of embed requests, with workers replaced by a fake task waiter.
+"""
+
+import asyncio
+import json
+import sys
+from types import SimpleNamespace
+import pytest
+from oshepherd.api.embed.models import EmbedPayload
+from oshepherd.api.embed_batcher import EmbedBatcher
+
+
+class FakeTaskWaiter:
+    """Task waiter answering each task with the result `respond` gives for its inputs and attempt."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.submitted = []
+
+    def submit(self, task, request_str, **options):
+        self.submitted.append(json.loads(request_str)["payload"]["input"])
+        return SimpleNamespace(id=f"task-{len(self.submitted)}")
+
+    async def wait(self, task):
+        inputs = self.submitted[int(task.id.split("-")[1]) - 1]
+        return self.respond(inputs, self.submitted.count(inputs))
+
+
+class FakeScheduler:
+
+    def get_queue(self, model_name, kind):
+        return "oshepherd.embeddings"
+
+    def track(self, task_id, queue, model_name=None, requeue=None):
+        pass
+
+    def release(self, task_id):
+        pass
+
+
+def embed_inputs(inputs, attempt):
+    return {
+        "model": "nomic-embed-text",
+        "embeddings": [[float(len(text))] for text in inputs],
+        "total_duration": 1000,
+        "prompt_eval_count": sum(len(text) for text in inputs),
+    }
+
+
+@pytest.fixture(autouse=True)
+def worker_tasks(monkeypatch):
+    # Shards are queued through the task waiter, the worker task itself is never called
+    monkeypatch.setitem(
+        sys.modules, "oshepherd.worker.tasks", SimpleNamespace(exec_completion=None)
+    )
+
+
+def get_embed_batcher(respond=embed_inputs, shard_size=64, shard_retries=1):
+    config = SimpleNamespace(
+        EMBED_BATCH_WINDOW=0.01,
+        EMBED_BATCH_MAX_INPUTS=256,
+        EMBED_SHARD_SIZE=shard_size,
+        EMBED_SHARD_RETRIES=shard_retries,
+        EMBEDDINGS_ENCODING=None,
+    )
+    embedding_cache = SimpleNamespace(get_keys=lambda *args: None)
+    return EmbedBatcher(
+        config, FakeTaskWaiter(respond), FakeScheduler(), embedding_cache
+    )
+
+
+def embed(embed_batcher, *inputs):
+    async def main():
+        return await asyncio.gather(
+            *(
+                embed_batcher.embed(EmbedPayload(model="nomic-embed-text", input=value))
+                for value in inputs
+            )
+        )
+
+    return asyncio.run(main())
+
+
+def test_empty_input():
+    embed_batcher = get_embed_batcher()
+
+    (ollama_res,) = embed(embed_batcher, [])
+    assert ollama_res == {"model": "nomic-embed-text", "embeddings": []}
+    assert not embed_batcher.task_waiter.submitted
+
+
+def test_split_back_in_input_order():
+    embed_batcher = get_embed_batcher(shard_size=2)
+
+    first, second, third = embed(embed_batcher, ["a", "bb", "ccc"], "dddd", ["eeeee"])
+    assert first["embeddings"] == [[1.0], [2.0], [3.0]]
+    assert second["embeddings"] == [[4.0]]
+    assert third["embeddings"] == [[5.0]]
+    # A single batch of 5 inputs, in shards of 2
+    assert embed_batcher.task_waiter.submitted == [
+        ["a", "bb"],
+        ["ccc", "dddd"],
+        ["eeeee"],
+    ]
+
+
+def test_shares_by_input_characters():
+    embed_batcher = get_embed_batcher()
+
+    first, second = embed(embed_batcher, ["aaa"], ["b"])
+    assert first["prompt_eval_count"] == 3
+    assert second["prompt_eval_count"] == 1
+    assert first["total_duration"] == 750
+    assert second["total_duration"] == 250
+
+
+def test_transient_shard_failure_retried():
+    def respond(inputs, attempt):
+        if attempt == 1:
+            return {"error": {"type": "ConnectionError", "message": "reset"}}
+        return embed_inputs(inputs, attempt)
+
+    embed_batcher = get_embed_batcher(respond=respond)
+
+    (ollama_res,) = embed(embed_batcher, ["a", "bb"])
+    assert ollama_res["embeddings"] == [[1.0], [2.0]]
+    assert len(embed_batcher.task_waiter.submitted) == 2
+
+
+def test_deterministic_shard_failure_not_retried():
+    def respond(inputs, attempt):
+        return {"error": {"type": "ResponseError", "message": "model not found"}}
+
+    embed_batcher = get_embed_batcher(respond=respond, shard_retries=3)
+
+    first, second = embed(embed_batcher, ["a"], ["b"])
+    assert first == second
+    assert first["error"]["type"] == "ResponseError"
+    assert len(embed_batcher.task_waiter.submitted) == 1
+
+
+def test_batch_failure_resolves_every_request():
+    def respond(inputs, attempt):
+        return {"embeddings": {"encoding": "bfloat8", "dims": 1, "data": ""}}
+
+    embed_batcher = get_embed_batcher(respond=respond)
+
+    async def main():
+        return await asyncio.wait_for(
+            asyncio.gather(
+                embed_batcher.embed(EmbedPayload(model="nomic-embed-text", input="a")),
+                embed_batcher.embed(EmbedPayload(model="nomic-embed-text", input="b")),
+            ),
+            timeout=5,
+        )
+
+    for ollama_res in asyncio.run(main()):
+        assert ollama_res["error"]["type"] == "KeyError"
@@ -0,0 +1,109 @@
+"""
+Unit tests for the packed encoding of embeddings, between workers and the API and in the embedding cache.
+"""
+
+import json
+from types import SimpleNamespace
+import pytest
+from oshepherd.api.embedding_cache import EmbeddingCache
+from oshepherd.common.embeddings_encoding import (
+    is_packed,
+    pack_floats,
+    pack_response,
+    pack_vectors,
+    unpack_floats,
+    unpack_response,
+    unpack_vectors,
+)
+
+VECTORS = [[0.5, -0.25, 1.0], [0.125, 0.0, -2.0]]
+
+
+@pytest.mark.parametrize("encoding, size", [("float32", 4), ("float16", 2)])
+def test_pack_floats_round_trip(encoding, size):
+    packed_encoding, data = pack_floats(VECTORS[0], encoding)
+
+    assert packed_encoding == encoding
+    assert len(data) == size * len(VECTORS[0])
+    assert unpack_floats(data, encoding) == VECTORS[0]
+
+
+def test_pack_floats_out_of_float16_range():
+    encoding, data = pack_floats([1e6, 0.5], "float16")
+
+    assert encoding == "float32"
+    assert unpack_floats(data, encoding) == [1e6, 0.5]
+
+
+def test_float16_loses_precision():
+    encoding, data = pack_floats([0.1], "float16")
+
+    assert unpack_floats(data, encoding) != [0.1]
+    assert unpack_floats(data, encoding) == pytest.approx([0.1], abs=1e-3)
+
+
+@pytest.mark.parametrize("encoding", ["float32", "float16"])
+def test_pack_vectors_round_trip(encoding):
+    packed = pack_vectors(VECTORS, encoding)
+
+    assert is_packed(packed)
+    assert packed["dims"] == 3
+    assert unpack_vectors(packed) == VECTORS
+
+
+def test_pack_vectors_empty():
+    assert unpack_vectors(pack_vectors([], "float32")) == []
+
+
+def test_pack_embed_response():
+    response = {"model": "nomic-embed-text", "embeddings": VECTORS}
+    packed = pack_response(response, "float32")
+
+    assert is_packed(packed["embeddings"])
+    assert json.loads(json.dumps(packed)) == packed
+    assert unpack_response(packed) == response
+
+
+def test_pack_embeddings_response():
+    response = {"embedding": VECTORS[0]}
+    packed = pack_response(response, "float32")
+
+    assert is_packed(packed["embedding"])
+    assert unpack_response(packed) == response
+
+
+def test_unpack_plain_response():
+    response = {"model": "nomic-embed-text", "embeddings": VECTORS}
+
+    assert unpack_response(response) == response
+
+
+def get_embedding_cache(encoding):
+    config = SimpleNamespace(
+        EMBEDDING_CACHE=True,
+        EMBEDDINGS_ENCODING=encoding,
+        CELERY_BACKEND_URL="redis://localhost:6379/0",
+        EMBEDDING_CACHE_TTL=3600,
+        EMBEDDING_CACHE_MAX_BYTES=1024 * 1024,
+    )
+    network_data = SimpleNamespace(get_model_digest=lambda model_name: "sha256:1")
+    return EmbeddingCache(config, network_data)
+
+
+def test_embedding_cache_keys_by_precision():
+    payload = {"model": "nomic-embed-text"}
+    float32_keys = get_embedding_cache(None).get_keys("embed", payload, ["a", "b"])
+    float16_keys = get_embedding_cache("float16").get_keys("embed", payload, ["a"])
+
+    assert len(set(float32_keys)) == 2
+    assert float16_keys[0] != float32_keys[0]
+    assert get_embedding_cache("float32").get_keys("embed", payload, ["a"]) == [
+        float32_keys[0]
+    ]
+
+
+def test_embedding_cache_entries_round_trip():
+    data = EmbeddingCache.pack(VECTORS[0])
+
+    assert len(data) == 4 * len(VECTORS[0])
+    assert EmbeddingCache.unpack(data) == VECTORS[0]
@@ -0,0 +1,63 @@
+"""
+Unit tests for the JSON codec of task messages, results, stream chunks and registry data.
+"""
+
+import datetime
+import json
+import pytest
+from kombu.serialization import dumps as kombu_dumps, loads as kombu_loads
+from oshepherd.common import compression, json_codec
+
+DOCUMENT = {"model": "mistral", "response": "¿Por qué?", "context": [1, 2, 3]}
+
+
+def test_round_trip():
+    data = json_codec.dumps(DOCUMENT)
+
+    assert isinstance(data, bytes)
+    assert json_codec.loads(data) == DOCUMENT
+    assert json_codec.loads(data.decode("utf-8")) == DOCUMENT
+    assert json_codec.loads(memoryview(data)) == DOCUMENT
+
+
+def test_compact_and_stdlib_compatible():
+    data = json_codec.dumps(DOCUMENT)
+
+    assert data == json.dumps(
+        DOCUMENT, separators=(",", ":"), ensure_ascii=False
+    ).encode("utf-8")
+    assert json_codec.dumps_str(DOCUMENT) == data.decode("utf-8")
+
+
+def test_unsupported_values_as_str():
+    value = datetime.date(2024, 5, 1)
+
+    assert json_codec.loads(json_codec.dumps({"date": value})) == {"date": str(value)}
+
+
+def test_decode_error():
+    with pytest.raises(json_codec.JSONDecodeError):
+        json_codec.loads(b"{not json")
+
+
+def test_compressed_round_trip():
+    document = {**DOCUMENT, "response": "token " * 2000}
+    compression.configure(True)
+    try:
+        data = json_codec.dumps_compressed(document)
+        assert len(data) < len(json_codec.dumps(document))
+        assert json_codec.loads_compressed(data) == document
+    finally:
+        compression.configure(False)
+
+    assert json_codec.loads_compressed(json_codec.dumps(document)) == document
+
+
+def test_kombu_serializer():
+    json_codec.register_kombu_serializer()
+    content_type, content_encoding, data = kombu_dumps(
+        DOCUMENT, serializer=json_codec.OSHEPHERD_KOMBU_SERIALIZER
+    )
+
+    assert content_type == "application/json"
+    assert kombu_loads(data, content_type, content_encoding) == DOCUMENT
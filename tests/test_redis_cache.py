@@ -0,0 +1,102 @@
+"""
+Unit tests for the bounded Redis cache shared by the API processes, using fakeredis.
+"""
+
+import asyncio
+import fakeredis
+import fakeredis.aioredis
+from oshepherd.api.redis_cache import RedisCache
+from oshepherd.common.metrics import metrics
+from oshepherd.common.redis_service import RedisPoolExhaustedError
+
+
+def get_cache(max_bytes: int = 1024, ttl: int = 3600) -> RedisCache:
+    cache = RedisCache("redis://localhost:6379/0", "test", ttl, max_bytes)
+    cache.redis_service.redis_client = fakeredis.aioredis.FakeRedis(
+        server=fakeredis.FakeServer()
+    )
+    return cache
+
+
+def test_get_set():
+    cache = get_cache()
+
+    async def main():
+        await cache.set_many({"a": b"1", "b": b"22"})
+        return await cache.get_many(["a", "b", "c"])
+
+    assert asyncio.run(main()) == [b"1", b"22", None]
+
+
+def test_empty_calls():
+    cache = get_cache()
+
+    async def main():
+        await cache.set_many({})
+        return await cache.get_many([])
+
+    assert asyncio.run(main()) == []
+
+
+def test_size_accounted_once_per_entry():
+    cache = get_cache()
+
+    async def main():
+        await cache.set_many({"a": b"1234"})
+        await cache.set_many({"a": b"1234"})
+        return await cache.redis_service.redis_client.get(cache.bytes_key)
+
+    assert int(asyncio.run(main())) == 4
+
+
+def test_evicts_least_recently_used():
+    cache = get_cache(max_bytes=250)
+
+    async def main():
+        await cache.set_many({"a": b"a" * 100})
+        await asyncio.sleep(0.01)
+        await cache.set_many({"b": b"b" * 100})
+        await asyncio.sleep(0.01)
+        # "a" is used again, so "b" is the least recently used one
+        await cache.get_many(["a"])
+        await asyncio.sleep(0.01)
+        await cache.set_many({"c": b"c" * 100})
+        return await cache.get_many(["a", "b", "c"])
+
+    a, b, c = asyncio.run(main())
+    assert a is not None
+    assert b is None
+    assert c is not None
+
+
+def test_failures_are_misses():
+    cache = get_cache()
+
+    class BrokenClient:
+        def pipeline(self, transaction=False):
+            raise ConnectionError("redis down")
+
+    cache.redis_service.redis_client = BrokenClient()
+    misses = metrics.get("test_cache_misses")
+    errors = metrics.get("test_cache_errors")
+
+    assert asyncio.run(cache.get_many(["a"])) == [None]
+    asyncio.run(cache.set_many({"a": b"1"}))
+    assert metrics.get("test_cache_misses") == misses
+    assert metrics.get("test_cache_errors") == errors + 2
+
+
+def test_pool_exhaustion_counted_apart():
+    cache = get_cache()
+
+    class BusyClient:
+        def pipeline(self, transaction=False):
+            raise RedisPoolExhaustedError("No connection available.")
+
+    cache.redis_service.redis_client = BusyClient()
+    misses = metrics.get("test_cache_misses")
+    exhausted = metrics.get("test_cache_pool_exhausted")
+
+    assert asyncio.run(cache.get_many(["a", "b"])) == [None, None]
+    assert metrics.get("test_cache_misses") == misses
+    assert metrics.get("test_cache_pool_exhausted") == exhausted + 1
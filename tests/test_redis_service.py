@@ -0,0 +1,42 @@
+"""
+Unit tests for the asyncio Redis connection pool shared by API components, using fakeredis connections.
+"""
+
+import asyncio
+import fakeredis
+import fakeredis.aioredis
+import pytest
+from redis.asyncio import Redis as AsyncRedis
+from oshepherd.common.redis_service import AsyncConnectionPool, RedisPoolExhaustedError
+
+
+def get_redis_client(max_connections: int, timeout: float):
+    pool = AsyncConnectionPool(
+        connection_class=fakeredis.aioredis.FakeAsyncRedisConnection,
+        server=fakeredis.FakeServer(),
+        max_connections=max_connections,
+        timeout=timeout,
+    )
+    return AsyncRedis.from_pool(pool)
+
+
+def test_callers_wait_for_a_free_connection():
+    redis_client = get_redis_client(max_connections=2, timeout=5)
+
+    async def main():
+        await asyncio.gather(*(redis_client.set(f"key{i}", i) for i in range(50)))
+        return await redis_client.dbsize()
+
+    assert asyncio.run(main()) == 50
+
+
+def test_pool_exhausted():
+    redis_client = get_redis_client(max_connections=1, timeout=0.1)
+
+    async def main():
+        # The single connection is held, i.e.: by a blocking read
+        await redis_client.connection_pool.get_connection()
+        await redis_client.get("key")
+
+    with pytest.raises(RedisPoolExhaustedError):
+        asyncio.run(main())
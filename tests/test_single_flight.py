@@ -0,0 +1,253 @@
+"""
+Unit tests for the coalescing of identical concurrent requests, and the shared streams they read.
+"""
+
+import asyncio
+from types import SimpleNamespace
+import pytest
+from oshepherd.api.single_flight import SharedStream, SingleFlight
+from oshepherd.api.stream_dispatcher import StreamMessage
+
+DETERMINISTIC = {"model": "mistral", "prompt": "Hi", "options": {"temperature": 0}}
+SAMPLED = {"model": "mistral", "prompt": "Hi"}
+
+
+class FakeDispatcher:
+    """Stream dispatcher relaying the messages put in each task queue."""
+
+    def __init__(self):
+        self.queues = {}
+        self.opened = []
+
+    def open(self, task_id, transport, offset=0):
+        self.queues[task_id] = asyncio.Queue()
+        self.opened.append((task_id, offset))
+
+    def put(self, task_id, data, done=False):
+        self.queues[task_id].put_nowait(StreamMessage(data, done))
+
+    async def stream(self, task_id, timeout=None):
+        while True:
+            message = await asyncio.wait_for(self.queues[task_id].get(), timeout)
+            if isinstance(message, Exception):
+                raise message
+            yield message
+            if message.done:
+                break
+
+
+class FakeScheduler:
+
+    def __init__(self):
+        self.released = []
+
+    def release(self, task_id):
+        self.released.append(task_id)
+
+
+def get_single_flight(enabled=True):
+    config = SimpleNamespace(SINGLE_FLIGHT=enabled, COMPLETION_TIMEOUT=5)
+    return SingleFlight(config, FakeScheduler(), FakeDispatcher())
+
+
+async def read(single_flight, task_id, offset=0):
+    return [message.data async for message in single_flight.stream(task_id, offset)]
+
+
+def test_get_key():
+    single_flight = get_single_flight()
+
+    assert single_flight.get_key("generate", DETERMINISTIC) == single_flight.get_key(
+        "generate", dict(reversed(DETERMINISTIC.items()))
+    )
+    assert single_flight.get_key("generate", DETERMINISTIC) != single_flight.get_key(
+        "chat", DETERMINISTIC
+    )
+    assert single_flight.get_key("generate", {**DETERMINISTIC, "options": {"seed": 1}})
+
+
+def test_get_key_skips_sampled_completions():
+    single_flight = get_single_flight()
+
+    assert single_flight.get_key("generate", SAMPLED) is None
+    assert single_flight.get_key("chat", SAMPLED) is None
+    assert single_flight.get_key("embeddings", SAMPLED) is not None
+
+
+def test_get_key_disabled():
+    assert get_single_flight(enabled=False).get_key("embed", SAMPLED) is None
+
+
+def test_run_joins_in_flight_request():
+    single_flight = get_single_flight()
+    key = single_flight.get_key("embed", SAMPLED)
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"embeddings": [[0.1]]}
+
+    async def main():
+        return await asyncio.gather(
+            single_flight.run(key, execute), single_flight.run(key, execute)
+        )
+
+    first, second = asyncio.run(main())
+    assert first == second == {"embeddings": [[0.1]]}
+    assert len(calls) == 1
+    assert single_flight.get_stats()["coalesced"] >= 1
+
+
+def test_run_without_key_never_joins():
+    single_flight = get_single_flight()
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        return {}
+
+    async def main():
+        await asyncio.gather(
+            single_flight.run(None, execute), single_flight.run(None, execute)
+        )
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_run_error_reaches_every_request():
+    single_flight = get_single_flight()
+    key = single_flight.get_key("embed", SAMPLED)
+
+    async def execute():
+        await asyncio.sleep(0.01)
+        raise ConnectionError("broker down")
+
+    async def main():
+        return await asyncio.gather(
+            single_flight.run(key, execute),
+            single_flight.run(key, execute),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ConnectionError) for result in results)
+    # A new request after the failure runs its own task
+    assert key not in single_flight._flights
+
+
+def test_submit_stream_joins_in_flight_stream():
+    single_flight = get_single_flight()
+    dispatcher = single_flight.stream_dispatcher
+    key = single_flight.get_key("generate", DETERMINISTIC)
+    submitted = []
+
+    def submit():
+        task_id = f"task-{len(submitted)}"
+        submitted.append(task_id)
+        dispatcher.open(task_id, "streams")
+        return task_id
+
+    async def main():
+        task_id = single_flight.submit_stream(key, submit)
+        assert single_flight.submit_stream(key, submit) == task_id
+
+        dispatcher.put(task_id, b'{"response":"a"}\n')
+        dispatcher.put(task_id, b'{"response":"b"}\n{"done":true}\n', done=True)
+        first, second = await asyncio.gather(
+            read(single_flight, task_id), read(single_flight, task_id)
+        )
+        assert first == second
+        assert b"".join(first).count(b"\n") == 3
+
+        # Late readers still get every chunk, while requests from now on run their own task
+        assert await read(single_flight, task_id) == first
+        assert single_flight.scheduler.released == [task_id]
+        assert single_flight.submit_stream(key, submit) != task_id
+
+    asyncio.run(main())
+    assert submitted == ["task-0", "task-1"]
+
+
+def test_stream_error_ends_every_reader():
+    single_flight = get_single_flight()
+    dispatcher = single_flight.stream_dispatcher
+
+    def submit():
+        dispatcher.open("task", "streams")
+        return "task"
+
+    async def main():
+        task_id = single_flight.submit_stream(None, submit)
+        dispatcher.put(task_id, b'{"response":"a"}\n')
+        dispatcher.queues[task_id].put_nowait(TimeoutError("no messages"))
+        return await asyncio.gather(
+            read(single_flight, task_id), read(single_flight, task_id)
+        )
+
+    for messages in asyncio.run(main()):
+        assert messages[0] == b'{"response":"a"}\n'
+        assert b"Streaming error" in messages[-1]
+    assert single_flight.scheduler.released == ["task"]
+
+
+def test_stream_unknown_task():
+    messages = asyncio.run(read(get_single_flight(), "unknown"))
+
+    assert len(messages) == 1
+    assert b"not found" in messages[0]
+
+
+def test_resume_reads_buffer_from_offset():
+    single_flight = get_single_flight()
+    dispatcher = single_flight.stream_dispatcher
+
+    def submit():
+        dispatcher.open("task", "streams")
+        return "task"
+
+    async def main():
+        task_id = single_flight.submit_stream(None, submit)
+        dispatcher.put(task_id, b"1\n2\n3\n")
+        dispatcher.put(task_id, b"4\n", done=True)
+        await asyncio.sleep(0)
+
+        # Streams read by this process aren't opened again
+        assert single_flight.resume(task_id, 2)
+        assert await read(single_flight, task_id, 2) == [b"3\n", b"4\n"]
+        assert await read(single_flight, task_id, 3) == [b"4\n"]
+        assert await read(single_flight, task_id, 4) == [b""]
+
+    asyncio.run(main())
+    assert dispatcher.opened == [("task", 0)]
+
+
+def test_resume_opens_streams_read_elsewhere():
+    single_flight = get_single_flight()
+    dispatcher = single_flight.stream_dispatcher
+
+    async def main():
+        assert single_flight.resume("task", 2)
+        dispatcher.put("task", b"3\n4\n", done=True)
+        assert await read(single_flight, "task", 2) == [b"3\n4\n"]
+
+        # Earlier chunks aren't buffered
+        assert not single_flight.resume("task", 1)
+
+    asyncio.run(main())
+    assert dispatcher.opened == [("task", 2)]
+
+
+@pytest.mark.parametrize(
+    "offset, expected",
+    [(0, [b"1\n2\n", b"3\n"]), (1, [b"2\n", b"3\n"]), (2, [b"3\n"])],
+)
+def test_shared_stream_read_offset(offset, expected):
+    async def main():
+        shared_stream = SharedStream("task")
+        shared_stream.append(StreamMessage(b"1\n2\n", False))
+        shared_stream.append(StreamMessage(b"3\n", True))
+        return [message.data async for message in shared_stream.read(offset)]
+
+    assert asyncio.run(main()) == expected
@@ -0,0 +1,79 @@
+"""
+Unit tests for the stream dispatcher queues, registered per streaming task and read by the API.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from oshepherd.api import stream_dispatcher
+from oshepherd.api.stream_dispatcher import (
+    OSHEPHERD_STREAM_CHANNEL_PREFIX,
+    StreamDispatcher,
+)
+from oshepherd.common.stream_frames import encode_frame
+
+CHANNEL = f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}task"
+
+
+def get_dispatcher(transport="pubsub"):
+    config = SimpleNamespace(
+        CELERY_BACKEND_URL="redis://localhost:6379/0", STREAM_TRANSPORT=transport
+    )
+    return StreamDispatcher(config)
+
+
+async def read(dispatcher, task_id):
+    return [message async for message in dispatcher.stream(task_id, timeout=1)]
+
+
+def test_stream_relays_until_final_chunk():
+    dispatcher = get_dispatcher()
+
+    async def main():
+        dispatcher.open("task", "pubsub")
+        dispatcher._dispatch(CHANNEL, encode_frame([b'{"done":false}'], False))
+        dispatcher._dispatch(CHANNEL, encode_frame([b'{"done":true}'], True))
+        return await read(dispatcher, "task")
+
+    messages = asyncio.run(main())
+    assert [message.done for message in messages] == [False, True]
+    assert "task" not in dispatcher._queues
+
+
+def test_stream_not_registered():
+    messages = asyncio.run(read(get_dispatcher(), "task"))
+
+    assert len(messages) == 1
+    assert messages[0].done
+    assert b"not registered" in messages[0].data
+
+
+def test_unread_queues_dropped(monkeypatch):
+    dispatcher = get_dispatcher()
+    dispatcher.open("task", "streams")
+    dispatcher.open("read", "streams")
+    dispatcher._unread.pop("read")
+
+    monkeypatch.setattr(stream_dispatcher, "OSHEPHERD_UNREAD_QUEUE_TTL", -1)
+    dispatcher._drop_unread()
+
+    assert "task" not in dispatcher._queues
+    assert f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}task" not in dispatcher._stream_offsets
+    assert "read" in dispatcher._queues
+
+
+def test_reader_falling_behind_fails_its_stream(monkeypatch):
+    monkeypatch.setattr(stream_dispatcher, "OSHEPHERD_STREAM_QUEUE_MAXSIZE", 2)
+    dispatcher = get_dispatcher()
+
+    async def main():
+        dispatcher.open("task", "pubsub")
+        queue = dispatcher._queues["task"]
+        for _ in range(3):
+            dispatcher._dispatch(CHANNEL, encode_frame([b'{"done":false}'], False))
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    messages = asyncio.run(main())
+    assert len(messages) == 1
+    assert messages[0].done
+    assert b"fell behind" in messages[0].data
+    assert "task" not in dispatcher._queues
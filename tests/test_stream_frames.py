@@ -0,0 +1,119 @@
+"""
+Unit tests for stream frames, as workers publish them and the API relays them, resumed reads included.
+"""
+
+import json
+from types import SimpleNamespace
+from oshepherd.api.stream_dispatcher import (
+    OSHEPHERD_STREAM_CHANNEL_PREFIX,
+    StreamDispatcher,
+)
+from oshepherd.common import compression
+from oshepherd.common.stream_frames import (
+    OSHEPHERD_FRAME_CHUNKS,
+    OSHEPHERD_FRAME_DONE,
+    decode_chunks,
+    decode_frame,
+    encode_frame,
+    split_lines,
+)
+
+CHUNKS = [
+    {"response": "The", "done": False},
+    {"response": " sky", "done": False},
+    {"response": "", "done": True, "eval_count": 2},
+]
+
+
+def encode_chunks(chunks):
+    return [json.dumps(chunk).encode("utf-8") for chunk in chunks]
+
+
+def get_dispatcher():
+    config = SimpleNamespace(
+        CELERY_BACKEND_URL="redis://localhost:6379/0", STREAM_TRANSPORT="streams"
+    )
+    return StreamDispatcher(config)
+
+
+def test_frame_round_trip():
+    message = encode_frame(encode_chunks(CHUNKS[:2]), False)
+    assert message[:1] == OSHEPHERD_FRAME_CHUNKS
+
+    data, done = decode_frame(message)
+    assert not done
+    assert decode_chunks(data) == CHUNKS[:2]
+
+
+def test_frame_round_trip_final_chunk():
+    message = encode_frame(encode_chunks(CHUNKS), True)
+    assert message[:1] == OSHEPHERD_FRAME_DONE
+
+    data, done = decode_frame(message)
+    assert done
+    assert decode_chunks(data) == CHUNKS
+
+
+def test_frame_round_trip_compressed():
+    compression.configure(True, threshold=64)
+    try:
+        chunks = [{"response": "token " * 50, "done": False}] * 4
+        message = encode_frame(encode_chunks(chunks), False)
+        assert message[:1] not in (OSHEPHERD_FRAME_CHUNKS, OSHEPHERD_FRAME_DONE)
+
+        data, done = decode_frame(message)
+        assert not done
+        assert decode_chunks(data) == chunks
+    finally:
+        compression.configure(False)
+
+
+def test_decode_legacy_messages():
+    data, done = decode_frame(json.dumps(CHUNKS[0]).encode("utf-8"))
+    assert not done
+    assert decode_chunks(data) == CHUNKS[:1]
+
+    data, done = decode_frame(json.dumps(CHUNKS).encode("utf-8"))
+    assert done
+    assert decode_chunks(data) == CHUNKS
+
+
+def test_split_lines_one_per_chunk():
+    data, _ = decode_frame(encode_frame(encode_chunks(CHUNKS), True))
+    lines = split_lines(data)
+
+    assert len(lines) == len(CHUNKS)
+    assert all(line.endswith(b"\n") for line in lines)
+    assert b"".join(lines) == data
+
+
+def test_dispatch_whole_message():
+    dispatcher = get_dispatcher()
+    dispatcher.open("task", "streams")
+    name = f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}task"
+
+    dispatcher._dispatch(name, encode_frame(encode_chunks(CHUNKS), True), 3)
+    message = dispatcher._queues["task"].get_nowait()
+    assert message.done
+    assert decode_chunks(message.data) == CHUNKS
+
+
+def test_dispatch_resumed_halfway_a_message():
+    # Resuming after the first chunk of a message batching three of them relays the last two
+    dispatcher = get_dispatcher()
+    dispatcher.open("task", "streams", offset=1)
+    name = f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}task"
+
+    dispatcher._dispatch(name, encode_frame(encode_chunks(CHUNKS), True), 2)
+    message = dispatcher._queues["task"].get_nowait()
+    assert message.done
+    assert decode_chunks(message.data) == CHUNKS[1:]
+
+
+def test_dispatch_resumed_past_a_message():
+    dispatcher = get_dispatcher()
+    dispatcher.open("task", "streams", offset=2)
+    name = f"{OSHEPHERD_STREAM_CHANNEL_PREFIX}task"
+
+    dispatcher._dispatch(name, encode_frame(encode_chunks(CHUNKS[:2]), False), 0)
+    assert dispatcher._queues["task"].empty()